@@ -0,0 +1,70 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Кэш в памяти процесса с ограничением по количеству записей (LRU) и времени жизни записи (TTL).
+    Используется только из одного event loop, поэтому не требует блокировок
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Получение значения по ключу
+
+        :param key: ключ
+        :return: значение или None, если записи нет или её время жизни истекло
+        """
+
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохранение значения по ключу
+
+        :param key: ключ
+        :param value: значение
+        """
+
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Удаление записи по ключу
+
+        :param key: ключ
+        """
+
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Удаление всех записей"""
+
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -15,7 +15,70 @@ DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
 DB_NAME = os.getenv('DB_NAME')
 
+# Настройки пула соединений: размер, кэш подготовленных запросов, ограничение времени запроса (в секундах, 0 - нет)
+# и время, через которое неиспользуемое соединение закрывается (в секундах)
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 5))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', 0))
+DB_CONNECTION_LIFETIME = float(os.getenv('DB_CONNECTION_LIFETIME', 300))
+
+# Реплика только для чтения (с теми же пользователем и базой). Если адрес не задан, всё выполняется в основной базе.
+# После изменений клиент читает из основной базы REPLICA_STICKY_SECONDS секунд (больше отставания реплики)
+DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST')
+DB_REPLICA_PORT = os.getenv('DB_REPLICA_PORT', DB_PORT)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
 # Настройки JWT
 SECRET_KEY = os.getenv('SECRET_KEY')
 ALGORITHM = os.getenv('ALGORITHM')
 ACCESS_TOKEN_EXPIRE_MINUTES = 300
+
+# Настройки пагинации
+PAGINATION_DEFAULT_LIMIT = int(os.getenv('PAGINATION_DEFAULT_LIMIT', 50))
+PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 500))
+
+# Настройки кэша пользователей для авторизации
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+
+# Настройки хэширования паролей
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Максимальное количество задач в одном массовом запросе
+TASKS_BULK_MAX_ITEMS = int(os.getenv('TASKS_BULK_MAX_ITEMS', 10000))
+
+# Количество строк, выбираемых из базы за один запрос при выгрузке
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+
+# Задержка (в секундах), после которой изменения попадают в синхронизацию.
+# Должна быть больше времени самой долгой транзакции, иначе её изменения могут быть пропущены
+CHANGES_SYNC_LAG = float(os.getenv('CHANGES_SYNC_LAG', 5))
+
+# Настройки потока событий: размер очереди одного подписчика и интервал отправки пустых сообщений (в секундах)
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 1000))
+EVENTS_HEARTBEAT_INTERVAL = float(os.getenv('EVENTS_HEARTBEAT_INTERVAL', 15))
+
+# Формирование ответов списков и карточек задач и сотрудников напрямую из строк запроса, без объектов моделей
+FAST_READ_PATH = os.getenv('FAST_READ_PATH', 'true').lower() in ('1', 'true', 'yes')
+
+# Подсчёт запросов к базе данных для каждого HTTP-запроса (заголовки X-Query-Count и Server-Timing)
+# и количество повторов одного запроса, после которого пишется предупреждение о N+1 (0 - не проверять)
+QUERY_STATS = os.getenv('QUERY_STATS', 'true').lower() in ('1', 'true', 'yes')
+QUERY_REPEAT_WARNING = int(os.getenv('QUERY_REPEAT_WARNING', 10))
+
+# Метрики в формате Prometheus (/metrics). Чтобы при нескольких процессах uvicorn выводилась сумма по всем процессам,
+# нужно задать общий каталог METRICS_DIR (очищать при перезапуске приложения), куда процессы сохраняют свои метрики
+# каждые METRICS_FLUSH_INTERVAL секунд
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+# Профилирование: промежуток между выборками стека при профилировании отдельного запроса (в секундах).
+# Если задан каталог PROFILE_DIR, стеки собираются постоянно с промежутком PROFILE_SAMPLING_INTERVAL
+# и сохраняются в каталог каждые PROFILE_FLUSH_INTERVAL секунд
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.001))
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')
+PROFILE_SAMPLING_INTERVAL = float(os.getenv('PROFILE_SAMPLING_INTERVAL', 0.01))
+PROFILE_FLUSH_INTERVAL = float(os.getenv('PROFILE_FLUSH_INTERVAL', 60))
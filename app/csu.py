@@ -1,10 +1,14 @@
 import asyncio
+
 import typer
 from tortoise import Tortoise
 
+from app.employees.services import recalculate_task_counters
 from app.main import TORTOISE_ORM
+from app.tasks.services import rebuild_task_paths
 from app.users.auth_utils import hash_password
 from app.users.models import User
+from app.versions import bump_versions
 
 app = typer.Typer()
 
@@ -39,17 +43,51 @@ async def create_superuser(email: str, password: str) -> None:
         typer.echo(f"Пользователь с email {email} уже существует.")
         return
 
-    hashed_password = hash_password(password)
+    hashed_password = await hash_password(password)
     await User.create(email=email, password=hashed_password, is_superuser=True, is_staff=True)
 
     await close()
     typer.echo(f"Суперпользователь с email {email} создан.")
 
 
+async def recount_task_counters() -> None:
+    """
+    Пересчитывает счётчики задач у всех сотрудников.
+    """
+
+    await init()
+    await recalculate_task_counters()
+    await bump_versions('employees')
+    await close()
+    typer.echo("Счётчики задач сотрудников пересчитаны.")
+
+
+async def rebuild_paths_command() -> None:
+    """
+    Пересчитывает пути всех задач в дереве задач.
+    """
+
+    await init()
+    await rebuild_task_paths()
+    await bump_versions('tasks')
+    await close()
+    typer.echo("Пути задач пересчитаны.")
+
+
 @app.command()
 def csu(email: str, password: str) -> None:
     asyncio.run(create_superuser(email, password))
 
 
+@app.command()
+def recount() -> None:
+    asyncio.run(recount_task_counters())
+
+
+@app.command()
+def rebuild_paths() -> None:
+    asyncio.run(rebuild_paths_command())
+
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,182 @@
+import time
+from contextvars import ContextVar
+
+from jose import JWTError, jwt
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import connections
+from tortoise.backends.base.client import BaseDBAsyncClient, BaseTransactionWrapper
+
+from app.cache import LRUCache
+from app.config import DB_COMMAND_TIMEOUT, DB_CONNECTION_LIFETIME, DB_NAME, DB_PASSWORD, DB_POOL_MAX_SIZE, \
+    DB_POOL_MIN_SIZE, DB_STATEMENT_CACHE_SIZE, DB_USERNAME, REPLICA_STICKY_SECONDS, USER_CACHE_SIZE
+
+# Название подключения к реплике только для чтения
+REPLICA_CONNECTION = 'replica'
+
+# Cookie, по которой чтение в течение REPLICA_STICKY_SECONDS после изменений выполняется из основной базы
+PRIMARY_COOKIE = 'db_primary'
+
+# Заголовок ответа на изменение со временем (Unix time), до которого чтение нужно выполнять из основной базы.
+# Клиенты без cookie могут передавать полученное значение в том же заголовке запроса
+PRIMARY_HEADER = 'x-db-primary-until'
+
+# Методы запросов, которые не изменяют данные
+SAFE_METHODS = frozenset(('GET', 'HEAD'))
+
+# Запросы, которые не изменяют данные приложения, хотя выполняются не методом GET
+UNPINNED_PATHS = frozenset(('/users/token/',))
+
+# Пользователи (email из токена), которые недавно изменяли данные.
+# Отметка хранится в памяти процесса, в остальных процессах действуют cookie и заголовок PRIMARY_HEADER
+_pinned_users = LRUCache(maxsize=USER_CACHE_SIZE, ttl=REPLICA_STICKY_SECONDS)
+
+
+def postgres_connection(host: str | None, port: str | None) -> dict:
+    """
+    Настройки подключения к PostgreSQL с параметрами пула соединений
+
+    :param host: адрес сервера
+    :param port: порт сервера
+    :return: настройки подключения для TORTOISE_ORM
+    """
+
+    credentials = {
+        'host': host,
+        'port': port,
+        'user': DB_USERNAME,
+        'password': DB_PASSWORD,
+        'database': DB_NAME,
+        'minsize': DB_POOL_MIN_SIZE,
+        'maxsize': DB_POOL_MAX_SIZE,
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        'max_inactive_connection_lifetime': DB_CONNECTION_LIFETIME,
+    }
+    if DB_COMMAND_TIMEOUT:
+        credentials['command_timeout'] = DB_COMMAND_TIMEOUT
+    return {'engine': 'tortoise.backends.asyncpg', 'credentials': credentials}
+
+
+class ReadSession:
+    """
+    Признак того, что запросы на чтение текущего HTTP-запроса можно выполнять на реплике
+    """
+
+    __slots__ = ('use_replica',)
+
+    def __init__(self, use_replica: bool) -> None:
+        self.use_replica = use_replica
+
+
+_read_session: ContextVar[ReadSession | None] = ContextVar('read_session', default=None)
+
+
+def use_replica() -> bool:
+    """
+    Можно ли выполнить чтение на реплике: запрос не изменяет данные, клиент недавно ничего не изменял,
+    в этом запросе ещё не было изменений и чтение выполняется не внутри транзакции
+
+    :return: признак чтения с реплики
+    """
+
+    session = _read_session.get()
+    return (session is not None and session.use_replica
+            and not isinstance(connections.get('default'), BaseTransactionWrapper))
+
+
+def read_from_primary() -> None:
+    """
+    Выполнение остальных запросов на чтение текущего HTTP-запроса в основной базе
+    (для запросов, которым нельзя видеть отставание реплики)
+    """
+
+    session = _read_session.get()
+    if session is not None:
+        session.use_replica = False
+
+
+def read_connection() -> BaseDBAsyncClient:
+    """
+    Подключение для запросов на чтение, выполняемых в обход моделей
+
+    :return: подключение к реплике или к основной базе
+    """
+
+    return connections.get(REPLICA_CONNECTION if use_replica() else 'default')
+
+
+class ReplicaRouter:
+    """
+    Маршрутизация запросов моделей: чтение - на реплику (если можно), изменения - в основную базу.
+    После первого изменения остальные запросы HTTP-запроса тоже выполняются в основной базе
+    """
+
+    def db_for_read(self, model) -> str | None:
+        return REPLICA_CONNECTION if use_replica() else None
+
+    def db_for_write(self, model) -> None:
+        read_from_primary()
+        return None
+
+
+def _token_subject(scope: Scope) -> str | None:
+    # Подпись токена не проверяется: отметка только направляет чтение в основную базу,
+    # а ставится после успешного изменения, для которого токен уже проверен
+    for name, value in scope['headers']:
+        if name == b'authorization' and value[:7].lower() == b'bearer ':
+            try:
+                return jwt.get_unverified_claims(value[7:].decode()).get('sub')
+            except JWTError:
+                return None
+    return None
+
+
+def _is_pinned(scope: Scope) -> bool:
+    for name, value in scope['headers']:
+        if name == b'cookie' and PRIMARY_COOKIE.encode() + b'=' in value:
+            return True
+        if name == PRIMARY_HEADER.encode():
+            try:
+                if float(value) > time.time():
+                    return True
+            except ValueError:
+                pass
+    subject = _token_subject(scope)
+    return subject is not None and _pinned_users.get(subject) is not None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Определение, можно ли читать с реплики в рамках HTTP-запроса.
+    После успешного запроса, изменяющего данные, клиент в течение REPLICA_STICKY_SECONDS читает из основной базы,
+    чтобы видеть свои изменения до их репликации. Клиент узнаётся по cookie, по заголовку PRIMARY_HEADER,
+    который он вернул из ответа, или по пользователю из токена (в пределах процесса)
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] in UNPINNED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if scope['method'] in SAFE_METHODS:
+            token = _read_session.set(ReadSession(use_replica=not _is_pinned(scope)))
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _read_session.reset(token)
+            return
+
+        async def send_with_pin(message: Message) -> None:
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                cookie = f'{PRIMARY_COOKIE}=1; Max-Age={REPLICA_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax'
+                until = f'{time.time() + REPLICA_STICKY_SECONDS:.0f}'
+                message['headers'] = [*message.get('headers', ()), (b'set-cookie', cookie.encode()),
+                                      (PRIMARY_HEADER.encode(), until.encode())]
+                subject = _token_subject(scope)
+                if subject is not None:
+                    _pinned_users.set(subject, True)
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
@@ -23,7 +23,14 @@ class Employee(Model):
     phone = fields.CharField(max_length=70, validators=[only_digits_validator], null=True)
     address = fields.CharField(max_length=255, null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
     position = fields.CharField(max_length=150, null=True)
+    active_task_count = fields.IntField(default=0)
+    total_task_count = fields.IntField(default=0, index=True)
 
     class Meta:
         table = "employees"
+        indexes = (
+            ("active_task_count", "id"),
+            ("updated_at", "id"),
+        )
@@ -1,60 +1,151 @@
-from typing import List
+from typing import Literal
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from starlette.responses import JSONResponse
-from tortoise.query_utils import Prefetch
+from tortoise.transactions import in_transaction
 
+from app.config import FAST_READ_PATH, PAGINATION_DEFAULT_LIMIT, PAGINATION_MAX_LIMIT
 from app.employees import services
 from app.employees.models import Employee
 from app.employees.schemas import PydenticEmployeeOut, PydenticEmployeeCreate, PydenticEmployeePut, \
-    PydenticEmployeeOutWithTask
+    PydenticEmployeeOutWithTask, build_full_name
+from app.events import employee_event, publish
+from app.export import ExportFormat, export_response
+from app.pagination import PydanticPage, paginate, paginate_ranked
+from app.sync import PydanticChanges, get_changes, record_deletions
 from app.tasks.models import Task
 from app.tasks.schemas import PydanticTaskOutForEmployee
+from app.tasks.services import get_task_events
+from app.updates import update_returning
 from app.users.auth_utils import get_current_user, check_superuser_or_staff
-from app.users.models import User
+from app.users.schemas import PydenticUserPrincipal
+from app.versions import bump_versions, conditional_get
 
 employees_router = APIRouter()
 
 
-@employees_router.get('/sorted_by_tasks/')
-async def get_employees_sorted(current_user: User = Depends(get_current_user)) -> List:  # noqa: F841
+@employees_router.get('/sorted_by_tasks/', response_model=PydanticPage[PydenticEmployeeOutWithTask])
+async def get_employees_sorted(limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                               cursor: str | None = None,
+                               tasks_limit: int = Query(10, ge=0, le=100),
+                               current_user: PydenticUserPrincipal = Depends(get_current_user)) -> dict:  # noqa: F841
     """
-    Вывод списка сотрудников и их задач, отсортированный по количеству активных задач
+    Вывод постраничного списка сотрудников, имеющих активные задачи,
+    отсортированного по количеству активных задач (от меньшего к большему).
+    Для каждого сотрудника выводятся его активные задачи с ближайшим сроком
 
+    :param limit: количество сотрудников на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param tasks_limit: максимальное количество задач у одного сотрудника
     :param current_user: текущий пользователь
-    :return: список сотрудников
+    :return: страница сотрудников и курсор следующей страницы
     """
 
-    employees = await Employee.filter(taskss__status__not='completed').distinct().prefetch_related(
-        Prefetch('taskss', queryset=Task.all()))
-
-    employees_sorted = sorted(employees, key=lambda e: len(e.taskss))
+    employees, next_cursor = await paginate(Employee.filter(active_task_count__gt=0), limit, cursor,
+                                            'active_task_count')
+    tasks_by_employee = await services.get_active_tasks_by_employee([employee.id for employee in employees],
+                                                                    tasks_limit)
 
     employees_with_tasks = []
-
-    for employee in employees_sorted:
+    for employee in employees:
         employee_new = PydenticEmployeeOutWithTask.model_validate(employee)
-        employee_new.tasks = [PydanticTaskOutForEmployee.model_validate(task) for task in employee.taskss]
+        employee_new.tasks = [PydanticTaskOutForEmployee.model_validate(task)
+                              for task in tasks_by_employee[employee.id]]
         employees_with_tasks.append(employee_new)
 
-    return employees_with_tasks
+    return {'items': employees_with_tasks, 'next_cursor': next_cursor}
+
+
+@employees_router.get('/', response_model=PydanticPage[PydenticEmployeeOut])
+async def get_employees(limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                        cursor: str | None = None,
+                        order_by: Literal['id', 'created_at'] = 'id',
+                        current_user: PydenticUserPrincipal = Depends(get_current_user),  # noqa: F841
+                        etag: str = Depends(conditional_get('employees'))) -> dict | JSONResponse:
+    """
+    Вывод постраничного списка сотрудников
+
+    :param limit: количество сотрудников на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param order_by: поле сортировки
+    :param current_user: текущий пользователь
+    :param etag: ETag ответа (при совпадении с If-None-Match возвращается 304)
+    :return: страница сотрудников и курсор следующей страницы
+    """
+
+    if FAST_READ_PATH:
+        rows, next_cursor = await paginate(Employee.all(), limit, cursor, order_by, values=services.EMPLOYEE_ROW_FIELDS)
+        return JSONResponse({'items': [services.employee_row_to_json(row) for row in rows],
+                             'next_cursor': next_cursor}, headers={'ETag': etag})
 
+    employees, next_cursor = await paginate(Employee.all(), limit, cursor, order_by)
+    return {'items': employees, 'next_cursor': next_cursor}
 
-@employees_router.get('/', response_model=List[PydenticEmployeeOut])
-async def get_employees(current_user: User = Depends(get_current_user)) -> List[Employee]:  # noqa: F841
+
+@employees_router.get('/search/', response_model=PydanticPage[PydenticEmployeeOut])
+async def search_employees(q: str = Query(min_length=1, max_length=200),
+                           limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                           cursor: str | None = None,
+                           current_user: PydenticUserPrincipal = Depends(get_current_user)) -> dict:  # noqa: F841
     """
-    Вывод списка сотрудников
+    Поиск сотрудников по части ФИО, email или должности.
+    Сотрудники упорядочены по релевантности
 
+    :param q: поисковый запрос
+    :param limit: количество сотрудников на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
     :param current_user: текущий пользователь
-    :return: список сотрудников
+    :return: страница найденных сотрудников и курсор следующей страницы
     """
 
-    employees = await Employee.all()
-    return employees
+    employees, next_cursor = await paginate_ranked(
+        lambda count, offset: services.search_employees(q, count, offset), limit, cursor)
+    return {'items': employees, 'next_cursor': next_cursor}
+
+
+@employees_router.get('/changes/', response_model=PydanticChanges[PydenticEmployeeOut])
+async def get_employee_changes(since: str | None = None,
+                               limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                               current_user: PydenticUserPrincipal = Depends(get_current_user)) -> dict:  # noqa: F841
+    """
+    Возвращает сотрудников, изменённых с момента предыдущей синхронизации, и идентификаторы удалённых сотрудников.
+    Без токена возвращаются все сотрудники
+
+    :param since: токен синхронизации из предыдущего ответа
+    :param limit: максимальное количество изменённых и удалённых сотрудников в ответе
+    :param current_user: текущий пользователь
+    :return: изменённые сотрудники, удалённые сотрудники и токен следующей синхронизации
+    """
+
+    return await get_changes(Employee.all(), 'employees', since, limit)
+
+
+@employees_router.get('/export/')
+async def export_employees(export_format: ExportFormat = Query('ndjson', alias='format'),
+                           gzip: bool = False,
+                           current_user: PydenticUserPrincipal = Depends(get_current_user)):  # noqa: F841
+    """
+    Потоковая выгрузка всех сотрудников
+
+    :param export_format: формат выгрузки (ndjson или csv)
+    :param gzip: сжимать выгрузку
+    :param current_user: текущий пользователь
+    :return: файл выгрузки
+    """
+
+    fields = ['id', 'first_name', 'last_name', 'father_name', 'email', 'phone', 'address', 'position',
+              'created_at', 'active_task_count', 'total_task_count']
+    columns = ['id', 'full_name', *fields[1:]]
+
+    def prepare_row(row: dict) -> dict:
+        row['full_name'] = build_full_name(row['first_name'], row['last_name'], row['father_name'])
+        return row
+
+    return export_response(Employee.all(), fields, columns, export_format, 'employees', prepare_row, gzip)
 
 
 @employees_router.get('/{employee_id}/', response_model=PydenticEmployeeOut)
-async def get_employee(employee_id: int, current_user: User = Depends(get_current_user)) -> Employee:  # noqa: F841
+async def get_employee(employee_id: int, current_user: PydenticUserPrincipal = Depends(get_current_user)) -> Employee:  # noqa: F841
     """
     Вывод информации о сотруднике по идентификатору
 
@@ -69,7 +160,7 @@ async def get_employee(employee_id: int, current_user: User = Depends(get_curren
 
 @employees_router.post('/', response_model=PydenticEmployeeOut)
 async def create_employee(employee: PydenticEmployeeCreate,
-                          current_user: User = Depends(check_superuser_or_staff)) -> Employee:  # noqa: F841
+                          current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> Employee:  # noqa: F841
     """
     Создание нового сотрудника
 
@@ -79,12 +170,14 @@ async def create_employee(employee: PydenticEmployeeCreate,
     """
 
     employee_obj = await Employee.create(**employee.model_dump(exclude_unset=True))
+    await bump_versions('employees')
+    await publish([employee_event('created', employee_obj.id)])
     return employee_obj
 
 
 @employees_router.put('/{employee_id}/', response_model=PydenticEmployeeOut)
 async def update_employee(employee_id: int, employee: PydenticEmployeePut,
-                          current_user: User = Depends(check_superuser_or_staff)) -> Employee:  # noqa: F841
+                          current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> Employee:  # noqa: F841
     """
     Обновление информации о сотруднике
 
@@ -94,17 +187,24 @@ async def update_employee(employee_id: int, employee: PydenticEmployeePut,
     :return: обновленный сотрудник
     """
 
-    employee_obj = await services.get_employee_or_404(employee_id)
-    employee_update_data = employee.model_dump(exclude_unset=True)
-    for key, value in employee_update_data.items():
-        setattr(employee_obj, key, value)
-    await employee_obj.save()
+    # Записываются только переданные поля, объект возвращается тем же запросом
+    employee_data = employee.model_dump(exclude_unset=True)
+    async with in_transaction() as connection:
+        employee_obj = await update_returning(Employee, employee_id, employee_data, connection)
+        if employee_obj is None:
+            raise HTTPException(status_code=404, detail=f'Сотрудник {employee_id} не найден')
+        # Сотрудник выводится в задачах, поэтому они тоже считаются изменёнными
+        tasks_changed = not services.EMPLOYEE_FOR_TASK_FIELDS.isdisjoint(employee_data)
+        if tasks_changed:
+            await services.touch_employee_tasks(employee_id, connection)
+    await bump_versions(*(('employees', 'tasks') if tasks_changed else ('employees',)))
+    await publish([employee_event('updated', employee_obj.id)])
     return employee_obj
 
 
 @employees_router.delete('/{employee_id}/')
 async def delete_employee(employee_id: int,
-                          current_user: User = Depends(check_superuser_or_staff)) -> JSONResponse:  # noqa: F841
+                          current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> JSONResponse:  # noqa: F841
     """
     Удаление сотрудника по идентификатору
 
@@ -114,7 +214,18 @@ async def delete_employee(employee_id: int,
     """
 
     employee_obj = await services.get_employee_or_404(employee_id)
-    await employee_obj.delete()
+    async with in_transaction() as connection:
+        # Задачи удалённого сотрудника остаются без исполнителя, они и их подзадачи считаются изменёнными
+        await services.touch_employee_tasks(employee_id, connection)
+        previous = {task['id']: {'performer_id': employee_id, 'path': task['path']}
+                    for task in await Task.filter(performer_id=employee_id).using_db(connection).values('id', 'path')}
+        if previous:
+            await Task.filter(id__in=list(previous)).using_db(connection).update(performer_id=None)
+        await employee_obj.delete(using_db=connection)
+        await record_deletions('employees', [employee_id], connection)
+    await bump_versions('employees', 'tasks')
+    await publish([employee_event('deleted', employee_id),
+                   *await get_task_events('updated', list(previous), previous)])
     content = {'message': f'Сотрудник {employee_id} удалён'}
 
     return JSONResponse(content=content, status_code=200)
@@ -4,6 +4,24 @@ from pydantic import BaseModel, EmailStr, model_validator
 from app.employees.models import only_digits_validator
 
 
+def build_full_name(first_name: str | None, last_name: str | None, father_name: str | None) -> str | None:
+    """
+    Получение полного имени сотрудника (фамилия, имя, отчество)
+
+    :param first_name: имя
+    :param last_name: фамилия
+    :param father_name: отчество
+    :return: полное имя или None, если не указаны имя или фамилия
+    """
+
+    if not (first_name and last_name):
+        return None
+    parts = [last_name, first_name]
+    if father_name:
+        parts.append(father_name)
+    return ' '.join(parts)
+
+
 class MixinFullNameEmployeeOut(BaseModel):
     """
     Миксин для получения полного имени сотрудника
@@ -12,14 +30,9 @@ class MixinFullNameEmployeeOut(BaseModel):
     @model_validator(mode='before')
     def calculate_full_name(self):
         try:
-            first_name = self.first_name
-            last_name = self.last_name
-            father_name = self.father_name
-            if first_name and last_name:
-                parts = [last_name, first_name]
-                if father_name:
-                    parts.append(father_name)
-                self.full_name = ' '.join(parts)
+            full_name = build_full_name(self.first_name, self.last_name, self.father_name)
+            if full_name:
+                self.full_name = full_name
             return self
         except AttributeError:
             return self
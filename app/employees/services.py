@@ -1,6 +1,22 @@
+import re
+
 from fastapi import HTTPException
+from tortoise import connections, timezone
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import Q, Subquery
 
+from app.database import read_connection
 from app.employees.models import Employee
+from app.employees.schemas import build_full_name
+from app.rows import json_datetime
+from app.tasks.models import ACTIVE_TASK_STATUSES, Task, TaskStatus
+
+# Текст для поиска сотрудника. Выражение должно совпадать с выражением GIN индекса idx_employees_search
+EMPLOYEE_SEARCH_TEXT = ("""("first_name" || ' ' || "last_name" || ' ' || coalesce("father_name", '') """
+                        """|| ' ' || "email" || ' ' || coalesce("position", ''))""")
+
+# Поля сотрудника, которые выводятся в задачах (EmployeeForTask)
+EMPLOYEE_FOR_TASK_FIELDS = frozenset(('first_name', 'last_name', 'father_name', 'position'))
 
 
 async def get_employee_or_404(employee_id: int) -> Employee:
@@ -14,4 +30,182 @@ async def get_employee_or_404(employee_id: int) -> Employee:
     employee_obj = await Employee.get_or_none(id=employee_id)
     if employee_obj is None:
         raise HTTPException(status_code=404, detail=f'Сотрудник {employee_id} не найден')
-    return employee_obj
\ No newline at end of file
+    return employee_obj
+
+
+# Поля сотрудника, из которых формируется ответ без создания объектов модели
+EMPLOYEE_ROW_FIELDS = ('id', 'first_name', 'last_name', 'father_name', 'email', 'phone', 'address', 'position',
+                       'created_at')
+
+
+def employee_row_to_json(row: dict) -> dict:
+    """
+    Формирование сотрудника для ответа из строки запроса.
+    Результат совпадает с выводом схемы PydenticEmployeeOut
+
+    :param row: строка с полями EMPLOYEE_ROW_FIELDS
+    :return: сотрудник для JSON ответа
+    """
+
+    return {
+        'id': row['id'],
+        'full_name': build_full_name(row['first_name'], row['last_name'], row['father_name']),
+        'email': row['email'],
+        'phone': row['phone'],
+        'address': row['address'],
+        'position': row['position'],
+        'created_at': json_datetime(row['created_at']),
+    }
+
+
+def employee_for_task_row_to_json(row: dict, prefix: str) -> dict | None:
+    """
+    Формирование связанного с задачей сотрудника для ответа из строки запроса.
+    Результат совпадает с выводом схемы EmployeeForTask
+
+    :param row: строка запроса задач с полями сотрудника, например performer__id, performer__first_name
+    :param prefix: префикс полей сотрудника в строке, например performer__
+    :return: сотрудник для JSON ответа или None, если связи нет
+    """
+
+    if row[f'{prefix}id'] is None:
+        return None
+    return {
+        'id': row[f'{prefix}id'],
+        'full_name': build_full_name(row[f'{prefix}first_name'], row[f'{prefix}last_name'],
+                                     row[f'{prefix}father_name']),
+        'position': row[f'{prefix}position'],
+    }
+
+
+async def touch_employee_tasks(employee_id: int, connection: BaseDBAsyncClient) -> None:
+    """
+    Отметка времени изменения у задач, в которых выводится сотрудник: задач, которые он выполняет,
+    и их подзадач (исполнитель родительской задачи), чтобы они попали в синхронизацию изменений
+
+    :param employee_id: идентификатор сотрудника
+    :param connection: соединение текущей транзакции
+    """
+
+    performed = Task.filter(performer_id=employee_id).using_db(connection).values('id')
+    await Task.filter(Q(performer_id=employee_id) | Q(parent_task_id__in=Subquery(performed))).using_db(
+        connection).update(updated_at=timezone.now())
+
+
+async def recalculate_task_counters() -> None:
+    """
+    Пересчёт счётчиков задач у всех сотрудников по фактическим данным таблицы задач
+    """
+
+    await connections.get('default').execute_query(f"""
+        UPDATE "employees" SET
+            "active_task_count" = (SELECT COUNT(*) FROM "tasks"
+                                   WHERE "tasks"."performer_id" = "employees"."id"
+                                   AND "tasks"."status" <> {TaskStatus.COMPLETED.value}),
+            "total_task_count" = (SELECT COUNT(*) FROM "tasks"
+                                  WHERE "tasks"."performer_id" = "employees"."id")
+    """)
+
+
+def active_tasks_sql(employee_ids: list[int], limit: int) -> str:
+    """
+    Запрос первых по сроку незавершённых задач для каждого из сотрудников.
+    Нумерация задач внутри каждого сотрудника выполняется оконной функцией
+
+    :param employee_ids: идентификаторы сотрудников
+    :param limit: максимальное количество задач у одного сотрудника
+    :return: текст запроса
+    """
+
+    ids = ', '.join(str(int(employee_id)) for employee_id in employee_ids)
+    statuses = ', '.join(str(status.value) for status in ACTIVE_TASK_STATUSES)
+    return f"""
+        SELECT "id", "name", "description", "deadline", "status", "performer_id" FROM (
+            SELECT "id", "name", "description", "deadline", "status", "performer_id",
+                   ROW_NUMBER() OVER (PARTITION BY "performer_id"
+                                      ORDER BY "deadline" IS NULL, "deadline", "id") AS "position"
+            FROM "tasks"
+            WHERE "performer_id" IN ({ids}) AND "status" IN ({statuses})
+        ) AS "ranked"
+        WHERE "position" <= {int(limit)}
+        ORDER BY "performer_id", "position"
+    """
+
+
+async def get_active_tasks_by_employee(employee_ids: list[int], limit: int) -> dict[int, list[dict]]:
+    """
+    Получение первых по сроку незавершённых задач для каждого из сотрудников одним запросом
+
+    :param employee_ids: идентификаторы сотрудников
+    :param limit: максимальное количество задач у одного сотрудника
+    :return: списки задач по идентификаторам сотрудников
+    """
+
+    tasks_by_employee = {employee_id: [] for employee_id in employee_ids}
+    if not employee_ids or not limit:
+        return tasks_by_employee
+
+    rows = await read_connection().execute_query_dict(active_tasks_sql(employee_ids, limit))
+    for row in rows:
+        row['status'] = TaskStatus(row['status'])
+        tasks_by_employee[row['performer_id']].append(row)
+    return tasks_by_employee
+
+
+def _word_similarity(needle: str, text: str) -> float:
+    """
+    Приближение word_similarity для поиска в памяти: отношение длины запроса к длине наименьшего
+    фрагмента текста из целых слов, содержащего запрос (запрос может занимать несколько слов)
+
+    :param needle: запрос в нижнем регистре
+    :param text: текст в нижнем регистре
+    :return: сходство от 0 (запрос не найден) до 1
+    """
+
+    similarity = 0.0
+    position = text.find(needle)
+    while position != -1:
+        start = text.rfind(' ', 0, position) + 1
+        end = text.find(' ', position + len(needle))
+        span = (end if end != -1 else len(text)) - start
+        similarity = max(similarity, len(needle) / span)
+        position = text.find(needle, position + 1)
+    return similarity
+
+
+async def search_employees(query: str, limit: int, offset: int = 0) -> list[Employee]:
+    """
+    Поиск сотрудников по части ФИО, email или должности, результаты упорядочены по релевантности.
+    В PostgreSQL подстрока ищется по триграммному GIN индексу (pg_trgm) по выражению EMPLOYEE_SEARCH_TEXT,
+    релевантность - сходство запроса с ближайшим словом (word_similarity).
+    В остальных СУБД (SQLite в тестах) поиск выполняется в памяти
+
+    :param query: поисковый запрос
+    :param limit: количество сотрудников
+    :param offset: количество пропускаемых сотрудников
+    :return: список найденных сотрудников
+    """
+
+    connection = read_connection()
+    if connection.capabilities.dialect == 'postgres':
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', query) + '%'
+        rows = await connection.execute_query_dict(f"""
+            SELECT "id" FROM "employees"
+            WHERE {EMPLOYEE_SEARCH_TEXT} ILIKE $2
+            ORDER BY word_similarity($1, {EMPLOYEE_SEARCH_TEXT}) DESC, "id"
+            LIMIT $3 OFFSET $4
+        """, [query, pattern, limit, offset])
+        ids = [row['id'] for row in rows]
+    else:
+        needle = query.lower()
+        ranked = []
+        for row in await Employee.all().values('id', 'first_name', 'last_name', 'father_name', 'email', 'position'):
+            text = ' '.join(row[field] or '' for field in ('first_name', 'last_name', 'father_name',
+                                                           'email', 'position')).lower()
+            similarity = _word_similarity(needle, text)
+            if similarity:
+                ranked.append((-similarity, row['id']))
+        ids = [employee_id for _, employee_id in sorted(ranked)[offset:offset + limit]]
+
+    employees = {employee.id: employee for employee in await Employee.filter(id__in=ids)}
+    return [employees[employee_id] for employee_id in ids if employee_id in employees]
@@ -0,0 +1,365 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable
+
+import asyncpg
+from fastapi import WebSocket, WebSocketDisconnect
+from tortoise import connections
+
+from app.config import EVENTS_HEARTBEAT_INTERVAL, EVENTS_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Канал PostgreSQL для рассылки событий между процессами приложения
+EVENTS_CHANNEL = 'app_events'
+# Максимальный размер сообщения NOTIFY - 8000 байт, события отправляются пачками меньшего размера
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+
+class Subscription:
+    """
+    Подписка на события с собственной ограниченной очередью и фильтром.
+    Если подписчик не успевает забирать события и очередь переполняется, подписка закрывается
+    """
+
+    def __init__(self, performer: int | None = None, subtree: int | None = None) -> None:
+        self.performer = performer
+        self.subtree = subtree
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        """
+        Проверка события на соответствие фильтру подписки.
+        Событие изменения подходит и по прежнему исполнителю или положению задачи в дереве
+
+        :param event: событие
+        :return: True, если событие нужно отправить подписчику
+        """
+
+        if self.performer is not None:
+            performers = {event.get('performer_id'), event.get('previous_performer_id')}
+            if event['type'].startswith('employee.'):
+                performers = {event['id']}
+            if self.performer not in performers:
+                return False
+        if self.subtree is not None:
+            if not event['type'].startswith('task.'):
+                return False
+            paths = [event.get('path'), event.get('previous_path')]
+            if event['id'] != self.subtree and not any(path and f'/{self.subtree}/' in path for path in paths):
+                return False
+        return True
+
+
+class EventHub:
+    """
+    Рассылка событий подписчикам внутри процесса.
+    Служебные события (например, сброс кэшей во всех процессах) передаются своим обработчикам
+    и подписчикам не рассылаются.
+    Используется только из одного event loop, поэтому не требует блокировок
+    """
+
+    def __init__(self) -> None:
+        self.subscriptions: set[Subscription] = set()
+        self.handlers: dict[str, Callable[[dict], None]] = {}
+        self.dropped = 0
+
+    def subscribe(self, performer: int | None = None, subtree: int | None = None) -> Subscription:
+        """
+        Создание подписки на события
+
+        :param performer: только события задач сотрудника
+        :param subtree: только события задачи и её подзадач
+        :return: подписка
+        """
+
+        subscription = Subscription(performer=performer, subtree=subtree)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Удаление подписки
+
+        :param subscription: подписка
+        """
+
+        self.subscriptions.discard(subscription)
+
+    def add_handler(self, event_type: str, handler: Callable[[dict], None]) -> None:
+        """
+        Регистрация обработчика служебных событий типа event_type
+
+        :param event_type: тип события
+        :param handler: функция, вызываемая с событием без ожидания
+        """
+
+        self.handlers[event_type] = handler
+
+    def dispatch(self, events: list[dict]) -> None:
+        """
+        Раздача событий в очереди подходящих подписчиков без ожидания.
+        Переполненная очередь очищается, подписчик получает признак переполнения и отключается
+
+        :param events: события
+        """
+
+        for event in events:
+            if event['type'] in self.handlers:
+                self.handlers[event['type']](event)
+        events = [event for event in events if event['type'] not in self.handlers]
+
+        for subscription in list(self.subscriptions):
+            for event in events:
+                if not subscription.matches(event):
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    self.unsubscribe(subscription)
+                    self.dropped += 1
+                    subscription.overflowed = True
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(None)
+                    break
+
+
+hub = EventHub()
+
+
+def _chunk_payloads(events: list[dict]) -> list[str]:
+    """
+    Разбиение событий на сообщения NOTIFY допустимого размера
+
+    :param events: события
+    :return: список JSON сообщений
+    """
+
+    payloads, chunk, size = [], [], 2
+    for event in events:
+        encoded = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+        if chunk and size + len(encoded.encode()) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            payloads.append('[' + ','.join(chunk) + ']')
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += len(encoded.encode()) + 1
+    if chunk:
+        payloads.append('[' + ','.join(chunk) + ']')
+    return payloads
+
+
+async def publish(events: list[dict]) -> None:
+    """
+    Публикация событий после фиксации транзакции.
+    В PostgreSQL события рассылаются через NOTIFY и доходят до подписчиков и обработчиков служебных событий
+    всех процессов приложения, включая текущий (через его LISTEN соединение).
+    В остальных СУБД события раздаются только внутри процесса
+
+    :param events: события
+    """
+
+    if not events:
+        return
+    connection = connections.get('default')
+    if connection.capabilities.dialect != 'postgres':
+        hub.dispatch(events)
+        return
+    for payload in _chunk_payloads(events):
+        await connection.execute_query('SELECT pg_notify($1, $2)', [EVENTS_CHANNEL, payload])
+
+
+def task_event(event_type: str, task: dict, previous: dict | None = None) -> dict:
+    """
+    Формирование события задачи
+
+    :param event_type: тип события (created, updated, deleted)
+    :param task: данные задачи (id, name, status, deadline, performer_id, parent_task_id, path)
+    :param previous: исполнитель и путь задачи до изменения
+    :return: событие
+    """
+
+    event = {'type': f'task.{event_type}'}
+    for key in ('id', 'name', 'status', 'deadline', 'performer_id', 'parent_task_id', 'path'):
+        if key in task:
+            value = task[key]
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif key == 'status':
+                value = value.label
+            event[key] = value
+    if previous is not None:
+        event['previous_performer_id'] = previous.get('performer_id')
+        event['previous_path'] = previous.get('path')
+    return event
+
+
+def task_event_from_object(event_type: str, task_obj, previous: dict | None = None) -> dict:
+    """
+    Формирование события задачи по объекту модели
+
+    :param event_type: тип события (created, updated, deleted)
+    :param task_obj: задача
+    :param previous: исполнитель и путь задачи до изменения
+    :return: событие
+    """
+
+    return task_event(event_type, {
+        'id': task_obj.id,
+        'name': task_obj.name,
+        'status': task_obj.status,
+        'deadline': task_obj.deadline,
+        'performer_id': task_obj.performer_id,
+        'parent_task_id': task_obj.parent_task_id,
+        'path': task_obj.path,
+    }, previous)
+
+
+def employee_event(event_type: str, employee_id: int) -> dict:
+    """
+    Формирование события сотрудника
+
+    :param event_type: тип события (created, updated, deleted)
+    :param employee_id: идентификатор сотрудника
+    :return: событие
+    """
+
+    return {'type': f'employee.{event_type}', 'id': employee_id}
+
+
+async def sse_stream(subscription: Subscription) -> AsyncIterator[bytes]:
+    """
+    Поток событий подписки в формате Server-Sent Events.
+    При отсутствии событий отправляются комментарии, чтобы соединение не закрывалось прокси
+    и отключение клиента обнаруживалось без ожидания следующего события
+
+    :param subscription: подписка
+    :return: асинхронный итератор по частям ответа
+    """
+
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b': ping\n\n'
+                continue
+            if event is None:
+                yield b'event: overflow\ndata: {}\n\n'
+                return
+            data = json.dumps(event, ensure_ascii=False, separators=(',', ':'))
+            yield f"event: {event['type']}\ndata: {data}\n\n".encode()
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    """
+    Ожидание отключения клиента WebSocket. Сообщения клиента игнорируются
+
+    :param websocket: соединение WebSocket
+    """
+
+    while (await websocket.receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+async def websocket_stream(websocket: WebSocket, subscription: Subscription) -> None:
+    """
+    Отправка событий подписки через WebSocket до отключения клиента или переполнения очереди
+
+    :param websocket: соединение WebSocket
+    :param subscription: подписка
+    """
+
+    disconnected = asyncio.ensure_future(_wait_disconnect(websocket))
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=EVENTS_HEARTBEAT_INTERVAL,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                getter.cancel()
+                return
+            if getter not in done:
+                getter.cancel()
+                await websocket.send_json({'type': 'ping'})
+                continue
+            event = getter.result()
+            if event is None:
+                await websocket.send_json({'type': 'overflow'})
+                await websocket.close(code=1013)
+                return
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        hub.unsubscribe(subscription)
+
+
+class EventListener:
+    """
+    Отдельное соединение PostgreSQL, принимающее события канала EVENTS_CHANNEL
+    и раздающее их подписчикам процесса. При обрыве соединение восстанавливается
+    """
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            events = json.loads(payload)
+        except ValueError:
+            logger.warning('Некорректное сообщение в канале %s', channel)
+            return
+        hub.dispatch(events)
+
+    async def _listen(self) -> None:
+        client = connections.get('default')
+        while True:
+            terminated = asyncio.get_running_loop().create_future()
+            try:
+                connection = await asyncpg.connect(user=client.user, password=client.password, host=client.host,
+                                                   port=client.port, database=client.database)
+                connection.add_termination_listener(
+                    lambda _: terminated.done() or terminated.set_result(None))
+                await connection.add_listener(EVENTS_CHANNEL, self._on_notification)
+            except (OSError, asyncpg.PostgresError):
+                logger.exception('Не удалось подключиться к каналу событий')
+                await asyncio.sleep(1)
+                continue
+            try:
+                await terminated
+            finally:
+                if not connection.is_closed():
+                    await connection.close()
+            logger.warning('Соединение канала событий закрыто, переподключение')
+            await asyncio.sleep(1)
+
+    def start(self) -> None:
+        """
+        Запуск приёма событий, если приложение работает с PostgreSQL
+        """
+
+        if connections.get('default').capabilities.dialect == 'postgres' and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """
+        Остановка приёма событий
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+listener = EventListener()
@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, Literal
+
+from starlette.responses import StreamingResponse
+from tortoise.queryset import QuerySet
+
+from app.config import EXPORT_CHUNK_SIZE
+
+ExportFormat = Literal['ndjson', 'csv']
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+async def iterate_rows(queryset: QuerySet, fields: Iterable[str],
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[list[dict]]:
+    """
+    Постраничная выборка строк по возрастанию id.
+    В памяти одновременно находится не больше chunk_size строк
+
+    :param queryset: исходный запрос
+    :param fields: выбираемые поля (id выбирается всегда)
+    :param chunk_size: количество строк в одной выборке
+    :return: асинхронный итератор по спискам строк
+    """
+
+    fields = ['id', *(field for field in fields if field != 'id')]
+    last_id = None
+    while True:
+        chunk_queryset = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = await chunk_queryset.order_by('id').limit(chunk_size).values(*fields)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def _project(row: dict, columns: list[str]) -> dict:
+    """
+    Отбор колонок выгрузки из строки и приведение значений к виду, пригодному для JSON и CSV
+
+    :param row: строка
+    :param columns: колонки выгрузки
+    :return: строка выгрузки
+    """
+
+    return {column: row[column].isoformat() if isinstance(row.get(column), datetime) else row.get(column)
+            for column in columns}
+
+
+async def _encode(chunks: AsyncIterator[list[dict]], columns: list[str], export_format: ExportFormat,
+                  prepare_row: Callable[[dict], dict]) -> AsyncIterator[bytes]:
+    """
+    Преобразование строк в NDJSON или CSV
+
+    :param chunks: итератор по спискам строк
+    :param columns: колонки выгрузки
+    :param export_format: формат выгрузки
+    :param prepare_row: функция, формирующая строку выгрузки из строки выборки
+    :return: асинхронный итератор по частям файла
+    """
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        writer.writeheader()
+        yield buffer.getvalue().encode()
+        async for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(_project(prepare_row(row), columns) for row in rows)
+            yield buffer.getvalue().encode()
+        return
+
+    async for rows in chunks:
+        lines = (json.dumps(_project(prepare_row(row), columns), ensure_ascii=False) for row in rows)
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+async def _gzip(parts: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Сжатие потока частей в gzip без накопления всего файла в памяти
+
+    :param parts: итератор по частям файла
+    :return: асинхронный итератор по сжатым частям
+    """
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    async for part in parts:
+        compressed = compressor.compress(part) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(queryset: QuerySet, fields: list[str], columns: list[str], export_format: ExportFormat,
+                    filename: str, prepare_row: Callable[[dict], dict], gzip: bool = False) -> StreamingResponse:
+    """
+    Потоковая выгрузка результата запроса в формате NDJSON или CSV
+
+    :param queryset: исходный запрос
+    :param fields: поля, выбираемые из базы
+    :param columns: колонки выгрузки
+    :param export_format: формат выгрузки
+    :param filename: имя файла без расширения
+    :param prepare_row: функция, формирующая строку выгрузки из строки выборки
+    :param gzip: сжимать выгрузку
+    :return: потоковый ответ
+    """
+
+    content = _encode(iterate_rows(queryset, fields), columns, export_format, prepare_row)
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'}
+    if gzip:
+        content = _gzip(content)
+        headers['Content-Encoding'] = 'gzip'
+
+    return StreamingResponse(content, media_type=MEDIA_TYPES[export_format], headers=headers)
@@ -1,18 +1,23 @@
 from fastapi import FastAPI
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 
 from tortoise.contrib.fastapi import register_tortoise
 from tortoise.exceptions import ValidationError as TortoiseValidationError
 
+from app.database import REPLICA_CONNECTION, ReplicaRoutingMiddleware, postgres_connection
 from app.employees.routers import employees_router
+from app.events import listener
+from app.metrics import MetricsMiddleware, collect, snapshot_writer
+from app.profiling import ProfilerMiddleware, continuous_profiler
+from app.queries import QueryStatsMiddleware, instrument_db_clients
 from app.tasks.routers import tasks_router
 from app.users.routers import users_router
-from app.config import DB_USERNAME, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
+from app.config import DB_HOST, DB_PORT, DB_REPLICA_HOST, DB_REPLICA_PORT, METRICS_ENABLED, QUERY_STATS
 
 TORTOISE_ORM = {
     "connections": {
-        "default": f"postgres://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+        "default": postgres_connection(DB_HOST, DB_PORT),
     },
     "apps": {
         "employees": {
@@ -27,13 +32,34 @@ TORTOISE_ORM = {
             "models": ["app.users.models"],
             "default_connection": "default",
         },
+        "versions": {
+            "models": ["app.versions", "app.sync"],
+            "default_connection": "default",
+        },
     },
 }
 
+# Чтение моделей при GET-запросах выполняется на реплике, если она задана
+if DB_REPLICA_HOST:
+    TORTOISE_ORM["connections"][REPLICA_CONNECTION] = postgres_connection(DB_REPLICA_HOST, DB_REPLICA_PORT)
+    TORTOISE_ORM["routers"] = ["app.database.ReplicaRouter"]
+
 app = FastAPI()
 app.include_router(users_router, prefix='/users', tags=['users'])
 app.include_router(employees_router, prefix='/employees', tags=['employees'])
 app.include_router(tasks_router, prefix='/tasks', tags=['tasks'])
+app.add_middleware(ProfilerMiddleware)
+if DB_REPLICA_HOST:
+    app.add_middleware(ReplicaRoutingMiddleware)
+if QUERY_STATS:
+    app.add_middleware(QueryStatsMiddleware)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics() -> PlainTextResponse:
+        """Метрики приложения в текстовом формате Prometheus"""
+        return PlainTextResponse(collect(), media_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.exception_handler(TortoiseValidationError)
@@ -49,4 +75,48 @@ register_tortoise(
     config=TORTOISE_ORM,
     generate_schemas=True,
     add_exception_handlers=True,
-)
\ No newline at end of file
+)
+
+
+@app.on_event('startup')
+async def start_event_listener() -> None:
+    """Запуск приёма событий от других процессов приложения (после подключения к базе данных)"""
+    listener.start()
+
+
+@app.on_event('startup')
+async def start_query_stats() -> None:
+    """Подключение подсчёта запросов к клиентам базы данных, загруженным при подключении"""
+    if QUERY_STATS:
+        instrument_db_clients()
+
+
+@app.on_event('startup')
+async def start_metrics_writer() -> None:
+    """Запуск сохранения метрик процесса для сложения с другими процессами"""
+    if METRICS_ENABLED:
+        snapshot_writer.start()
+
+
+@app.on_event('startup')
+async def start_continuous_profiler() -> None:
+    """Запуск постоянного сбора стеков, если задан каталог PROFILE_DIR"""
+    continuous_profiler.start()
+
+
+@app.on_event('shutdown')
+async def stop_event_listener() -> None:
+    """Остановка приёма событий"""
+    await listener.stop()
+
+
+@app.on_event('shutdown')
+async def stop_metrics_writer() -> None:
+    """Остановка сохранения метрик"""
+    await snapshot_writer.stop()
+
+
+@app.on_event('shutdown')
+async def stop_continuous_profiler() -> None:
+    """Остановка постоянного сбора стеков"""
+    await continuous_profiler.stop()
\ No newline at end of file
@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise import connections
+
+from app.config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+from app.events import hub
+from app.users import auth_utils
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы длительности запросов (в секундах)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Тип и описание метрик в порядке вывода
+METRICS = {
+    'http_requests_total': ('counter', 'Количество HTTP-запросов'),
+    'http_request_duration_seconds': ('histogram', 'Длительность HTTP-запросов'),
+    'http_requests_in_flight': ('gauge', 'HTTP-запросы в обработке'),
+    'db_pool_connections': ('gauge', 'Соединения пула базы данных'),
+    'db_pool_max_connections': ('gauge', 'Наибольший размер пула базы данных'),
+    'user_cache_hits_total': ('counter', 'Попадания в кэш пользователей'),
+    'user_cache_misses_total': ('counter', 'Промахи кэша пользователей'),
+    'user_cache_entries': ('gauge', 'Количество записей в кэше пользователей'),
+    'password_hash_queue_depth': ('gauge', 'Операции хэширования паролей в очереди и в работе'),
+    'events_subscribers': ('gauge', 'Подписчики на события задач'),
+    'events_dropped_total': ('counter', 'Подписки, закрытые из-за переполнения очереди событий'),
+}
+
+# Путь в метриках для запросов, не подошедших ни к одному обработчику
+UNMATCHED_ROUTE = '<unmatched>'
+
+_KINDS = {'counter': 'counters', 'gauge': 'gauges', 'histogram': 'histograms'}
+
+
+def labels(**values) -> str:
+    """
+    Метки ряда метрики в формате Prometheus
+
+    :return: строка вида name="value",...
+    """
+
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in values.items())
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    Гистограмма: количество значений в каждой корзине (без накопления) и их сумма
+    """
+
+    __slots__ = ('buckets', 'sum')
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect_left(DURATION_BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Метрики одного процесса.
+    Изменяются только из event loop процесса, поэтому не требуют блокировок
+    """
+
+    def __init__(self) -> None:
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.durations: dict[tuple[str, str], Histogram] = {}
+        self.in_flight = 0
+
+    def observe_request(self, method: str, route: str, status: int, duration: float) -> None:
+        """
+        Учёт выполненного HTTP-запроса
+
+        :param method: HTTP-метод
+        :param route: шаблон пути обработчика
+        :param status: статус ответа
+        :param duration: длительность в секундах
+        """
+
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.durations.get((method, route))
+        if histogram is None:
+            histogram = self.durations[(method, route)] = Histogram()
+        histogram.observe(duration)
+
+    def snapshot(self) -> dict:
+        """
+        Текущие значения метрик процесса в виде, который можно сохранить в JSON и сложить с другими процессами.
+        Показатели пула, кэша, хэширования паролей и событий считываются в момент вызова
+
+        :return: словарь счётчиков, показателей и гистограмм по названиям метрик и меткам
+        """
+
+        counters = {
+            'http_requests_total': {labels(method=method, route=route, status=status): count
+                                    for (method, route, status), count in self.requests.items()},
+            'user_cache_hits_total': {'': auth_utils.user_cache.hits},
+            'user_cache_misses_total': {'': auth_utils.user_cache.misses},
+            'events_dropped_total': {'': hub.dropped},
+        }
+        gauges = {
+            'http_requests_in_flight': {'': self.in_flight},
+            'user_cache_entries': {'': len(auth_utils.user_cache)},
+            'password_hash_queue_depth': {'': auth_utils.password_queue_depth},
+            'events_subscribers': {'': len(hub.subscriptions)},
+            **db_pool_gauges(),
+        }
+        histograms = {
+            'http_request_duration_seconds': {
+                labels(method=method, route=route): {'buckets': histogram.buckets, 'sum': histogram.sum}
+                for (method, route), histogram in self.durations.items()},
+        }
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+registry = Registry()
+
+
+def db_pool_gauges() -> dict:
+    """
+    Размер и занятость пулов соединений (есть только у подключений PostgreSQL)
+
+    :return: показатели по названиям метрик и меткам
+    """
+
+    used, maximum = {}, {}
+    for name in connections.db_config:
+        pool = getattr(connections.get(name), '_pool', None)
+        if pool is None:
+            continue
+        size, idle = pool.get_size(), pool.get_idle_size()
+        used[labels(connection=name, state='used')] = size - idle
+        used[labels(connection=name, state='idle')] = idle
+        maximum[labels(connection=name)] = pool.get_max_size()
+    return {'db_pool_connections': used, 'db_pool_max_connections': maximum} if used else {}
+
+
+def merge_snapshots(snapshots: list[dict]) -> dict:
+    """
+    Сложение метрик нескольких процессов
+
+    :param snapshots: значения метрик процессов
+    :return: суммарные значения
+    """
+
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    for snapshot in snapshots:
+        for kind in ('counters', 'gauges'):
+            for name, series in snapshot[kind].items():
+                target = merged[kind].setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+        for name, series in snapshot['histograms'].items():
+            target = merged['histograms'].setdefault(name, {})
+            for key, value in series.items():
+                if key in target:
+                    target[key] = {'buckets': [a + b for a, b in zip(target[key]['buckets'], value['buckets'])],
+                                   'sum': target[key]['sum'] + value['sum']}
+                else:
+                    target[key] = value
+    return merged
+
+
+def _series(name: str, key: str) -> str:
+    return f'{name}{{{key}}}' if key else name
+
+
+def render(snapshot: dict) -> str:
+    """
+    Вывод метрик в текстовом формате Prometheus
+
+    :param snapshot: значения метрик
+    :return: текст для ответа /metrics
+    """
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        series = snapshot[_KINDS[kind]].get(name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind != 'histogram':
+            lines.extend(f'{_series(name, key)} {value}' for key, value in series.items())
+            continue
+        for key, value in series.items():
+            total = 0
+            for bound, count in zip((*DURATION_BUCKETS, '+Inf'), value['buckets']):
+                total += count
+                bucket = f'{key},{labels(le=bound)}' if key else labels(le=bound)
+                lines.append(f'{name}_bucket{{{bucket}}} {total}')
+            lines.append(f'{_series(name + "_sum", key)} {value["sum"]}')
+            lines.append(f'{_series(name + "_count", key)} {total}')
+    return '\n'.join(lines) + '\n'
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_snapshot(directory: str) -> None:
+    """
+    Сохранение метрик процесса в файл <pid>.json каталога METRICS_DIR (с атомарной заменой файла)
+
+    :param directory: каталог метрик
+    """
+
+    path = Path(directory) / f'{os.getpid()}.json'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(registry.snapshot()))
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory: str) -> list[dict]:
+    """
+    Метрики других процессов из каталога METRICS_DIR.
+    Счётчики завершившихся процессов учитываются, чтобы суммы не уменьшались, а их текущие показатели - нет
+
+    :param directory: каталог метрик
+    :return: значения метрик процессов
+    """
+
+    snapshots = []
+    for path in Path(directory).glob('*.json'):
+        pid = int(path.stem)
+        if pid == os.getpid():
+            continue
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if not _is_alive(pid):
+            snapshot['gauges'] = {}
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def collect() -> str:
+    """
+    Метрики всех процессов приложения в текстовом формате Prometheus.
+    Без METRICS_DIR выводятся метрики только текущего процесса
+
+    :return: текст для ответа /metrics
+    """
+
+    if not METRICS_DIR:
+        return render(registry.snapshot())
+    write_snapshot(METRICS_DIR)
+    return render(merge_snapshots([registry.snapshot(), *read_snapshots(METRICS_DIR)]))
+
+
+class MetricsMiddleware:
+    """
+    Подсчёт HTTP-запросов, их длительности и запросов в обработке по шаблонам путей обработчиков
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            registry.in_flight -= 1
+            route = scope.get('route')
+            registry.observe_request(scope['method'], route.path if route is not None else UNMATCHED_ROUTE, status,
+                                     time.perf_counter() - started)
+
+
+class SnapshotWriter:
+    """
+    Периодическое сохранение метрик процесса в METRICS_DIR,
+    чтобы /metrics любого процесса выводил сумму по всем процессам
+    """
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def _write(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                write_snapshot(METRICS_DIR)
+            except OSError:
+                logger.exception('Не удалось сохранить метрики в %s', METRICS_DIR)
+
+    def start(self) -> None:
+        """
+        Запуск сохранения метрик, если задан каталог METRICS_DIR
+        """
+
+        if METRICS_DIR and self._task is None:
+            Path(METRICS_DIR).mkdir(parents=True, exist_ok=True)
+            self._task = asyncio.create_task(self._write())
+
+    async def stop(self) -> None:
+        """
+        Остановка сохранения метрик с сохранением последних значений
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            write_snapshot(METRICS_DIR)
+
+
+snapshot_writer = SnapshotWriter()
@@ -0,0 +1,186 @@
+import base64
+import json
+from datetime import datetime
+from typing import Awaitable, Callable, Generic, Iterable, List, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from tortoise import Model
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+T = TypeVar('T')
+
+
+class PydanticPage(BaseModel, Generic[T]):
+    """
+    Модель для вывода одной страницы списка объектов
+    """
+
+    items: List[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(order_by: str, value, last_id: int) -> str:
+    """
+    Кодирование курсора в непрозрачную строку
+
+    :param order_by: поле сортировки
+    :param value: значение поля сортировки у последней записи страницы
+    :param last_id: идентификатор последней записи страницы
+    :return: курсор
+    """
+
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({'o': order_by, 'v': value, 'id': last_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    """
+    Декодирование курсора
+
+    :param cursor: курсор
+    :param order_by: поле сортировки текущего запроса
+    :return: кортеж из значения поля сортировки и идентификатора последней записи
+    """
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = int(data['id'])
+        value = data['v']
+        cursor_order_by = data['o']
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail='Некорректный курсор')
+
+    if cursor_order_by != order_by:
+        raise HTTPException(status_code=400, detail='Курсор получен для другой сортировки')
+
+    # Даты хранятся в курсоре строками, числа - как есть
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail='Некорректный курсор')
+
+    return value, last_id
+
+
+async def _fetch(queryset: QuerySet, values: Iterable[str] | None) -> list:
+    """
+    Выполнение запроса страницы: объекты моделей или строки с указанными полями
+
+    :param queryset: запрос
+    :param values: выбираемые поля или None
+    :return: список объектов или словарей со значениями в том виде, в каком их вернула база
+    """
+
+    if values is None:
+        return list(await queryset)
+    # Строки выбираются без преобразования значений в типы полей: ответ из них формируется напрямую,
+    # а преобразованное значение нужно только для курсора (см. _cut_page)
+    values_query = queryset.values(*values)
+    sql = values_query.sql()
+    return await values_query._db.execute_query_dict(sql)
+
+
+async def paginate(queryset: QuerySet, limit: int, cursor: str | None = None,
+                   order_by: str = 'id', values: Iterable[str] | None = None) -> tuple[list, str | None]:
+    """
+    Постраничная выборка по ключу (keyset pagination).
+    Вместо OFFSET используется условие "после последней записи предыдущей страницы",
+    поэтому время ответа не зависит от номера страницы.
+    Связанные объекты из prefetch_related загружаются только для записей страницы.
+
+    :param queryset: исходный запрос
+    :param limit: количество записей на странице
+    :param cursor: курсор, полученный с предыдущей страницей
+    :param order_by: поле сортировки (дополнительно всегда сортируется по id)
+    :param values: выбираемые поля, если вместо объектов нужны строки (id и поле сортировки выбираются всегда)
+    :return: кортеж из списка объектов страницы и курсора следующей страницы
+    """
+
+    value, last_id = decode_cursor(cursor, order_by) if cursor else (None, None)
+    if values is not None:
+        values = list(dict.fromkeys(('id', order_by, *values)))
+
+    if order_by == 'id':
+        if last_id is not None:
+            queryset = queryset.filter(id__gt=last_id)
+        objects = await _fetch(queryset.order_by('id').limit(limit + 1), values)
+        return _cut_page(objects, limit, order_by, queryset.model)
+
+    nullable = queryset.model._meta.fields_map[order_by].null
+    objects = []
+
+    if not (cursor and value is None):
+        page_queryset = queryset
+        if nullable:
+            page_queryset = page_queryset.filter(**{f'{order_by}__isnull': False})
+        if cursor:
+            page_queryset = page_queryset.filter(
+                Q(**{f'{order_by}__gt': value}) | Q(**{order_by: value, 'id__gt': last_id})
+            )
+        objects = await _fetch(page_queryset.order_by(order_by, 'id').limit(limit + 1), values)
+        last_id = None
+
+    # Записи с пустым значением поля сортировки выдаются после всех остальных,
+    # независимо от того, как СУБД сортирует NULL
+    if nullable and len(objects) <= limit:
+        null_queryset = queryset.filter(**{f'{order_by}__isnull': True})
+        if last_id is not None:
+            null_queryset = null_queryset.filter(id__gt=last_id)
+        objects += await _fetch(null_queryset.order_by('id').limit(limit + 1 - len(objects)), values)
+
+    return _cut_page(objects, limit, order_by, queryset.model)
+
+
+def _cut_page(objects: list, limit: int, order_by: str, model: type[Model]) -> tuple[list, str | None]:
+    """
+    Отделение лишней записи, по которой определяется наличие следующей страницы
+
+    :param objects: записи, выбранные с запасом в одну запись
+    :param limit: количество записей на странице
+    :param order_by: поле сортировки
+    :param model: модель записей
+    :return: кортеж из списка объектов страницы и курсора следующей страницы
+    """
+
+    if len(objects) <= limit:
+        return objects, None
+
+    objects = objects[:limit]
+    last = objects[-1]
+    if isinstance(last, dict):
+        value = model._meta.fields_map[order_by].to_python_value(last[order_by])
+        return objects, encode_cursor(order_by, value, last['id'])
+    return objects, encode_cursor(order_by, getattr(last, order_by), last.id)
+
+
+async def paginate_ranked(search: Callable[[int, int], Awaitable[list]], limit: int,
+                          cursor: str | None = None) -> tuple[list, str | None]:
+    """
+    Постраничная выдача результатов поиска, упорядоченных по релевантности.
+    Релевантность вычисляется для всех совпадений сразу, поэтому курсор хранит
+    количество уже выданных записей
+
+    :param search: функция поиска, принимающая количество записей и смещение
+    :param limit: количество записей на странице
+    :param cursor: курсор, полученный с предыдущей страницей
+    :return: кортеж из списка объектов страницы и курсора следующей страницы
+    """
+
+    offset = 0
+    if cursor:
+        offset, _ = decode_cursor(cursor, 'rank')
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail='Некорректный курсор')
+
+    objects = await search(limit + 1, offset)
+    if len(objects) <= limit:
+        return objects, None
+
+    objects = objects[:limit]
+    return objects, encode_cursor('rank', offset + limit, objects[-1].id)
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import BASE_DIR, PROFILE_DIR, PROFILE_FLUSH_INTERVAL, PROFILE_INTERVAL, PROFILE_SAMPLING_INTERVAL
+from app.users.auth_utils import check_superuser_or_staff, get_current_user
+
+logger = logging.getLogger(__name__)
+
+# Параметр запроса и заголовок, включающие профилирование запроса
+PROFILE_PARAMETER = '__profile'
+PROFILE_HEADER = b'x-profile'
+
+# Форматы профиля: дерево вызовов и свёрнутые стеки для построения flame graph (flamegraph.pl, speedscope)
+PROFILE_FORMATS = {'1': 'tree', 'tree': 'tree', 'folded': 'folded'}
+
+# Доля выборок, меньше которой ветви дерева вызовов не выводятся
+TREE_MIN_SHARE = 0.005
+
+
+@lru_cache(maxsize=4096)
+def _short_filename(filename: str) -> str:
+    for root in (str(BASE_DIR) + os.sep, 'site-packages' + os.sep, 'lib' + os.sep):
+        position = filename.rfind(root)
+        if position != -1:
+            return filename[position + len(root):]
+    return filename
+
+
+# Поток выборок получает GIL не чаще, чем раз в интервал переключения потоков (по умолчанию 5 мс),
+# поэтому на время работы частых выборок интервал уменьшается
+_DEFAULT_SWITCH_INTERVAL = sys.getswitchinterval()
+_active_samplers: set = set()
+
+
+def _update_switch_interval() -> None:
+    sys.setswitchinterval(min([_DEFAULT_SWITCH_INTERVAL, *(sampler.interval for sampler in _active_samplers)]))
+
+
+def _frame_stack(frame) -> tuple[str, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_qualname} ({_short_filename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+class StackSampler:
+    """
+    Сбор стеков вызовов одного потока из отдельного потока через равные промежутки времени.
+    Профилируемый код не изменяется, поэтому затраты зависят только от частоты выборок
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter[tuple[str, ...]] = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = _frame_stack(frame)
+                with self._lock:
+                    self.counts[stack] += 1
+
+    def start(self) -> None:
+        _active_samplers.add(self)
+        _update_switch_interval()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        _active_samplers.discard(self)
+        _update_switch_interval()
+
+    def take(self) -> Counter:
+        """
+        Получение собранных стеков с началом нового сбора
+
+        :return: количество выборок по стекам
+        """
+
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+
+def render_folded(counts: Counter) -> str:
+    """
+    Стеки в свёрнутом формате (функции через точку с запятой и количество выборок)
+
+    :param counts: количество выборок по стекам
+    :return: текст профиля
+    """
+
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in counts.most_common())
+
+
+def render_tree(counts: Counter) -> str:
+    """
+    Дерево вызовов: доля и количество выборок, в которых была функция, с вызванными ею функциями
+
+    :param counts: количество выборок по стекам
+    :return: текст профиля
+    """
+
+    total = sum(counts.values())
+    root: dict = {}
+    for stack, count in counts.items():
+        node = root
+        for name in stack:
+            entry = node.setdefault(name, [0, {}])
+            entry[0] += count
+            node = entry[1]
+
+    lines = []
+
+    def walk(node: dict, depth: int) -> None:
+        for name, (samples, children) in sorted(node.items(), key=lambda item: -item[1][0]):
+            if samples < total * TREE_MIN_SHARE:
+                continue
+            lines.append(f'{samples / total:7.1%} {samples:>7}  {"  " * depth}{name}')
+            walk(children, depth + 1)
+
+    walk(root, 0)
+    return '\n'.join(lines) + '\n'
+
+
+def _requested_format(scope: Scope) -> str | None:
+    value = None
+    if PROFILE_PARAMETER.encode() in scope['query_string']:
+        value = parse_qs(scope['query_string'].decode()).get(PROFILE_PARAMETER, [None])[-1]
+    if value is None:
+        for name, header_value in scope['headers']:
+            if name == PROFILE_HEADER:
+                value = header_value.decode()
+    return PROFILE_FORMATS.get(value) if value is not None else None
+
+
+async def _authorize(scope: Scope) -> None:
+    for name, value in scope['headers']:
+        if name == b'authorization' and value[:7].lower() == b'bearer ':
+            await check_superuser_or_staff(await get_current_user(value[7:].decode()))
+            return
+    raise HTTPException(status_code=401, detail="Пользователь не авторизован")
+
+
+class ProfilerMiddleware:
+    """
+    Профилирование отдельного запроса по параметру __profile или заголовку X-Profile (tree или folded)
+    для администраторов и сотрудников. Вместо ответа возвращается профиль запроса.
+    Выборки делаются из потока event loop, поэтому в профиль попадают и одновременные запросы
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile_format = _requested_format(scope) if scope['type'] == 'http' else None
+        if profile_format is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await _authorize(scope)
+        except HTTPException as exc:
+            await JSONResponse({'detail': exc.detail}, status_code=exc.status_code)(scope, receive, send)
+            return
+
+        status = 500
+
+        async def discard_response(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard_response)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - started
+
+        counts = sampler.take()
+        header = (f"# {scope['method']} {scope['path']} -> {status}, {elapsed * 1000:.1f} мс, "
+                  f"выборок: {sum(counts.values())} (каждые {PROFILE_INTERVAL * 1000:g} мс)\n")
+        body = render_folded(counts) if profile_format == 'folded' else header + render_tree(counts)
+        await PlainTextResponse(body)(scope, receive, send)
+
+
+class ContinuousProfiler:
+    """
+    Постоянный сбор стеков event loop с редкими выборками. Каждые PROFILE_FLUSH_INTERVAL секунд
+    собранные стеки сохраняются в свёрнутом формате в файл <pid>-<время>.folded каталога PROFILE_DIR
+    """
+
+    def __init__(self) -> None:
+        self._sampler: StackSampler | None = None
+        self._task: asyncio.Task | None = None
+
+    def _write(self) -> None:
+        counts = self._sampler.take()
+        if counts:
+            path = Path(PROFILE_DIR) / f'{os.getpid()}-{time.strftime("%Y%m%d-%H%M%S")}.folded'
+            path.write_text(render_folded(counts))
+
+    async def _flush(self) -> None:
+        while True:
+            await asyncio.sleep(PROFILE_FLUSH_INTERVAL)
+            try:
+                self._write()
+            except OSError:
+                logger.exception('Не удалось сохранить профиль в %s', PROFILE_DIR)
+
+    def start(self) -> None:
+        """
+        Запуск сбора стеков, если задан каталог PROFILE_DIR
+        """
+
+        if PROFILE_DIR and self._task is None:
+            Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+            self._sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLING_INTERVAL)
+            self._sampler.start()
+            self._task = asyncio.create_task(self._flush())
+
+    async def stop(self) -> None:
+        """
+        Остановка сбора стеков с сохранением последних выборок
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._sampler.stop()
+            self._write()
+            self._sampler = None
+
+
+continuous_profiler = ContinuousProfiler()
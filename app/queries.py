@@ -0,0 +1,185 @@
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.config import QUERY_REPEAT_WARNING
+
+logger = logging.getLogger(__name__)
+
+# Методы клиентов базы данных, через которые выполняются все запросы Tortoise
+CLIENT_METHODS = ('execute_insert', 'execute_many', 'execute_query', 'execute_query_dict', 'execute_script')
+
+# Значения в тексте запроса, которые не влияют на его форму
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+class QueryStats:
+    """
+    Количество и общее время запросов к базе данных
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.queries: list[str] = []
+
+    def record(self, query: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.queries.append(query)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """
+        Формы запросов, выполненных больше threshold раз (признак N+1)
+
+        :param threshold: допустимое количество повторов
+        :return: список пар из формы запроса и количества выполнений
+        """
+
+        if self.count <= threshold:
+            return []
+        shapes = Counter(query_shape(query) for query in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count > threshold]
+
+
+# Замеры, в которые попадают запросы текущего контекста (вложенные замеры учитывают запросы во всех внешних)
+_active_stats: ContextVar[tuple[QueryStats, ...]] = ContextVar('active_query_stats', default=())
+
+
+def query_shape(query: str) -> str:
+    """
+    Форма запроса: текст без значений, списки значений сворачиваются
+
+    :param query: текст запроса
+    :return: форма запроса
+    """
+
+    return _LISTS.sub('?, ...', _LITERALS.sub('?', query))
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Подсчёт запросов к базе данных, выполненных внутри блока в текущем контексте
+    """
+
+    stats = QueryStats()
+    token = _active_stats.set(_active_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_stats.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(limit: int) -> Iterator[QueryStats]:
+    """
+    Проверка, что внутри блока выполнено не больше limit запросов к базе данных.
+    Подходит для тестов, которые вызывают приложение в том же цикле событий (например, benchmarks.asgi.request
+    или httpx.AsyncClient с ASGITransport). При вызове через TestClient количество запросов можно взять
+    из заголовка X-Query-Count
+
+    :param limit: допустимое количество запросов
+    """
+
+    with track_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        shapes = '\n'.join(f'{count} x {shape}' for shape, count in stats.repeated(0))
+        raise QueryBudgetExceeded(f'Выполнено запросов: {stats.count}, допустимо: {limit}\n{shapes}')
+
+
+def _instrument(method):
+    @functools.wraps(method)
+    async def wrapper(self, query: str, *args, **kwargs):
+        active = _active_stats.get()
+        if not active:
+            return await method(self, query, *args, **kwargs)
+        # Запрос учитывается один раз, даже если метод клиента вызывает другой метод
+        token = _active_stats.set(())
+        started = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            _active_stats.reset(token)
+            for stats in active:
+                stats.record(query, duration)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_db_clients(cls: type = BaseDBAsyncClient) -> None:
+    """
+    Подключение подсчёта запросов ко всем загруженным клиентам базы данных (включая клиенты транзакций).
+    Клиенты загружаются Tortoise при подключении к базе, поэтому вызывается после инициализации
+
+    :param cls: класс клиента, с которого начинается обход подклассов
+    """
+
+    for name in CLIENT_METHODS:
+        method = cls.__dict__.get(name)
+        if method is not None and not getattr(method, 'instrumented', False):
+            setattr(cls, name, _instrument(method))
+    for subclass in cls.__subclasses__():
+        instrument_db_clients(subclass)
+
+
+class QueryStatsMiddleware:
+    """
+    Подсчёт запросов к базе данных для каждого HTTP-запроса.
+    Количество и время запросов передаются в заголовках X-Query-Count и Server-Timing,
+    о повторах одной формы запроса больше QUERY_REPEAT_WARNING раз пишется предупреждение.
+    Потоковые ответы (выгрузка, события) выполняют запросы после отправки заголовков,
+    поэтому для них заголовки не добавляются, а количество запросов пишется в журнал по окончании ответа
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        streaming = False
+
+        async def send_with_stats(message: Message) -> None:
+            nonlocal streaming
+            if message['type'] == 'http.response.start':
+                # Длина известна заранее только у ответов, тело которых сформировано до отправки заголовков
+                headers = message.get('headers', ())
+                if message['status'] in (204, 304) or any(name == b'content-length' for name, _ in headers):
+                    message['headers'] = [
+                        *headers,
+                        (b'x-query-count', str(stats.count).encode()),
+                        (b'server-timing', f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode()),
+                    ]
+                else:
+                    streaming = True
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_with_stats)
+
+        if streaming:
+            logger.info('%s %s: потоковый ответ, запросов к базе: %d (%.2f мс)', scope['method'], scope['path'],
+                        stats.count, stats.duration * 1000)
+
+        if QUERY_REPEAT_WARNING:
+            for shape, count in stats.repeated(QUERY_REPEAT_WARNING):
+                logger.warning('%s %s: запрос выполнен %d раз: %s', scope['method'], scope['path'], count, shape)
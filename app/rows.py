@@ -0,0 +1,38 @@
+from datetime import datetime, tzinfo
+from functools import lru_cache
+
+from tortoise import timezone
+
+
+@lru_cache(maxsize=1)
+def _app_timezone() -> tzinfo:
+    """
+    Часовой пояс приложения. Tortoise задаёт его при инициализации и читает из окружения при каждом обращении,
+    поэтому для построчного преобразования дат он запоминается
+
+    :return: часовой пояс
+    """
+
+    return timezone.get_default_timezone()
+
+
+def json_datetime(value: datetime | str | None) -> str | None:
+    """
+    Представление даты в JSON так же, как его формирует Pydantic (UTC обозначается буквой Z).
+    Используется при формировании ответов из строк запроса, чтобы они не отличались от ответов через схемы.
+    Дата приводится к часовому поясу приложения, как при загрузке через модели
+
+    :param value: дата, строка даты из SQLite или None
+    :return: строка ISO 8601 или None
+    """
+
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = timezone.make_aware(value, _app_timezone())
+    else:
+        value = value.astimezone(_app_timezone())
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Generic, List, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from tortoise import Model, fields, timezone
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+from app.config import CHANGES_SYNC_LAG
+from app.database import read_from_primary
+
+T = TypeVar('T')
+
+
+class Tombstone(Model):
+    """
+    Модель записи об удалённом объекте для синхронизации изменений
+    """
+
+    id = fields.BigIntField(pk=True)
+    table_name = fields.CharField(max_length=50)
+    object_id = fields.IntField()
+    deleted_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "tombstones"
+        indexes = (
+            ("table_name", "deleted_at", "id"),
+        )
+
+
+class PydanticChanges(BaseModel, Generic[T]):
+    """
+    Модель для вывода изменений с момента предыдущей синхронизации
+    """
+
+    items: List[T]
+    deleted: List[int]
+    next_token: str
+    has_more: bool
+
+
+def encode_sync_token(updated: tuple[datetime, int], deleted: tuple[datetime, int]) -> str:
+    """
+    Кодирование токена синхронизации в непрозрачную строку
+
+    :param updated: время изменения и идентификатор последнего выданного изменённого объекта
+    :param deleted: время удаления и идентификатор последней выданной записи об удалении
+    :return: токен синхронизации
+    """
+
+    raw = json.dumps({'u': [updated[0].isoformat(), updated[1]], 'd': [deleted[0].isoformat(), deleted[1]]},
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_sync_token(token: str) -> tuple[tuple[datetime, int], tuple[datetime, int]]:
+    """
+    Декодирование токена синхронизации
+
+    :param token: токен синхронизации
+    :return: кортеж из позиций потока изменённых объектов и потока удалений
+    """
+
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return tuple((datetime.fromisoformat(data[key][0]), int(data[key][1])) for key in ('u', 'd'))
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail='Некорректный токен синхронизации')
+
+
+async def record_deletions(table_name: str, object_ids: list[int], connection: BaseDBAsyncClient) -> None:
+    """
+    Сохранение записей об удалённых объектах в транзакции удаления
+
+    :param table_name: название таблицы
+    :param object_ids: идентификаторы удалённых объектов
+    :param connection: соединение текущей транзакции
+    """
+
+    await Tombstone.bulk_create([Tombstone(table_name=table_name, object_id=object_id) for object_id in object_ids],
+                                using_db=connection)
+
+
+def _after(queryset: QuerySet, field: str, position: tuple[datetime, int]) -> QuerySet:
+    """
+    Условие "после позиции" для выборки по ключу (поле времени, id)
+
+    :param queryset: исходный запрос
+    :param field: поле времени
+    :param position: время и идентификатор последней выданной записи
+    :return: отфильтрованный запрос
+    """
+
+    moment, last_id = position
+    return queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': last_id}))
+
+
+async def get_changes(queryset: QuerySet, table_name: str, token: str | None, limit: int) -> dict:
+    """
+    Получение объектов, изменённых с момента выдачи токена, и идентификаторов удалённых объектов.
+    Выдаются только изменения старше CHANGES_SYNC_LAG секунд: время изменения записывается до фиксации
+    транзакции, и без задержки изменения долгой транзакции могли бы оказаться раньше уже выданного токена.
+    Без токена выдаются все существующие объекты
+
+    :param queryset: запрос объектов с полем updated_at
+    :param table_name: название таблицы в записях об удалении
+    :param token: токен предыдущей синхронизации
+    :param limit: максимальное количество изменённых и удалённых объектов в ответе
+    :return: изменения, удаления, токен следующей синхронизации и признак наличия других изменений
+    """
+
+    # Отставание реплики не учитывается задержкой CHANGES_SYNC_LAG, поэтому изменения читаются из основной базы
+    read_from_primary()
+    queryset = queryset.using_db(queryset.model._meta.db)
+    horizon = timezone.now() - timedelta(seconds=CHANGES_SYNC_LAG)
+    if token:
+        updated_position, deleted_position = decode_sync_token(token)
+    else:
+        # Новому клиенту удаления до начала синхронизации не нужны
+        updated_position, deleted_position = None, (horizon, 0)
+
+    objects_queryset = queryset.filter(updated_at__lte=horizon)
+    if updated_position is not None:
+        objects_queryset = _after(objects_queryset, 'updated_at', updated_position)
+    objects = list(await objects_queryset.order_by('updated_at', 'id').limit(limit + 1))
+
+    tombstones_queryset = _after(Tombstone.filter(table_name=table_name, deleted_at__lte=horizon),
+                                 'deleted_at', deleted_position)
+    tombstones = await tombstones_queryset.order_by('deleted_at', 'id').limit(limit + 1).values(
+        'id', 'object_id', 'deleted_at')
+
+    has_more = len(objects) > limit or len(tombstones) > limit
+    objects, tombstones = objects[:limit], tombstones[:limit]
+
+    if objects:
+        updated_position = (objects[-1].updated_at, objects[-1].id)
+    elif updated_position is None:
+        updated_position = (datetime.min.replace(tzinfo=horizon.tzinfo), 0)
+    if tombstones:
+        deleted_position = (tombstones[-1]['deleted_at'], tombstones[-1]['id'])
+
+    return {
+        'items': objects,
+        'deleted': [tombstone['object_id'] for tombstone in tombstones],
+        'next_token': encode_sync_token(updated_position, deleted_position),
+        'has_more': has_more,
+    }
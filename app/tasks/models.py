@@ -1,5 +1,39 @@
+from enum import IntEnum
+
 from tortoise import Model, fields
-from app.employees.validators import ChoiceValidator
+
+
+class TaskStatus(IntEnum):
+    """
+    Статус задачи. В базе хранится числом (SMALLINT), в API передаётся строкой
+    """
+
+    NEW = 1
+    IN_PROGRESS = 2
+    COMPLETED = 3
+
+    @property
+    def label(self) -> str:
+        """Строковое представление статуса в API"""
+
+        return self.name.lower()
+
+    @classmethod
+    def from_label(cls, label: str) -> 'TaskStatus':
+        """
+        Получение статуса по его строковому представлению
+
+        :param label: строковое представление статуса
+        :return: статус
+        """
+
+        return cls[label.upper()]
+
+
+TASK_STATUS_LABELS = tuple(status.label for status in TaskStatus)
+
+# Статусы незавершённых задач. Фильтр по ним совпадает с условием частичных индексов таблицы задач
+ACTIVE_TASK_STATUSES = (TaskStatus.NEW, TaskStatus.IN_PROGRESS)
 
 
 class Task(Model):
@@ -11,12 +45,21 @@ class Task(Model):
     name = fields.CharField(max_length=255)
     description = fields.TextField(null=True)
     created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
     performer = fields.ForeignKeyField("employees.Employee", null=True, on_delete=fields.SET_NULL)
     deadline = fields.DatetimeField(null=True)
-    status = fields.CharField(max_length=50,
-                              validators=[ChoiceValidator(('new', 'in_progress', 'completed'))],
-                              default='new')
+    status = fields.IntEnumField(TaskStatus, default=TaskStatus.NEW)
     parent_task = fields.ForeignKeyField("tasks.Task", null=True, on_delete=fields.SET_NULL)
+    # Путь от корня дерева задач: идентификаторы предков через "/", например "/1/5/" (у корневой задачи "/")
+    path = fields.CharField(max_length=2048, default='/', index=True)
 
     class Meta:
         table = "tasks"
+        indexes = (
+            ("performer_id", "id"),
+            ("parent_task_id", "id"),
+            ("status", "id"),
+            ("updated_at", "id"),
+            ("created_at", "id"),
+            ("deadline", "id"),
+        )
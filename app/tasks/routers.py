@@ -1,19 +1,32 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from starlette.responses import JSONResponse
+from datetime import datetime
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket
+from starlette.responses import JSONResponse, StreamingResponse
+from tortoise.transactions import in_transaction
 
+from app.config import FAST_READ_PATH, PAGINATION_DEFAULT_LIMIT, PAGINATION_MAX_LIMIT
 from app.employees.models import Employee
+from app.employees.schemas import build_full_name
+from app.events import hub, publish, sse_stream, task_event, task_event_from_object, websocket_stream
+from app.export import ExportFormat, export_response
+from app.pagination import PydanticPage, paginate, paginate_ranked
+from app.sync import PydanticChanges, get_changes
 from app.tasks import services
-from app.tasks.models import Task
-from app.tasks.schemas import PydanticTaskOut, PydanticTaskCreate, PydanticTaskPut
+from app.tasks.models import Task, TaskStatus
+from app.tasks.schemas import PydanticTaskOut, PydanticTaskCreate, PydanticTaskPut, PydanticTaskBulkCreate, \
+    PydanticTaskBulkUpdate, PydanticTaskBulkDelete, PydanticBulkResult, PydanticTaskNodeOut, TaskStatusLabel, \
+    TASK_EXPANDABLE, TASK_FIELDS, build_task_model
 from app.users.auth_utils import get_current_user, check_superuser_or_staff
-from app.users.models import User
+from app.users.schemas import PydenticUserPrincipal
+from app.versions import bump_versions, conditional_get, etag_headers
 
 tasks_router = APIRouter()
 
 
 @tasks_router.get('/important/')
-async def get_important_tasks(current_user: User = Depends(get_current_user)):  # noqa: F841
+async def get_important_tasks(balanced: bool = False,
+                              current_user: PydenticUserPrincipal = Depends(get_current_user),  # noqa: F841
+                              etag: str = Depends(conditional_get('tasks', 'employees'))):  # noqa: F841
     """
     Возвращает список задач с доступными сотрудниками.
 
@@ -21,73 +34,342 @@ async def get_important_tasks(current_user: User = Depends(get_current_user)):
     Если есть полностью свободные сотрудники, то они будут указаны как возможные исполнители.
     Если нет свободных сотрудников, то в качестве исполнителей будут указаны сотрудники с наименьшим числом задач,
     либо сотрудник, выполняющий родительскую задачу (если он не очень загружен)
+    При balanced=true задачи распределяются между сотрудниками с учётом загрузки,
+    и для каждой задачи предлагается один исполнитель
 
+    :param balanced: распределить задачи между сотрудниками
     :param current_user: текущий пользователь
+    :param etag: ETag ответа (при совпадении с If-None-Match возвращается 304)
     :return: список задач в формате [{Важная задача, Срок, [ФИО сотрудника]}]
     """
 
-    tasks = await Task.filter(
-        status__not='completed',
-        parent_task_id__isnull=False,
-        performer_id__isnull=True,
-        parent_task__performer_id__isnull=False
-    ).prefetch_related('performer', 'parent_task')
-
-    free_employees = await services.get_free_employees()
-    important_tasks = []
-
-    if free_employees:
-        for task in tasks:
-            important_tasks.append({
-                "id": task.id,
-                "name": task.name,
-                "deadline": task.deadline,
-                "parent_task": task.parent_task_id,
-                "status": task.status,
-                "available_employees": free_employees
-            })
-    else:
-        least_loaded_employees, min_task_count = await services.get_least_busy_employees()
-        for task in tasks:
-            parent_performer = await services.get_available_employee(task, min_task_count)
-            important_tasks.append({
-                "id": task.id,
-                "name": task.name,
-                "deadline": task.deadline,
-                "parent_task": task.parent_task_id,
-                "status": task.status,
-                "available_employee": parent_performer if parent_performer else least_loaded_employees
-            })
+    if balanced:
+        important_tasks, _ = await services.get_balanced_important_tasks()
+        return important_tasks
+    return await services.get_important_tasks()
 
+
+@tasks_router.post('/important/assign/')
+async def assign_important_tasks(current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)):  # noqa: F841
+    """
+    Распределяет важные задачи между сотрудниками с учётом загрузки и назначает исполнителей
+
+    :param current_user: текущий пользователь
+    :return: список задач в формате [{Важная задача, Срок, ФИО назначенного сотрудника}]
+    """
+
+    important_tasks, previous = await services.get_balanced_important_tasks(apply=True)
+    await bump_versions('tasks')
+    await publish(await services.get_task_events('updated', list(previous), previous))
     return important_tasks
 
 
-@tasks_router.get('/', response_model=List[PydanticTaskOut])
-async def get_tasks(current_user: User = Depends(get_current_user)) -> List:   # noqa: F841
-    """Возвращает список всех задач"""
+@tasks_router.get('/', response_model=PydanticPage[PydanticTaskOut])
+async def get_tasks(limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                    cursor: str | None = None,
+                    order_by: Literal['id', 'created_at', 'deadline'] = 'id',
+                    status: List[TaskStatusLabel] | None = Query(None),
+                    performer: int | None = None,
+                    parent_task: int | None = None,
+                    deadline_from: datetime | None = None,
+                    deadline_to: datetime | None = None,
+                    overdue: bool = False,
+                    unassigned: bool = False,
+                    fields: str | None = None,
+                    expand: str | None = None,
+                    current_user: PydenticUserPrincipal = Depends(get_current_user),  # noqa: F841
+                    etag: str | None = Depends(conditional_get('tasks', 'employees',
+                                                               time_dependent=('overdue',)))) -> dict | Response:
+    """
+    Возвращает постраничный список задач с фильтрацией на стороне базы данных
+
+    :param limit: количество задач на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param order_by: поле сортировки
+    :param status: статусы задач (параметр можно указать несколько раз)
+    :param performer: идентификатор исполнителя
+    :param parent_task: идентификатор родительской задачи
+    :param deadline_from: срок не раньше указанного
+    :param deadline_to: срок не позже указанного
+    :param overdue: только незавершённые задачи с истёкшим сроком
+    :param unassigned: только задачи без исполнителя
+    :param fields: выводимые поля задачи через запятую, например id,name,status
+    :param expand: раскрываемые связи через запятую (performer, parent_task, parent_task.performer),
+        нераскрытые связи выводятся идентификаторами
+    :param current_user: текущий пользователь
+    :param etag: ETag ответа (при совпадении с If-None-Match возвращается 304), для overdue не формируется
+    :return: страница задач и курсор следующей страницы
+    """
+
+    queryset = services.filter_tasks(Task.all(),
+                                     statuses=[TaskStatus.from_label(label) for label in status or []],
+                                     performer=performer,
+                                     parent_task=parent_task,
+                                     deadline_from=deadline_from,
+                                     deadline_to=deadline_to,
+                                     overdue=overdue,
+                                     unassigned=unassigned)
+    if fields is not None or expand is not None:
+        # Загружаются только нужные столбцы, а раскрытые связи - только по запросу
+        task_fields, task_expand = services.parse_task_fieldset(fields, expand)
+        queryset = queryset.only(*services.get_task_columns(task_fields, order_by))
+        tasks, next_cursor = await paginate(queryset, limit, cursor, order_by)
+        page_model = PydanticPage[build_task_model(task_fields, task_expand)]
+        page = page_model(items=await services.load_task_fieldset(tasks, task_fields, task_expand),
+                          next_cursor=next_cursor)
+        return Response(page.model_dump_json(), media_type='application/json', headers=etag_headers(etag))
+
+    if FAST_READ_PATH:
+        # Страница определяется по идентификаторам, задачи со связанными объектами выбираются
+        # одним запросом с JOIN и выводятся без объектов моделей
+        page, next_cursor = await paginate(queryset, limit, cursor, order_by, values=())
+        rows = await services.get_task_rows([row['id'] for row in page])
+        return JSONResponse({'items': [services.task_row_to_json(row) for row in rows], 'next_cursor': next_cursor},
+                            headers=etag_headers(etag))
+
+    queryset = queryset.prefetch_related('performer',
+                                         'parent_task',
+                                         'parent_task__performer')
+    tasks, next_cursor = await paginate(queryset, limit, cursor, order_by)
+    return {'items': tasks, 'next_cursor': next_cursor}
+
+
+@tasks_router.get('/search/', response_model=PydanticPage[PydanticTaskOut])
+async def search_tasks(q: str = Query(min_length=1, max_length=200),
+                       limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                       cursor: str | None = None,
+                       current_user: PydenticUserPrincipal = Depends(get_current_user)) -> dict:  # noqa: F841
+    """
+    Полнотекстовый поиск задач по словам в названии и описании.
+    Задачи упорядочены по релевантности
+
+    :param q: поисковый запрос
+    :param limit: количество задач на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param current_user: текущий пользователь
+    :return: страница найденных задач и курсор следующей страницы
+    """
+
+    tasks, next_cursor = await paginate_ranked(
+        lambda count, offset: services.search_tasks(q, count, offset), limit, cursor)
+    return {'items': tasks, 'next_cursor': next_cursor}
+
+
+@tasks_router.get('/changes/', response_model=PydanticChanges[PydanticTaskOut])
+async def get_task_changes(since: str | None = None,
+                           limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                           current_user: PydenticUserPrincipal = Depends(get_current_user)) -> dict:  # noqa: F841
+    """
+    Возвращает задачи, изменённые с момента предыдущей синхронизации, и идентификаторы удалённых задач.
+    Без токена возвращаются все задачи. Если has_more равен true, следующий запрос нужно
+    выполнить сразу, не дожидаясь очередного опроса
+
+    :param since: токен синхронизации из предыдущего ответа
+    :param limit: максимальное количество изменённых и удалённых задач в ответе
+    :param current_user: текущий пользователь
+    :return: изменённые задачи, удалённые задачи и токен следующей синхронизации
+    """
+
+    queryset = Task.all().prefetch_related('performer',
+                                           'parent_task',
+                                           'parent_task__performer')
+    return await get_changes(queryset, 'tasks', since, limit)
+
+
+@tasks_router.get('/stream/')
+async def stream_task_events(performer: int | None = None,
+                             subtree: int | None = None,
+                             current_user: PydenticUserPrincipal = Depends(get_current_user)):  # noqa: F841
+    """
+    Поток изменений задач и сотрудников в формате Server-Sent Events.
+    Если клиент не успевает получать события, приходит событие overflow и поток закрывается:
+    после переподключения состояние нужно досинхронизировать через /tasks/changes/
+
+    :param performer: только события задач сотрудника
+    :param subtree: только события задачи и её подзадач
+    :param current_user: текущий пользователь
+    :return: поток событий
+    """
+
+    subscription = hub.subscribe(performer=performer, subtree=subtree)
+    return StreamingResponse(sse_stream(subscription), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@tasks_router.websocket('/ws/')
+async def task_events_websocket(websocket: WebSocket,
+                                token: str,
+                                performer: int | None = None,
+                                subtree: int | None = None) -> None:
+    """
+    Поток изменений задач и сотрудников через WebSocket.
+    Токен передаётся параметром запроса, так как браузер не позволяет задать заголовки WebSocket
+
+    :param websocket: соединение WebSocket
+    :param token: токен доступа
+    :param performer: только события задач сотрудника
+    :param subtree: только события задачи и её подзадач
+    """
+
+    try:
+        await get_current_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    await websocket_stream(websocket, hub.subscribe(performer=performer, subtree=subtree))
+
+
+@tasks_router.get('/export/')
+async def export_tasks(export_format: ExportFormat = Query('ndjson', alias='format'),
+                       gzip: bool = False,
+                       current_user: PydenticUserPrincipal = Depends(get_current_user)):  # noqa: F841
+    """
+    Потоковая выгрузка всех задач вместе с исполнителем и родительской задачей
+
+    :param export_format: формат выгрузки (ndjson или csv)
+    :param gzip: сжимать выгрузку
+    :param current_user: текущий пользователь
+    :return: файл выгрузки
+    """
+
+    fields = ['id', 'name', 'description', 'created_at', 'deadline', 'status', 'performer_id',
+              'performer__first_name', 'performer__last_name', 'performer__father_name',
+              'parent_task_id', 'parent_task__name']
+    columns = ['id', 'name', 'description', 'created_at', 'deadline', 'status', 'performer_id',
+               'performer_full_name', 'parent_task_id', 'parent_task_name']
+
+    def prepare_row(row: dict) -> dict:
+        row['performer_full_name'] = build_full_name(row.pop('performer__first_name'),
+                                                     row.pop('performer__last_name'),
+                                                     row.pop('performer__father_name'))
+        row['parent_task_name'] = row.pop('parent_task__name')
+        row['status'] = TaskStatus(row['status']).label
+        return row
+
+    return export_response(Task.all(), fields, columns, export_format, 'tasks', prepare_row, gzip)
+
 
-    tasks = await Task.all().prefetch_related('performer',
-                                              'parent_task',
-                                              'parent_task__performer')
-    return tasks
+@tasks_router.post('/bulk/', response_model=PydanticBulkResult)
+async def bulk_create_tasks(tasks: PydanticTaskBulkCreate,
+                            current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> dict:  # noqa: F841
+    """
+    Массовое создание задач
+
+    :param tasks: данные о задачах
+    :param current_user: текущий пользователь
+    :return: идентификаторы созданных задач и ошибки по номерам элементов
+    """
+
+    ids, errors = await services.bulk_create_tasks(tasks.items)
+    if ids:
+        await bump_versions('tasks')
+        await publish(await services.get_task_events('created', ids))
+    return {'ids': ids, 'errors': errors}
+
+
+@tasks_router.patch('/bulk/', response_model=PydanticBulkResult)
+async def bulk_update_tasks(tasks: PydanticTaskBulkUpdate,
+                            current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> dict:  # noqa: F841
+    """
+    Массовое обновление задач
+
+    :param tasks: данные о задачах
+    :param current_user: текущий пользователь
+    :return: идентификаторы обновлённых задач и ошибки по номерам элементов
+    """
+
+    ids, errors, previous = await services.bulk_update_tasks(tasks.items)
+    if ids:
+        await bump_versions('tasks')
+        await publish(await services.get_task_events('updated', list(previous), previous))
+    return {'ids': ids, 'errors': errors}
+
+
+@tasks_router.delete('/bulk/', response_model=PydanticBulkResult)
+async def bulk_delete_tasks(tasks: PydanticTaskBulkDelete,
+                            current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> dict:  # noqa: F841
+    """
+    Массовое удаление задач
+
+    :param tasks: идентификаторы задач
+    :param current_user: текущий пользователь
+    :return: идентификаторы удалённых задач и ошибки по номерам элементов
+    """
+
+    deleted, errors, moved = await services.bulk_delete_tasks(tasks.ids)
+    if deleted:
+        await bump_versions('tasks')
+        await publish([task_event('deleted', task) for task in deleted]
+                      + await services.get_task_events('updated', list(moved), moved))
+    return {'ids': [task['id'] for task in deleted], 'errors': errors}
 
 
 @tasks_router.get('/{task_id}/', response_model=PydanticTaskOut)
-async def get_task(task_id: int, current_user: User = Depends(get_current_user)) -> Task:  # noqa: F841
+async def get_task(task_id: int,
+                   fields: str | None = None,
+                   expand: str | None = None,
+                   current_user: PydenticUserPrincipal = Depends(get_current_user)) -> Task | Response:  # noqa: F841
     """
     Возвращает задачу по идентификатору
 
     :param task_id: идентификатор задачи
+    :param fields: выводимые поля задачи через запятую, например id,name,status
+    :param expand: раскрываемые связи через запятую (performer, parent_task, parent_task.performer),
+        нераскрытые связи выводятся идентификаторами
     :param current_user: текущий пользователь
     :return: задача
     """
 
+    if fields is not None or expand is not None:
+        task_fields, task_expand = services.parse_task_fieldset(fields, expand)
+        task_obj = await Task.filter(id=task_id).only(*services.get_task_columns(task_fields)).first()
+        if task_obj is None:
+            raise HTTPException(status_code=404, detail=f'Задача {task_id} не найдена')
+        item, = await services.load_task_fieldset([task_obj], task_fields, task_expand)
+        task_out = build_task_model(task_fields, task_expand).model_validate(item)
+        return Response(task_out.model_dump_json(), media_type='application/json')
+
+    if FAST_READ_PATH:
+        return JSONResponse(services.task_row_to_json(await services.get_task_row_or_404(task_id)))
+
     task_obj = await services.get_task_or_404(task_id)
     return task_obj
 
 
+@tasks_router.get('/{task_id}/subtree/', response_model=List[PydanticTaskNodeOut])
+async def get_task_subtree(task_id: int,
+                           current_user: PydenticUserPrincipal = Depends(get_current_user)) -> List[Task]:  # noqa: F841
+    """
+    Возвращает все подзадачи задачи на любой глубине
+
+    :param task_id: идентификатор задачи
+    :param current_user: текущий пользователь
+    :return: список подзадач, упорядоченный по пути в дереве
+    """
+
+    task_obj = await services.get_task_or_404(task_id, prefetch=False)
+    return await services.get_subtree(task_obj)
+
+
+@tasks_router.get('/{task_id}/ancestors/', response_model=List[PydanticTaskNodeOut])
+async def get_task_ancestors(task_id: int,
+                             current_user: PydenticUserPrincipal = Depends(get_current_user)) -> List[Task]:  # noqa: F841
+    """
+    Возвращает цепочку родительских задач
+
+    :param task_id: идентификатор задачи
+    :param current_user: текущий пользователь
+    :return: список задач от корня дерева к родительской задаче
+    """
+
+    task_obj = await services.get_task_or_404(task_id, prefetch=False)
+    return await services.get_ancestors(task_obj)
+
+
 @tasks_router.post('/', response_model=PydanticTaskOut)
-async def create_task(task: PydanticTaskCreate, current_user: User = Depends(check_superuser_or_staff)) -> Task:  # noqa: F841
+async def create_task(task: PydanticTaskCreate, current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> Task:  # noqa: F841
     """
     Создание задачи
 
@@ -99,21 +381,27 @@ async def create_task(task: PydanticTaskCreate, current_user: User = Depends(che
     performer = await Employee.get(id=task.performer) if task.performer else None
     parent_task = await Task.get(id=task.parent_task).prefetch_related('performer') if task.parent_task else None
 
-    task_obj = await Task.create(
-        name=task.name,
-        description=task.description,
-        performer=performer,
-        deadline=task.deadline,
-        status=task.status,
-        parent_task=parent_task
-    )
+    async with in_transaction() as connection:
+        task_obj = await Task.create(
+            name=task.name,
+            description=task.description,
+            performer=performer,
+            deadline=task.deadline,
+            status=task.status,
+            parent_task=parent_task,
+            path=services.get_child_path(parent_task),
+            using_db=connection
+        )
+        await services.update_task_counters(None, (task_obj.performer_id, task_obj.status), connection)
+    await bump_versions('tasks')
+    await publish([task_event_from_object('created', task_obj)])
     return task_obj
 
 
 @tasks_router.put('/{task_id}/', response_model=PydanticTaskOut)
 async def update_task(task_id: int,
                       task: PydanticTaskPut,
-                      current_user: User = Depends(check_superuser_or_staff)) -> Task:  # noqa: F841
+                      current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> dict:  # noqa: F841
     """
     Обновление задачи
 
@@ -123,29 +411,42 @@ async def update_task(task_id: int,
     :return: обновленная задача
     """
 
-    task_obj = await services.get_task_or_404(task_id)
-
-    task_data = task.model_dump(exclude_unset=True)
+    task_obj, previous, moved = await services.patch_task(task_id, task.model_dump(exclude_unset=True))
+    await bump_versions('tasks')
+    await publish([task_event_from_object('updated', task_obj, previous),
+                   *await services.get_task_events('updated', list(moved), moved)])
+    task_out, = await services.load_task_fieldset([task_obj], TASK_FIELDS, frozenset(TASK_EXPANDABLE))
+    return task_out
 
-    if 'performer' in task_data:
-        task_obj.performer = await Employee.get(id=task.performer) if task.performer else None
 
-    if 'parent_task' in task_data:
-        if task.parent_task == task_id:
-            raise HTTPException(status_code=400, detail="Нельзя указывать в качестве родительской задачи саму себя")
-        task_obj.parent_task = await Task.get(id=task.parent_task).prefetch_related(
-            'performer') if task.parent_task else None
+@tasks_router.patch('/{task_id}/', response_model=build_task_model(TASK_FIELDS, frozenset()))
+async def patch_task(task_id: int,
+                     task: PydanticTaskPut,
+                     expand: str | None = None,
+                     current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> Response:  # noqa: F841
+    """
+    Частичное обновление задачи одним запросом к базе данных.
+    Связи выводятся идентификаторами, вложенные объекты загружаются только по параметру expand
 
-    for key, value in task_data.items():
-        if key not in ['performer', 'parent_task']:
-            setattr(task_obj, key, value)
+    :param task_id: идентификатор задачи
+    :param task: изменяемые поля задачи
+    :param expand: раскрываемые связи через запятую (performer, parent_task, parent_task.performer)
+    :param current_user: текущий пользователь
+    :return: обновленная задача
+    """
 
-    await task_obj.save()
-    return task_obj
+    task_fields, task_expand = services.parse_task_fieldset(None, expand)
+    task_obj, previous, moved = await services.patch_task(task_id, task.model_dump(exclude_unset=True))
+    await bump_versions('tasks')
+    await publish([task_event_from_object('updated', task_obj, previous),
+                   *await services.get_task_events('updated', list(moved), moved)])
+    item, = await services.load_task_fieldset([task_obj], task_fields, task_expand)
+    task_out = build_task_model(task_fields, task_expand).model_validate(item)
+    return Response(task_out.model_dump_json(), media_type='application/json')
 
 
 @tasks_router.delete('/{task_id}/')
-async def delete_task(task_id: int, current_user: User = Depends(check_superuser_or_staff)) -> JSONResponse:  # noqa: F841
+async def delete_task(task_id: int, current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> JSONResponse:  # noqa: F841
     """
     Удаление задачи по идентификатору
 
@@ -154,8 +455,10 @@ async def delete_task(task_id: int, current_user: User = Depends(check_superuser
     :return: сообщение об успешном удалении
     """
 
-    task_obj = await services.get_task_or_404(task_id)
-    await task_obj.delete()
+    task_obj, moved = await services.delete_task(task_id)
+    await bump_versions('tasks')
+    await publish([task_event_from_object('deleted', task_obj),
+                   *await services.get_task_events('updated', list(moved), moved)])
     content = {'message': f'Задача {task_id} удалена'}
 
     return JSONResponse(content=content, status_code=200)
\ No newline at end of file
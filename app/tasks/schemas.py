@@ -1,10 +1,40 @@
 from datetime import datetime
+from functools import lru_cache
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, BeforeValidator, Field, PlainSerializer, WithJsonSchema, create_model
+from app.config import TASKS_BULK_MAX_ITEMS
 from app.employees.schemas import EmployeeForTask
 from app.employees.validators import ChoiceValidator
+from app.tasks.models import TASK_STATUS_LABELS, TaskStatus
 
-choice_validator = ChoiceValidator(choices=('new', 'in_progress', 'completed'))
+choice_validator = ChoiceValidator(choices=TASK_STATUS_LABELS)
+
+
+def parse_task_status(value) -> TaskStatus:
+    """
+    Проверка на допустимый статус задачи и приведение строки из запроса к TaskStatus
+
+    :param value: строковое представление статуса или статус модели
+    :return: статус
+    """
+
+    if isinstance(value, TaskStatus):
+        return value
+    choice_validator(value)
+    return TaskStatus.from_label(value)
+
+
+# Строковое представление статуса задачи, например, в параметрах запроса
+TaskStatusLabel = Literal[TASK_STATUS_LABELS]
+
+# Статус задачи: внутри приложения TaskStatus, в запросах и ответах - строка
+TaskStatusField = Annotated[
+    TaskStatus,
+    BeforeValidator(parse_task_status),
+    PlainSerializer(lambda status: status.label, return_type=str, when_used='json'),
+    WithJsonSchema({'type': 'string', 'enum': list(TASK_STATUS_LABELS)}),
+]
 
 
 class PydanticTaskCreate(BaseModel):
@@ -16,17 +46,9 @@ class PydanticTaskCreate(BaseModel):
     description: str | None = None
     performer: int | None = None
     deadline: datetime | None = None
-    status: str = "new"
+    status: TaskStatusField = TaskStatus.NEW
     parent_task: int | None = None
 
-    @field_validator('status')
-    @classmethod
-    def check_status(cls, value: str) -> str:
-        """Проверка на допустимый статус задачи"""
-
-        choice_validator(value)
-        return value
-
     class Config:
         from_attributes = True
 
@@ -40,7 +62,7 @@ class PydanticTaskPut(PydanticTaskCreate):
     description: str | None = None
     performer: int | None = None
     deadline: datetime | None = None
-    status: str = None
+    status: TaskStatusField | None = None
     parent_task: int | None = None
 
 
@@ -54,7 +76,7 @@ class PydanticParentTaskOut(BaseModel):
     description: str | None = None
     created_at: datetime
     deadline: datetime | None = None
-    status: str
+    status: TaskStatusField
     performer: EmployeeForTask | None = None
 
     class Config:
@@ -71,7 +93,7 @@ class PydanticTaskOut(BaseModel):
     description: str | None = None
     created_at: datetime
     deadline: datetime | None = None
-    status: str
+    status: TaskStatusField
     performer: EmployeeForTask | None = None
     parent_task: PydanticParentTaskOut | None = None
 
@@ -79,6 +101,46 @@ class PydanticTaskOut(BaseModel):
         from_attributes = True
 
 
+# Поля задачи, которые можно запросить параметром fields, и связи, которые можно раскрыть параметром expand
+TASK_FIELDS = ('id', 'name', 'description', 'created_at', 'deadline', 'status', 'performer', 'parent_task')
+PARENT_TASK_FIELDS = ('id', 'name', 'description', 'created_at', 'deadline', 'status', 'performer')
+TASK_EXPANDABLE = ('performer', 'parent_task', 'parent_task.performer')
+TASK_SCALAR_TYPES = {
+    'id': int,
+    'name': str,
+    'description': str | None,
+    'created_at': datetime,
+    'deadline': datetime | None,
+    'status': TaskStatusField,
+}
+
+
+@lru_cache(maxsize=None)
+def build_task_model(fields: tuple[str, ...], expand: frozenset[str]) -> type[BaseModel]:
+    """
+    Создание модели вывода задачи только с запрошенными полями.
+    Нераскрытые связи выводятся идентификаторами, раскрытые - вложенными объектами.
+    Модели кэшируются, поэтому для каждого набора полей создаются один раз
+
+    :param fields: поля задачи в порядке TASK_FIELDS
+    :param expand: раскрываемые связи
+    :return: модель вывода задачи
+    """
+
+    definitions = {}
+    for name in fields:
+        if name in TASK_SCALAR_TYPES:
+            definitions[name] = (TASK_SCALAR_TYPES[name], ...)
+        elif name == 'performer':
+            definitions[name] = (EmployeeForTask | None if 'performer' in expand else int | None, None)
+        elif name == 'parent_task' and 'parent_task' in expand:
+            parent_expand = frozenset({'performer'}) if 'parent_task.performer' in expand else frozenset()
+            definitions[name] = (build_task_model(PARENT_TASK_FIELDS, parent_expand) | None, None)
+        elif name == 'parent_task':
+            definitions[name] = (int | None, None)
+    return create_model('PydanticTaskFieldsOut', **definitions)
+
+
 class PydanticTaskOutForEmployee(BaseModel):
     """
     Модель для вывода задачи для связанного с ней сотрудника
@@ -88,7 +150,73 @@ class PydanticTaskOutForEmployee(BaseModel):
     name: str
     description: str | None = None
     deadline: datetime | None = None
-    status: str
+    status: TaskStatusField
+
+    class Config:
+        from_attributes = True
+
+
+class PydanticTaskNodeOut(BaseModel):
+    """
+    Модель для вывода задачи как узла дерева задач
+    """
+
+    id: int
+    name: str
+    deadline: datetime | None = None
+    status: TaskStatusField
+    performer_id: int | None = None
+    parent_task_id: int | None = None
 
     class Config:
         from_attributes = True
+
+
+class PydanticTaskPatch(PydanticTaskPut):
+    """
+    Модель для обновления задачи в массовом запросе
+    """
+
+    id: int
+
+
+class PydanticTaskBulkCreate(BaseModel):
+    """
+    Модель для массового создания задач
+    """
+
+    items: list[PydanticTaskCreate] = Field(max_length=TASKS_BULK_MAX_ITEMS)
+
+
+class PydanticTaskBulkUpdate(BaseModel):
+    """
+    Модель для массового обновления задач
+    """
+
+    items: list[PydanticTaskPatch] = Field(max_length=TASKS_BULK_MAX_ITEMS)
+
+
+class PydanticTaskBulkDelete(BaseModel):
+    """
+    Модель для массового удаления задач
+    """
+
+    ids: list[int] = Field(max_length=TASKS_BULK_MAX_ITEMS)
+
+
+class PydanticBulkError(BaseModel):
+    """
+    Модель для вывода ошибки отдельного элемента массового запроса
+    """
+
+    index: int
+    detail: str
+
+
+class PydanticBulkResult(BaseModel):
+    """
+    Модель для вывода результата массового запроса
+    """
+
+    ids: list[int]
+    errors: list[PydanticBulkError]
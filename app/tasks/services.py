@@ -1,47 +1,929 @@
+import heapq
+import re
+from collections import defaultdict
+from datetime import datetime
+
 from fastapi import HTTPException
-from tortoise.expressions import Q
-from tortoise.functions import Count
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise import timezone
+from tortoise.expressions import F
+from tortoise.queryset import QuerySet
+from tortoise.transactions import in_transaction
 
+from app.database import read_connection
 from app.employees.models import Employee
 from app.employees.schemas import EmployeeForTask
-from app.tasks.models import Task
+from app.employees.services import employee_for_task_row_to_json
+from app.tasks.models import ACTIVE_TASK_STATUSES, Task, TaskStatus
+from app.events import task_event
+from app.rows import json_datetime
+from app.sync import record_deletions
+from app.updates import db_value, prepare_update, sql_placeholder, values_sql
+from app.tasks.schemas import PARENT_TASK_FIELDS, TASK_EXPANDABLE, TASK_FIELDS, PydanticTaskCreate, \
+    PydanticTaskPatch
+
+# Количество строк в одном запросе массовой вставки и обновления
+BULK_BATCH_SIZE = 1000
+
+TASK_PATH_PATTERN = re.compile(r'/(\d+/)*')
+
+# Поля задачи, которые выводятся в её подзадачах (PARENT_TASK_FIELDS)
+PARENT_TASK_COLUMNS = frozenset(('name', 'description', 'deadline', 'status', 'performer_id'))
+
+# Поисковый вектор задачи. Выражение должно совпадать с выражением GIN индекса idx_tasks_search
+TASK_SEARCH_CONFIG = 'russian'
+TASK_SEARCH_VECTOR = (f"""(setweight(to_tsvector('{TASK_SEARCH_CONFIG}', "name"), 'A') || """
+                      f"""setweight(to_tsvector('{TASK_SEARCH_CONFIG}', coalesce("description", '')), 'B'))""")
 
 
-async def get_task_or_404(task_id: int) -> Task:
+async def get_task_or_404(task_id: int, prefetch: bool = True) -> Task:
     """
     Получение задачи по идентификатору или исключение, если не найдена
 
     :param task_id: идентификатор задачи
+    :param prefetch: загрузить исполнителя и родительскую задачу
     :return: задача или исключение
     """
 
-    task_obj = await Task.get_or_none(id=task_id).prefetch_related('performer',
-                                                                   'parent_task',
-                                                                   'parent_task__performer')
+    queryset = Task.get_or_none(id=task_id)
+    if prefetch:
+        queryset = queryset.prefetch_related('performer',
+                                             'parent_task',
+                                             'parent_task__performer')
+    task_obj = await queryset
     if task_obj is None:
         raise HTTPException(status_code=404, detail=f'Задача {task_id} не найдена')
     return task_obj
 
 
+def parse_task_fieldset(fields: str | None, expand: str | None) -> tuple[tuple[str, ...], frozenset[str]]:
+    """
+    Разбор параметров fields и expand запроса задач.
+    Идентификатор выводится всегда, раскрытие связи добавляет её в вывод
+
+    :param fields: поля задачи через запятую (по умолчанию все)
+    :param expand: раскрываемые связи через запятую
+    :return: поля задачи в порядке TASK_FIELDS и раскрываемые связи
+    """
+
+    requested = {name.strip() for name in fields.split(',') if name.strip()} if fields else set(TASK_FIELDS)
+    expanded = {name.strip() for name in expand.split(',') if name.strip()} if expand else set()
+    unknown = sorted((requested - set(TASK_FIELDS)) | (expanded - set(TASK_EXPANDABLE)))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f'Неизвестные поля: {", ".join(unknown)}')
+
+    for name in list(expanded):
+        relation = name.split('.')[0]
+        requested.add(relation)
+        expanded.add(relation)
+    requested.add('id')
+    return tuple(name for name in TASK_FIELDS if name in requested), frozenset(expanded)
+
+
+def get_task_columns(fields: tuple[str, ...], order_by: str = 'id') -> list[str]:
+    """
+    Получение столбцов таблицы задач, которые нужно загрузить для вывода полей
+
+    :param fields: поля задачи
+    :param order_by: поле сортировки (нужно для курсора)
+    :return: список столбцов
+    """
+
+    columns = [f'{name}_id' if name in ('performer', 'parent_task') else name for name in fields]
+    if order_by not in columns:
+        columns.append(order_by)
+    return columns
+
+
+async def load_task_fieldset(tasks: list[Task], fields: tuple[str, ...], expand: frozenset[str]) -> list[dict]:
+    """
+    Формирование данных задач только с запрошенными полями.
+    Раскрытые связи загружаются не более чем двумя запросами на всю страницу:
+    родительские задачи и все нужные сотрудники (исполнители задач и родительских задач)
+
+    :param tasks: задачи, загруженные со столбцами из get_task_columns
+    :param fields: поля задачи
+    :param expand: раскрываемые связи
+    :return: список словарей для модели build_task_model(fields, expand)
+    """
+
+    parents = {}
+    if 'parent_task' in expand:
+        parent_ids = {task.parent_task_id for task in tasks if task.parent_task_id is not None}
+        if parent_ids:
+            parent_columns = get_task_columns(PARENT_TASK_FIELDS)
+            parents = {parent['id']: parent for parent in
+                       await Task.filter(id__in=parent_ids).values(*parent_columns)}
+
+    employee_ids = set()
+    if 'performer' in expand:
+        employee_ids.update(task.performer_id for task in tasks)
+    if 'parent_task.performer' in expand:
+        employee_ids.update(parent['performer_id'] for parent in parents.values())
+    employee_ids.discard(None)
+    employees = {}
+    if employee_ids:
+        employees = {employee.id: EmployeeForTask.model_validate(employee)
+                     for employee in await Employee.filter(id__in=employee_ids)}
+
+    def performer_value(performer_id: int | None, expanded: bool):
+        return employees.get(performer_id) if expanded else performer_id
+
+    items = []
+    for task in tasks:
+        item = {name: getattr(task, name) for name in fields if name not in ('performer', 'parent_task')}
+        if 'performer' in fields:
+            item['performer'] = performer_value(task.performer_id, 'performer' in expand)
+        if 'parent_task' in fields:
+            item['parent_task'] = task.parent_task_id
+            parent = parents.get(task.parent_task_id)
+            if 'parent_task' in expand and parent is not None:
+                item['parent_task'] = {**parent, 'performer': performer_value(
+                    parent['performer_id'], 'parent_task.performer' in expand)}
+            elif 'parent_task' in expand:
+                item['parent_task'] = None
+        items.append(item)
+    return items
+
+
+# Задачи с исполнителем, родительской задачей и её исполнителем одним запросом.
+# Из строк этого запроса ответ формируется без создания объектов моделей
+TASK_ROWS_SQL = """
+    SELECT "task"."id", "task"."name", "task"."description", "task"."created_at", "task"."deadline", "task"."status",
+           "performer"."id" AS "performer__id", "performer"."first_name" AS "performer__first_name",
+           "performer"."last_name" AS "performer__last_name", "performer"."father_name" AS "performer__father_name",
+           "performer"."position" AS "performer__position",
+           "parent"."id" AS "parent_task__id", "parent"."name" AS "parent_task__name",
+           "parent"."description" AS "parent_task__description", "parent"."created_at" AS "parent_task__created_at",
+           "parent"."deadline" AS "parent_task__deadline", "parent"."status" AS "parent_task__status",
+           "parent_performer"."id" AS "parent_task__performer__id",
+           "parent_performer"."first_name" AS "parent_task__performer__first_name",
+           "parent_performer"."last_name" AS "parent_task__performer__last_name",
+           "parent_performer"."father_name" AS "parent_task__performer__father_name",
+           "parent_performer"."position" AS "parent_task__performer__position"
+    FROM "tasks" AS "task"
+    LEFT JOIN "employees" AS "performer" ON "performer"."id" = "task"."performer_id"
+    LEFT JOIN "tasks" AS "parent" ON "parent"."id" = "task"."parent_task_id"
+    LEFT JOIN "employees" AS "parent_performer" ON "parent_performer"."id" = "parent"."performer_id"
+    WHERE "task"."id" IN ({ids})
+"""
+
+
+def _task_row_to_json(row: dict, prefix: str) -> dict:
+    """
+    Формирование полей задачи и её исполнителя из строки запроса
+
+    :param row: строка запроса TASK_ROWS_SQL
+    :param prefix: путь к задаче в запросе (пустой для самой задачи)
+    :return: задача для JSON ответа
+    """
+
+    return {
+        'id': row[f'{prefix}id'],
+        'name': row[f'{prefix}name'],
+        'description': row[f'{prefix}description'],
+        'created_at': json_datetime(row[f'{prefix}created_at']),
+        'deadline': json_datetime(row[f'{prefix}deadline']),
+        'status': TaskStatus(row[f'{prefix}status']).label,
+        'performer': employee_for_task_row_to_json(row, f'{prefix}performer__'),
+    }
+
+
+def task_row_to_json(row: dict) -> dict:
+    """
+    Формирование задачи для ответа из строки запроса.
+    Результат совпадает с выводом схемы PydanticTaskOut
+
+    :param row: строка запроса TASK_ROWS_SQL
+    :return: задача для JSON ответа
+    """
+
+    task = _task_row_to_json(row, '')
+    task['parent_task'] = _task_row_to_json(row, 'parent_task__') if row['parent_task__id'] is not None else None
+    return task
+
+
+async def get_task_rows(task_ids: list[int]) -> list[dict]:
+    """
+    Получение задач со связанными объектами в виде строк запроса TASK_ROWS_SQL
+
+    :param task_ids: идентификаторы задач
+    :return: строки в порядке идентификаторов (ненайденные задачи пропускаются)
+    """
+
+    if not task_ids:
+        return []
+    # Идентификаторы - целые числа, поэтому их можно безопасно подставить в запрос
+    query = TASK_ROWS_SQL.format(ids=', '.join(str(int(task_id)) for task_id in task_ids))
+    rows_by_id = {row['id']: row for row in await read_connection().execute_query_dict(query)}
+    return [rows_by_id[task_id] for task_id in task_ids if task_id in rows_by_id]
+
+
+async def get_task_row_or_404(task_id: int) -> dict:
+    """
+    Получение задачи со связанными объектами одним запросом в виде строки
+
+    :param task_id: идентификатор задачи
+    :return: строка запроса TASK_ROWS_SQL или исключение, если задача не найдена
+    """
+
+    rows = await get_task_rows([task_id])
+    if not rows:
+        raise HTTPException(status_code=404, detail=f'Задача {task_id} не найдена')
+    return rows[0]
+
+
+def get_child_path(parent_task: Task | None) -> str:
+    """
+    Получение пути для дочерней задачи
+
+    :param parent_task: родительская задача или None
+    :return: путь от корня дерева задач
+    """
+
+    if parent_task is None:
+        return '/'
+    return f'{parent_task.path}{parent_task.id}/'
+
+
+def is_in_subtree(task_id: int, path: str) -> bool:
+    """
+    Проверка, находится ли задача с указанным путём в поддереве задачи (за O(глубины))
+
+    :param task_id: идентификатор корня поддерева
+    :param path: путь проверяемой задачи
+    :return: ответ в формате bool
+    """
+
+    return f'/{task_id}/' in path
+
+
+async def move_subtree(old_prefix: str, new_prefix: str, connection: BaseDBAsyncClient) -> dict[int, dict]:
+    """
+    Замена начала пути у всех задач поддерева одним запросом
+
+    :param old_prefix: старое начало пути (путь корня поддерева вместе с его идентификатором)
+    :param new_prefix: новое начало пути
+    :param connection: соединение текущей транзакции
+    :return: исполнитель и путь до переноса по идентификаторам перенесённых задач (для событий)
+    """
+
+    # Пути состоят только из цифр и "/", поэтому их можно безопасно подставить в запрос
+    if not TASK_PATH_PATTERN.fullmatch(old_prefix) or not TASK_PATH_PATTERN.fullmatch(new_prefix):
+        raise ValueError(f'Некорректный путь задачи: {old_prefix!r}, {new_prefix!r}')
+    query = f"""
+        UPDATE "tasks" SET "path" = '{new_prefix}' || substr("path", {len(old_prefix) + 1})
+        WHERE "path" LIKE '{old_prefix}%'
+    """
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(f'{query} RETURNING "id", "performer_id", "path"')
+        return {row['id']: {'performer_id': row['performer_id'], 'path': old_prefix + row['path'][len(new_prefix):]}
+                for row in rows}
+
+    rows = await Task.filter(path__startswith=old_prefix).using_db(connection).values('id', 'performer_id', 'path')
+    if rows:
+        await connection.execute_query(query)
+    return {row['id']: {'performer_id': row['performer_id'], 'path': row['path']} for row in rows}
+
+
+async def move_subtrees(prefixes: dict[str, str], connection: BaseDBAsyncClient) -> dict[int, dict]:
+    """
+    Замена начала пути у задач нескольких поддеревьев за один проход: поддеревья читаются одним запросом,
+    новые пути записываются запросами UPDATE ... FROM (VALUES ...) по BULK_BATCH_SIZE задач.
+    Для задачи из вложенных поддеревьев используется самое длинное из подходящих начал пути
+
+    :param prefixes: новые начала пути по старым (путь корня поддерева вместе с его идентификатором)
+    :param connection: соединение текущей транзакции
+    :return: исполнитель и путь до переноса по идентификаторам перенесённых задач (для событий)
+    """
+
+    prefixes = {old: new for old, new in prefixes.items() if old != new}
+    for prefix in (*prefixes, *prefixes.values()):
+        if not TASK_PATH_PATTERN.fullmatch(prefix):
+            raise ValueError(f'Некорректный путь задачи: {prefix!r}')
+    # Вложенные поддеревья читаются вместе с внешним: строки с общим началом идут в сортировке подряд
+    roots = []
+    for prefix in sorted(prefixes):
+        if not roots or not prefix.startswith(roots[-1]):
+            roots.append(prefix)
+    if not roots:
+        return {}
+
+    # Пути состоят только из цифр и "/", поэтому их можно безопасно подставить в запрос
+    rows = []
+    for start in range(0, len(roots), BULK_BATCH_SIZE):
+        condition = ' OR '.join(f""""path" LIKE '{root}%'""" for root in roots[start:start + BULK_BATCH_SIZE])
+        rows.extend(await connection.execute_query_dict(
+            f'SELECT "id", "performer_id", "path" FROM "tasks" WHERE {condition}'))
+
+    paths = {}
+    for row in rows:
+        path = row['path']
+        end = len(path)
+        while path[:end] not in prefixes:
+            end = path.rindex('/', 0, end - 1) + 1
+        paths[row['id']] = prefixes[path[:end]] + path[end:]
+
+    postgres = connection.capabilities.dialect == 'postgres'
+    items = list(paths.items())
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        params = []
+        values = values_sql(Task, ['id', 'path'], items[start:start + BULK_BATCH_SIZE], connection, params)
+        if postgres:
+            query = f"""
+                UPDATE "tasks" AS "task" SET "path" = "v"."path" FROM ({values}) AS "v"("id", "path")
+                WHERE "task"."id" = "v"."id"
+            """
+        else:
+            query = f"""
+                WITH "v"("id", "path") AS ({values})
+                UPDATE "tasks" SET "path" = "v"."path" FROM "v" WHERE "tasks"."id" = "v"."id"
+            """
+        await connection.execute_query(query, params)
+    return {row['id']: {'performer_id': row['performer_id'], 'path': row['path']} for row in rows}
+
+
+async def detach_subtasks(task_ids: list[int], connection: BaseDBAsyncClient) -> None:
+    """
+    Отвязка подзадач от удаляемых задач с отметкой времени изменения,
+    чтобы подзадачи попали в синхронизацию изменений
+
+    :param task_ids: идентификаторы удаляемых задач
+    :param connection: соединение текущей транзакции
+    """
+
+    await Task.filter(parent_task_id__in=task_ids).exclude(id__in=task_ids).using_db(connection).update(
+        parent_task_id=None, updated_at=timezone.now())
+
+
+async def touch_subtasks(task_ids: list[int], connection: BaseDBAsyncClient) -> None:
+    """
+    Отметка времени изменения у подзадач, в которых выводятся изменённые задачи,
+    чтобы подзадачи попали в синхронизацию изменений (по BULK_BATCH_SIZE задач за запрос)
+
+    :param task_ids: идентификаторы изменённых задач
+    :param connection: соединение текущей транзакции
+    """
+
+    for start in range(0, len(task_ids), BULK_BATCH_SIZE):
+        await Task.filter(parent_task_id__in=task_ids[start:start + BULK_BATCH_SIZE]).using_db(connection).update(
+            updated_at=timezone.now())
+
+
+def set_parent_task(task_obj: Task, parent_task: Task | None) -> None:
+    """
+    Назначение родительской задачи с проверкой на циклы.
+    Новый путь задачи устанавливается в объекте, пути её поддерева нужно обновить
+    функцией move_subtree после сохранения
+
+    :param task_obj: задача
+    :param parent_task: новая родительская задача или None
+    """
+
+    if parent_task is not None:
+        if parent_task.id == task_obj.id:
+            raise HTTPException(status_code=400, detail="Нельзя указывать в качестве родительской задачи саму себя")
+        if is_in_subtree(task_obj.id, parent_task.path):
+            raise HTTPException(status_code=400,
+                                detail="Нельзя указывать в качестве родительской задачи подзадачу этой же задачи")
+    task_obj.parent_task = parent_task
+    task_obj.path = get_child_path(parent_task)
+
+
+async def get_task_references(performer_id: int | None, parent_task_id: int | None,
+                              connection: BaseDBAsyncClient) -> tuple[bool, str | None]:
+    """
+    Проверка существования исполнителя и родительской задачи одним запросом.
+    В PostgreSQL строка родительской задачи блокируется (FOR UPDATE) до конца транзакции, поэтому её путь
+    не изменится одновременным переносом, пока задача переносится к ней
+
+    :param performer_id: идентификатор исполнителя или None
+    :param parent_task_id: идентификатор родительской задачи или None
+    :param connection: соединение текущей транзакции
+    :return: кортеж из признака существования исполнителя и пути родительской задачи (None, если не найдена)
+    """
+
+    lock = ' FOR UPDATE' if connection.capabilities.dialect == 'postgres' else ''
+    rows = await connection.execute_query_dict(f"""
+        SELECT (SELECT 1 FROM "employees" WHERE "id" = {sql_placeholder(connection, 1)}) AS "performer",
+               (SELECT "path" FROM "tasks" WHERE "id" = {sql_placeholder(connection, 2)}{lock}) AS "parent_path"
+    """, [performer_id, parent_task_id])
+    return rows[0]['performer'] is not None, rows[0]['parent_path']
+
+
+async def update_task_row(task_id: int, values: dict,
+                          connection: BaseDBAsyncClient) -> tuple[Task, dict] | None:
+    """
+    Обновление переданных полей задачи с получением её состояния до изменения.
+    В PostgreSQL выполняется одним запросом UPDATE ... RETURNING, который блокирует строку.
+    При изменении parent_task_id путь задачи вычисляется в том же запросе по актуальному пути родительской задачи,
+    пути поддерева нужно обновить отдельно. При изменении полей, которые выводятся в подзадачах, у подзадач
+    обновляется время изменения
+
+    :param task_id: идентификатор задачи
+    :param values: новые значения по названиям полей модели
+    :param connection: соединение текущей транзакции
+    :return: кортеж из обновлённой задачи и исполнителя, статуса и пути до изменения или None, если задача не найдена
+    """
+
+    assignments, params = prepare_update(Task, values, connection)
+    if 'parent_task_id' in values:
+        params.append(values['parent_task_id'])
+        assignments.append(f"""
+            "path" = COALESCE((SELECT "parent"."path" || "parent"."id" || '/' FROM "tasks" AS "parent"
+                               WHERE "parent"."id" = {sql_placeholder(connection, len(params))}), '/')""")
+    params.append(task_id)
+    task_id_param = sql_placeholder(connection, len(params))
+
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(f"""
+            UPDATE "tasks" AS "task" SET {", ".join(assignments)}
+            FROM (SELECT "id", "performer_id", "status", "path" FROM "tasks"
+                  WHERE "id" = {task_id_param} FOR UPDATE) AS "old"
+            WHERE "task"."id" = "old"."id"
+            RETURNING "task".*, "old"."performer_id" AS "old_performer_id", "old"."status" AS "old_status",
+                      "old"."path" AS "old_path"
+        """, params)
+        if not rows:
+            return None
+        row = rows[0]
+        before = {'performer_id': row.pop('old_performer_id'), 'status': TaskStatus(row.pop('old_status')),
+                  'path': row.pop('old_path')}
+        task_obj = Task._init_from_db(**row)
+    else:
+        before = await Task.filter(id=task_id).using_db(connection).first().values('performer_id', 'status', 'path')
+        if before is None:
+            return None
+        await connection.execute_query(f'UPDATE "tasks" SET {", ".join(assignments)} WHERE "id" = {task_id_param}',
+                                       params)
+        task_obj = await Task.get(id=task_id).using_db(connection)
+
+    if not PARENT_TASK_COLUMNS.isdisjoint(values):
+        await touch_subtasks([task_id], connection)
+    return task_obj, before
+
+
+async def lock_task_paths(task_ids: set[int], connection: BaseDBAsyncClient) -> dict[int, str]:
+    """
+    Получение путей задач в текущей транзакции. В PostgreSQL строки блокируются (FOR UPDATE) до конца транзакции,
+    поэтому пути не изменятся одновременными переносами
+
+    :param task_ids: идентификаторы задач
+    :param connection: соединение текущей транзакции
+    :return: пути найденных задач по их идентификаторам
+    """
+
+    if not task_ids:
+        return {}
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict('SELECT "id", "path" FROM "tasks" WHERE "id" = ANY($1) FOR UPDATE',
+                                                   [list(task_ids)])
+    else:
+        rows = await Task.filter(id__in=list(task_ids)).using_db(connection).values('id', 'path')
+    return {row['id']: row['path'] for row in rows}
+
+
+def plan_task_moves(moves: dict[int, int | None], paths: dict[int, str]) -> tuple[dict[int, str], set[int]]:
+    """
+    Вычисление путей переносимых задач в дереве, которое получится после всех переносов запроса.
+    Путь задачи зависит от нового пути родительской задачи, если она тоже переносится,
+    или от нового пути ближайшего переносимого предка родительской задачи.
+    Перенос, который помещает задачу в её же поддерево, отклоняется, а остальные переносы вычисляются без него.
+    Цикл из нескольких переносов - ошибка 409 для всего запроса
+
+    :param moves: идентификаторы новых родительских задач (None - задача становится корневой)
+        по идентификаторам переносимых задач
+    :param paths: текущие пути переносимых задач и новых родительских задач
+    :return: кортеж из новых путей по идентификаторам переносимых задач и множества отклонённых переносов
+    """
+
+    moves, rejected = dict(moves), set()
+
+    def moved_ancestor(task_id: int) -> int | None:
+        for ancestor in reversed(paths[task_id].strip('/').split('/')):
+            if ancestor and int(ancestor) in moves:
+                return int(ancestor)
+        return None
+
+    def dependency(task_id: int) -> int | None:
+        parent_task_id = moves[task_id]
+        if parent_task_id is None or parent_task_id in moves:
+            return parent_task_id
+        return moved_ancestor(parent_task_id)
+
+    def new_path(task_id: int, planned: dict[int, str]) -> str:
+        parent_task_id = moves[task_id]
+        if parent_task_id is None:
+            return '/'
+        if parent_task_id in moves:
+            return f'{planned[parent_task_id]}{parent_task_id}/'
+        parent_path, ancestor = paths[parent_task_id], moved_ancestor(parent_task_id)
+        if ancestor is not None:
+            parent_path = planned[ancestor] + parent_path[parent_path.index(f'/{ancestor}/') + 1:]
+        return f'{parent_path}{parent_task_id}/'
+
+    def plan() -> tuple[dict[int, str], int | None]:
+        planned = {}
+        for task_id in moves:
+            stack = [task_id]
+            while stack:
+                current = stack[-1]
+                required = dependency(current)
+                if required is not None and required not in planned:
+                    if required not in stack:
+                        stack.append(required)
+                        continue
+                    cycle = stack[stack.index(required):]
+                    if len(cycle) == 1:
+                        return planned, required
+                    raise HTTPException(status_code=409, detail=f'Переносы задач {", ".join(map(str, sorted(cycle)))} '
+                                                                f'образуют цикл')
+                planned[current] = new_path(current, planned)
+                stack.pop()
+        return planned, None
+
+    while True:
+        planned, rejected_id = plan()
+        if rejected_id is None:
+            return planned, rejected
+        rejected.add(rejected_id)
+        del moves[rejected_id]
+
+
+async def update_task_rows(values_by_id: dict[int, dict],
+                           connection: BaseDBAsyncClient) -> dict[int, tuple[dict, dict]]:
+    """
+    Обновление переданных полей нескольких задач: один запрос UPDATE ... FROM (VALUES ...) на каждые
+    BULK_BATCH_SIZE задач с одинаковым набором изменяемых полей.
+    В PostgreSQL состояние до изменения возвращается тем же запросом из подзапроса, который блокирует строки
+    (FOR UPDATE). Пути поддеревьев переносимых задач нужно обновить отдельно
+
+    :param values_by_id: новые значения по названиям полей модели по идентификаторам задач
+    :param connection: соединение текущей транзакции
+    :return: исполнитель, статус и путь после и до изменения по идентификаторам найденных задач
+    """
+
+    groups = defaultdict(list)
+    for task_id, values in values_by_id.items():
+        groups[tuple(sorted(values))].append(task_id)
+
+    updated_at = timezone.now()
+    states = {}
+    for names, task_ids in groups.items():
+        for start in range(0, len(task_ids), BULK_BATCH_SIZE):
+            batch = task_ids[start:start + BULK_BATCH_SIZE]
+            rows = [[task_id, *(values_by_id[task_id][name] for name in names)] for task_id in batch]
+            columns = [Task._meta.fields_db_projection[name] for name in ('id', *names)]
+            params = []
+            values = values_sql(Task, ['id', *names], rows, connection, params)
+            params.append(db_value(Task, 'updated_at', updated_at, connection))
+            assignments = ', '.join([f'"updated_at" = {sql_placeholder(connection, len(params))}',
+                                     *(f'"{column}" = "v"."{column}"' for column in columns[1:])])
+            columns = ', '.join(f'"{column}"' for column in columns)
+
+            if connection.capabilities.dialect == 'postgres':
+                params.append(batch)
+                result = await connection.execute_query_dict(f"""
+                    UPDATE "tasks" AS "task" SET {assignments}
+                    FROM ({values}) AS "v"({columns}),
+                         (SELECT "id", "performer_id", "status", "path" FROM "tasks"
+                          WHERE "id" = ANY({sql_placeholder(connection, len(params))}) FOR UPDATE) AS "old"
+                    WHERE "task"."id" = "v"."id" AND "old"."id" = "v"."id"
+                    RETURNING "task"."id", "task"."performer_id", "task"."status", "task"."path",
+                              "old"."performer_id" AS "old_performer_id", "old"."status" AS "old_status",
+                              "old"."path" AS "old_path"
+                """, params)
+                for row in result:
+                    states[row['id']] = (
+                        {'performer_id': row['performer_id'], 'status': TaskStatus(row['status']), 'path': row['path']},
+                        {'performer_id': row['old_performer_id'], 'status': TaskStatus(row['old_status']),
+                         'path': row['old_path']})
+                continue
+
+            before = await Task.filter(id__in=batch).using_db(connection).values('id', 'performer_id', 'status', 'path')
+            if before:
+                await connection.execute_query(f"""
+                    WITH "v"({columns}) AS ({values})
+                    UPDATE "tasks" SET {assignments}
+                    FROM "v" WHERE "tasks"."id" = "v"."id"
+                """, params)
+            for row in before:
+                task_id = row.pop('id')
+                after = {**row, **{name: values_by_id[task_id][name] for name in row if name in values_by_id[task_id]}}
+                states[task_id] = (after, row)
+    return states
+
+
+async def patch_task(task_id: int, task_data: dict) -> tuple[Task, dict, dict[int, dict]]:
+    """
+    Обновление переданных полей задачи без предварительной загрузки.
+    В PostgreSQL задача обновляется одним запросом UPDATE ... RETURNING (update_task_row), который блокирует строку
+    и возвращает состояние до изменения для счётчиков, переноса поддерева и событий
+
+    :param task_id: идентификатор задачи
+    :param task_data: изменяемые поля задачи
+    :return: кортеж из обновлённой задачи, исполнителя и пути задачи до изменения
+        и исполнителя и пути до переноса по идентификаторам перенесённых вместе с ней подзадач
+    """
+
+    performer_id, parent_task_id = task_data.get('performer'), task_data.get('parent_task')
+    if parent_task_id == task_id:
+        raise HTTPException(status_code=400, detail="Нельзя указывать в качестве родительской задачи саму себя")
+
+    values = {}
+    for key, value in task_data.items():
+        if key in ('performer', 'parent_task'):
+            key, value = f'{key}_id', value or None
+        values[key] = value
+
+    async with in_transaction() as connection:
+        # Путь родительской задачи проверяется в транзакции переноса по заблокированной строке,
+        # иначе одновременный перенос родительской задачи в поддерево этой задачи образовал бы цикл
+        if performer_id or parent_task_id:
+            performer_exists, parent_path = await get_task_references(performer_id, parent_task_id, connection)
+            if performer_id and not performer_exists:
+                raise HTTPException(status_code=404, detail=f'Сотрудник {performer_id} не найден')
+            if parent_task_id and parent_path is None:
+                raise HTTPException(status_code=404, detail=f'Задача {parent_task_id} не найдена')
+            if parent_task_id and is_in_subtree(task_id, parent_path):
+                raise HTTPException(status_code=400,
+                                    detail="Нельзя указывать в качестве родительской задачи подзадачу этой же задачи")
+
+        updated = await update_task_row(task_id, values, connection)
+        if updated is None:
+            raise HTTPException(status_code=404, detail=f'Задача {task_id} не найдена')
+        task_obj, before = updated
+
+        await update_task_counters((before['performer_id'], before['status']),
+                                   (task_obj.performer_id, task_obj.status), connection)
+        moved = {}
+        if task_obj.path != before['path']:
+            moved = await move_subtree(f"{before['path']}{task_id}/", get_child_path(task_obj), connection)
+
+    return task_obj, {'performer_id': before['performer_id'], 'path': before['path']}, moved
+
+
+async def delete_task_rows(task_ids: list[int], connection: BaseDBAsyncClient) -> list[dict]:
+    """
+    Удаление задач с получением удалённых строк.
+    В PostgreSQL выполняется одним запросом DELETE ... RETURNING, поэтому возвращаются только строки,
+    удалённые этим запросом, а не одновременно другим
+
+    :param task_ids: идентификаторы задач
+    :param connection: соединение текущей транзакции
+    :return: удалённые строки задач
+    """
+
+    if not task_ids:
+        return []
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict('DELETE FROM "tasks" WHERE "id" = ANY($1) RETURNING *', [task_ids])
+        for row in rows:
+            row['status'] = TaskStatus(row['status'])
+        return rows
+
+    rows = await Task.filter(id__in=task_ids).using_db(connection).values()
+    if rows:
+        placeholders = ', '.join('?' for _ in rows)
+        await connection.execute_query(f'DELETE FROM "tasks" WHERE "id" IN ({placeholders})',
+                                       [row['id'] for row in rows])
+    return rows
+
+
+async def delete_task(task_id: int) -> tuple[Task, dict[int, dict]]:
+    """
+    Удаление задачи без предварительной загрузки. Подзадачи удаляемой задачи становятся корневыми.
+    Счётчики исполнителя изменяются по состоянию удалённой строки (delete_task_rows),
+    поэтому одновременное удаление или изменение задачи их не искажает
+
+    :param task_id: идентификатор задачи
+    :return: кортеж из удалённой задачи и исполнителя и пути до переноса по идентификаторам её подзадач
+    """
+
+    async with in_transaction() as connection:
+        await detach_subtasks([task_id], connection)
+        rows = await delete_task_rows([task_id], connection)
+        # Задача уже удалена: откат транзакции вместе с отвязкой подзадач, счётчики не изменяются
+        if not rows:
+            raise HTTPException(status_code=404, detail=f'Задача {task_id} не найдена')
+
+        task_obj = Task._init_from_db(**rows[0])
+        moved = await move_subtree(get_child_path(task_obj), '/', connection)
+        await record_deletions('tasks', [task_id], connection)
+        await update_task_counters((task_obj.performer_id, task_obj.status), None, connection)
+    return task_obj, moved
+
+
+async def get_subtree(task_obj: Task) -> list[Task]:
+    """
+    Получение всех подзадач задачи на любой глубине одним запросом по индексу пути
+
+    :param task_obj: задача
+    :return: список подзадач, упорядоченный по пути
+    """
+
+    return await Task.filter(path__startswith=get_child_path(task_obj)).order_by('path', 'id')
+
+
+async def get_ancestors(task_obj: Task) -> list[Task]:
+    """
+    Получение всех предков задачи одним запросом, от корня дерева к родительской задаче
+
+    :param task_obj: задача
+    :return: список предков
+    """
+
+    ancestor_ids = [int(task_id) for task_id in task_obj.path.strip('/').split('/') if task_id]
+    if not ancestor_ids:
+        return []
+    ancestors = {task.id: task for task in await Task.filter(id__in=ancestor_ids)}
+    return [ancestors[task_id] for task_id in ancestor_ids if task_id in ancestors]
+
+
+async def rebuild_task_paths() -> None:
+    """
+    Пересчёт путей всех задач по ссылкам на родительские задачи.
+    Задачи, образующие цикл, становятся корневыми
+    """
+
+    parents = dict(await Task.all().values_list('id', 'parent_task_id'))
+    children = defaultdict(list)
+    for task_id, parent_task_id in parents.items():
+        children[parent_task_id].append(task_id)
+
+    paths = {}
+    stack = [(task_id, '/') for task_id in children[None]]
+    while stack:
+        task_id, path = stack.pop()
+        paths[task_id] = path
+        stack.extend((child_id, f'{path}{task_id}/') for child_id in children[task_id])
+
+    tasks = [Task(id=task_id, path=paths.get(task_id, '/'), parent_task_id=parent_task_id if task_id in paths else None)
+             for task_id, parent_task_id in parents.items()]
+    async with in_transaction() as connection:
+        await Task.bulk_update(tasks, fields=['path', 'parent_task_id'], batch_size=BULK_BATCH_SIZE,
+                               using_db=connection)
+
+
+async def update_task_counters(before: tuple[int | None, TaskStatus] | None,
+                               after: tuple[int | None, TaskStatus] | None,
+                               connection: BaseDBAsyncClient) -> None:
+    """
+    Обновление счётчиков задач у исполнителей при изменении задачи.
+    Должно вызываться в той же транзакции, что и запись задачи
+
+    :param before: исполнитель и статус задачи до изменения (None, если задача создаётся)
+    :param after: исполнитель и статус задачи после изменения (None, если задача удаляется)
+    :param connection: соединение текущей транзакции
+    """
+
+    await update_tasks_counters([(before, after)], connection)
+
+
+async def update_tasks_counters(changes: list[tuple[tuple[int | None, TaskStatus] | None, tuple[int | None, TaskStatus] | None]],
+                                connection: BaseDBAsyncClient) -> None:
+    """
+    Обновление счётчиков задач у исполнителей при изменении нескольких задач.
+    Сотрудники с одинаковым изменением счётчиков обновляются одним запросом
+
+    :param changes: список пар (исполнитель и статус до изменения, исполнитель и статус после изменения)
+    :param connection: соединение текущей транзакции
+    """
+
+    deltas = defaultdict(lambda: [0, 0])
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None or state[0] is None:
+                continue
+            performer_id, status = state
+            deltas[performer_id][1] += sign
+            if status != TaskStatus.COMPLETED:
+                deltas[performer_id][0] += sign
+
+    employees_by_delta = defaultdict(list)
+    for performer_id, (active_delta, total_delta) in deltas.items():
+        if active_delta or total_delta:
+            employees_by_delta[(active_delta, total_delta)].append(performer_id)
+
+    for (active_delta, total_delta), performer_ids in employees_by_delta.items():
+        await Employee.filter(id__in=performer_ids).using_db(connection).update(
+            active_task_count=F('active_task_count') + active_delta,
+            total_task_count=F('total_task_count') + total_delta
+        )
+
+
+def filter_tasks(queryset: QuerySet, statuses: list[TaskStatus] | None = None, performer: int | None = None,
+                 parent_task: int | None = None, deadline_from: datetime | None = None,
+                 deadline_to: datetime | None = None, overdue: bool = False, unassigned: bool = False) -> QuerySet:
+    """
+    Применение фильтров списка задач к запросу. Все условия объединяются через И
+    и выполняются на стороне базы данных
+
+    :param queryset: исходный запрос
+    :param statuses: допустимые статусы задачи
+    :param performer: идентификатор исполнителя
+    :param parent_task: идентификатор родительской задачи
+    :param deadline_from: срок не раньше указанного
+    :param deadline_to: срок не позже указанного
+    :param overdue: только незавершённые задачи с истёкшим сроком
+    :param unassigned: только задачи без исполнителя
+    :return: отфильтрованный запрос
+    """
+
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    if performer is not None:
+        queryset = queryset.filter(performer_id=performer)
+    if parent_task is not None:
+        queryset = queryset.filter(parent_task_id=parent_task)
+    if deadline_from is not None:
+        queryset = queryset.filter(deadline__gte=deadline_from)
+    if deadline_to is not None:
+        queryset = queryset.filter(deadline__lte=deadline_to)
+    if overdue:
+        queryset = queryset.filter(status__in=ACTIVE_TASK_STATUSES, deadline__lt=timezone.now())
+    if unassigned:
+        queryset = queryset.filter(performer_id__isnull=True)
+    return queryset
+
+
+async def search_tasks(query: str, limit: int, offset: int = 0) -> list[Task]:
+    """
+    Полнотекстовый поиск задач по названию и описанию, результаты упорядочены по релевантности.
+    В PostgreSQL используется tsvector с GIN индексом по выражению TASK_SEARCH_VECTOR,
+    совпадение в названии весит больше, чем в описании.
+    В остальных СУБД (SQLite в тестах) поиск выполняется в памяти: все слова запроса
+    должны быть началом какого-либо слова задачи
+
+    :param query: поисковый запрос
+    :param limit: количество задач
+    :param offset: количество пропускаемых задач
+    :return: список найденных задач
+    """
+
+    connection = read_connection()
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(f"""
+            SELECT "id" FROM "tasks", websearch_to_tsquery('{TASK_SEARCH_CONFIG}', $1) AS "query"
+            WHERE {TASK_SEARCH_VECTOR} @@ "query"
+            ORDER BY ts_rank({TASK_SEARCH_VECTOR}, "query") DESC, "id"
+            LIMIT $2 OFFSET $3
+        """, [query, limit, offset])
+        ids = [row['id'] for row in rows]
+    else:
+        words = re.findall(r'\w+', query.lower())
+        ranked = []
+        for row in await Task.all().values('id', 'name', 'description'):
+            name_words = re.findall(r'\w+', row['name'].lower())
+            description_words = re.findall(r'\w+', (row['description'] or '').lower())
+            rank = 0
+            for word in words:
+                name_hits = sum(item.startswith(word) for item in name_words)
+                description_hits = sum(item.startswith(word) for item in description_words)
+                if not name_hits and not description_hits:
+                    break
+                rank += 2 * name_hits + description_hits
+            else:
+                if words:
+                    ranked.append((-rank, row['id']))
+        ids = [task_id for _, task_id in sorted(ranked)[offset:offset + limit]]
+
+    tasks = {task.id: task for task in await Task.filter(id__in=ids).prefetch_related('performer',
+                                                                                       'parent_task',
+                                                                                       'parent_task__performer')}
+    return [tasks[task_id] for task_id in ids if task_id in tasks]
+
+
+async def get_task_events(event_type: str, task_ids: list[int], previous: dict[int, dict] | None = None) -> list[dict]:
+    """
+    Формирование событий для нескольких задач одним запросом
+
+    :param event_type: тип события (created, updated, deleted)
+    :param task_ids: идентификаторы задач
+    :param previous: исполнитель и путь до изменения по идентификаторам задач
+    :return: список событий
+    """
+
+    if not task_ids:
+        return []
+    tasks = await Task.filter(id__in=task_ids).values('id', 'name', 'status', 'deadline', 'performer_id',
+                                                     'parent_task_id', 'path')
+    return [task_event(event_type, task, previous.get(task['id']) if previous else None) for task in tasks]
+
+
 async def get_least_busy_employees() -> tuple[list[EmployeeForTask], int]:
     """
     Получение минимального количества задач у сотрудников и списка сотрудников с этим количеством задач
 
     :return: кортеж, состоящий из списка сотрудников и минимального количества задач
     """
-    employee_task_counts = await Employee.annotate(
-        unfinished_task_count=Count('taskss', _filter=Q(taskss__status__not='completed'))
-    ).values('id', 'unfinished_task_count')
 
-    if not employee_task_counts:
+    least_busy = await Employee.all().order_by('active_task_count').first()
+    if least_busy is None:
         return [], 0
 
-    min_task_count = min(emp['unfinished_task_count'] or 0 for emp in employee_task_counts)
-
-    least_loaded_employee_ids = [emp['id'] for emp in employee_task_counts
-                                 if emp['unfinished_task_count'] == min_task_count]
-
-    least_loaded_employees = await Employee.filter(id__in=least_loaded_employee_ids).all()
+    min_task_count = least_busy.active_task_count
+    least_loaded_employees = await Employee.filter(active_task_count=min_task_count)
 
     return [EmployeeForTask.model_validate(emp) for emp in least_loaded_employees], min_task_count
 
@@ -52,15 +934,12 @@ async def get_free_employees() -> list[EmployeeForTask]:
 
     :return: список свободных сотрудников
     """
-    employees = await Employee.annotate(
-        task_count=Count('taskss'),
-        completed_task_count=Count('taskss', _filter=Q(taskss__status='completed'))
-    )
-    return [EmployeeForTask.model_validate(emp) for emp in employees
-            if emp.task_count == 0 or emp.task_count == emp.completed_task_count]
 
+    employees = await Employee.filter(active_task_count=0)
+    return [EmployeeForTask.model_validate(emp) for emp in employees]
 
-async def get_available_employee(task: Task, min_task_count: int) -> EmployeeForTask | None:
+
+def get_available_employee(performer: Employee | None, min_task_count: int) -> EmployeeForTask | None:
     """
     Получение доступного сотрудника для задачи
     Здесь мы сравниваем количество задач у сотрудника,
@@ -68,19 +947,409 @@ async def get_available_employee(task: Task, min_task_count: int) -> EmployeeFor
     Если у сотрудника, выполняющего родительскую задачу на две или меньше задач меньше,
     чем минимальное по списку сотрудников, то мы возвращаем его. Иначе - None
 
-    :param task: объект задачи
+    :param performer: исполнитель родительской задачи
     :param min_task_count: минимальное количество задач
     :return: объект сотрудника или None
     """
 
-    if task.parent_task_id and task.parent_task and task.parent_task.performer_id:
-        performer = await Employee.get(id=task.parent_task.performer_id)
-        performer_task_count = await Task.filter(
-            performer=performer,
-            status__not='completed'
-        ).count()
+    if performer is not None and performer.active_task_count - min_task_count <= 2:
+        return EmployeeForTask.model_validate(performer)
+
+    return None
+
+
+async def fetch_important_tasks() -> list[dict]:
+    """
+    Получение важных задач вместе с исполнителем родительской задачи одним запросом
+
+    :return: список задач в виде словарей
+    """
+
+    return await Task.filter(
+        status__in=ACTIVE_TASK_STATUSES,
+        parent_task_id__isnull=False,
+        performer_id__isnull=True,
+        parent_task__performer_id__isnull=False
+    ).values('id', 'name', 'deadline', 'parent_task_id', 'status',
+             parent_performer_id='parent_task__performer_id')
+
+
+async def get_important_tasks() -> list[dict]:
+    """
+    Получение списка важных задач с подходящими исполнителями.
+    Выполняет постоянное число запросов к базе, подбор исполнителей происходит в памяти
+
+    :return: список задач в формате [{Важная задача, Срок, [ФИО сотрудника]}]
+    """
+
+    tasks = await fetch_important_tasks()
+
+    if not tasks:
+        return []
+
+    important_tasks = []
+
+    free_employees = await get_free_employees()
+    if free_employees:
+        for task in tasks:
+            important_tasks.append({
+                "id": task['id'],
+                "name": task['name'],
+                "deadline": task['deadline'],
+                "parent_task": task['parent_task_id'],
+                "status": task['status'].label,
+                "available_employees": free_employees
+            })
+        return important_tasks
+
+    least_loaded_employees, min_task_count = await get_least_busy_employees()
+    parent_performers = await Employee.filter(
+        id__in=list({task['parent_performer_id'] for task in tasks}))
+    performers_by_id = {emp.id: emp for emp in parent_performers}
+    for task in tasks:
+        parent_performer = get_available_employee(performers_by_id.get(task['parent_performer_id']),
+                                                  min_task_count)
+        important_tasks.append({
+            "id": task['id'],
+            "name": task['name'],
+            "deadline": task['deadline'],
+            "parent_task": task['parent_task_id'],
+            "status": task['status'].label,
+            "available_employee": parent_performer if parent_performer else least_loaded_employees
+        })
+
+    return important_tasks
+
+
+def deadline_order(task: dict) -> tuple:
+    """
+    Ключ сортировки задач по сроку: сначала задачи с ближайшим сроком, задачи без срока в конце
+
+    :param task: задача в виде словаря
+    :return: ключ сортировки
+    """
+
+    return task['deadline'] is None, task['deadline'] or 0, task['id']
+
+
+def distribute_important_tasks(tasks: list[dict], loads: dict[int, int]) -> dict[int, int]:
+    """
+    Распределение важных задач между сотрудниками с учётом их текущей загрузки.
+    Задачи обрабатываются по возрастанию срока. Сотрудники хранятся в куче по числу
+    незавершённых задач, с учётом уже распределённых в этом расчёте задач.
+    Пока есть полностью свободные сотрудники, задача достаётся одному из них.
+    Иначе задача достаётся исполнителю родительской задачи, если у него не более чем на две задачи больше
+    минимального числа, либо наименее загруженному сотруднику.
+    Сложность O((T + E) log E), где T - количество задач, E - количество сотрудников
+
+    :param tasks: важные задачи (словари с ключами id, deadline, parent_performer_id)
+    :param loads: количество незавершённых задач по идентификаторам сотрудников
+    :return: идентификаторы предложенных исполнителей по идентификаторам задач
+    """
+
+    loads = dict(loads)
+    heap = [(load, employee_id) for employee_id, load in loads.items()]
+    heapq.heapify(heap)
+    assignments = {}
+
+    for task in sorted(tasks, key=deadline_order):
+        # Записи кучи с устаревшей загрузкой пропускаются
+        while heap and heap[0][0] != loads[heap[0][1]]:
+            heapq.heappop(heap)
+        if not heap:
+            break
+
+        min_task_count, employee_id = heap[0]
+        parent_performer_id = task['parent_performer_id']
+        if min_task_count > 0 and parent_performer_id in loads \
+                and loads[parent_performer_id] - min_task_count <= 2:
+            employee_id = parent_performer_id
+
+        loads[employee_id] += 1
+        heapq.heappush(heap, (loads[employee_id], employee_id))
+        assignments[task['id']] = employee_id
+
+    return assignments
+
+
+async def assign_unassigned_tasks(assignments: dict[int, int], connection: BaseDBAsyncClient) -> list[dict]:
+    """
+    Назначение исполнителей задачам, у которых его ещё нет, одним запросом UPDATE ... FROM (VALUES ...)
+    на каждые BULK_BATCH_SIZE задач.
+    Условие проверяется в самом запросе, поэтому задачи, которым исполнитель был назначен одновременно
+    другим запросом, не изменяются
+
+    :param assignments: идентификаторы исполнителей по идентификаторам задач
+    :param connection: соединение текущей транзакции
+    :return: идентификаторы, статусы, пути и исполнители задач, которым назначен исполнитель
+    """
+
+    postgres = connection.capabilities.dialect == 'postgres'
+    if postgres:
+        items = list(assignments.items())
+    else:
+        # В SQLite запись в транзакции монопольна, поэтому назначаются задачи без исполнителя на момент чтения
+        rows = await Task.filter(id__in=list(assignments), performer_id=None).using_db(connection).values(
+            'id', 'status', 'path')
+        items = [(row['id'], assignments[row['id']]) for row in rows]
+
+    assigned = []
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        params = []
+        values = values_sql(Task, ['id', 'performer_id'], items[start:start + BULK_BATCH_SIZE], connection, params)
+        params.append(db_value(Task, 'updated_at', timezone.now(), connection))
+        updated_at_param = sql_placeholder(connection, len(params))
+        if postgres:
+            assigned.extend(await connection.execute_query_dict(f"""
+                UPDATE "tasks" AS "task" SET "performer_id" = "v"."performer_id", "updated_at" = {updated_at_param}
+                FROM ({values}) AS "v"("id", "performer_id")
+                WHERE "task"."id" = "v"."id" AND "task"."performer_id" IS NULL
+                RETURNING "task"."id", "task"."status", "task"."path", "task"."performer_id"
+            """, params))
+        else:
+            await connection.execute_query(f"""
+                WITH "v"("id", "performer_id") AS ({values})
+                UPDATE "tasks" SET "performer_id" = "v"."performer_id", "updated_at" = {updated_at_param}
+                FROM "v" WHERE "tasks"."id" = "v"."id" AND "tasks"."performer_id" IS NULL
+            """, params)
+    return assigned if postgres else [{**row, 'performer_id': assignments[row['id']]} for row in rows]
+
+
+async def get_balanced_important_tasks(apply: bool = False) -> tuple[list[dict], dict[int, dict]]:
+    """
+    Получение списка важных задач с одним предложенным исполнителем для каждой задачи.
+    При apply=True предложенные исполнители назначаются задачам одним запросом (assign_unassigned_tasks),
+    если задачам ещё не назначен исполнитель
+
+    :param apply: назначить предложенных исполнителей
+    :return: кортеж из списка задач в формате [{Важная задача, Срок, ФИО сотрудника}]
+        и исполнителя и пути до назначения по идентификаторам задач, которым назначен исполнитель
+    """
+
+    tasks = sorted(await fetch_important_tasks(), key=deadline_order)
+    if not tasks:
+        return [], {}
+
+    employees = {emp.id: emp for emp in await Employee.all()}
+    assignments = distribute_important_tasks(tasks, {emp.id: emp.active_task_count for emp in employees.values()})
+
+    if apply and assignments:
+        assigned, previous = {}, {}
+        async with in_transaction() as connection:
+            for row in await assign_unassigned_tasks(assignments, connection):
+                assigned[row['id']] = (row['performer_id'], TaskStatus(row['status']))
+                previous[row['id']] = {'performer_id': None, 'path': row['path']}
+            await update_tasks_counters([(None, state) for state in assigned.values()], connection)
+            await touch_subtasks(list(assigned), connection)
+        # Задачи, которым исполнитель был назначен одновременно другим запросом, остаются без предложения
+        assignments = {task_id: employee_id for task_id, (employee_id, _) in assigned.items()}
+    else:
+        previous = {}
+
+    suggestions = {}
+    important_tasks = []
+    for task in tasks:
+        employee_id = assignments.get(task['id'])
+        if employee_id is not None and employee_id not in suggestions:
+            suggestions[employee_id] = EmployeeForTask.model_validate(employees[employee_id])
+        important_tasks.append({
+            "id": task['id'],
+            "name": task['name'],
+            "deadline": task['deadline'],
+            "parent_task": task['parent_task_id'],
+            "status": task['status'].label,
+            "suggested_employee": suggestions.get(employee_id)
+        })
+
+    return important_tasks, previous
+
+
+async def reserve_task_ids(count: int, connection: BaseDBAsyncClient) -> list[int]:
+    """
+    Резервирование идентификаторов для массово создаваемых задач.
+    В PostgreSQL идентификаторы берутся из последовательности, в SQLite запись в базу
+    внутри транзакции выполняется монопольно, поэтому достаточно продолжить максимальный идентификатор
+
+    :param count: количество идентификаторов
+    :param connection: соединение текущей транзакции
+    :return: список идентификаторов
+    """
+
+    if not count:
+        return []
+
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(
+            "SELECT nextval(pg_get_serial_sequence('tasks', 'id')) AS id FROM generate_series(1, $1)", [count]
+        )
+        return [row['id'] for row in rows]
+
+    max_id = await Task.all().using_db(connection).order_by('-id').first().values_list('id', flat=True)
+    start = (max_id or 0) + 1
+    return list(range(start, start + count))
+
+
+async def get_existing_ids(performer_ids: set, parent_task_ids: set) -> tuple[set, dict]:
+    """
+    Получение существующих сотрудников и задач из указанных, по одному запросу на каждую таблицу
+
+    :param performer_ids: идентификаторы сотрудников
+    :param parent_task_ids: идентификаторы задач
+    :return: кортеж из множества найденных идентификаторов сотрудников и путей найденных задач по их идентификаторам
+    """
+
+    existing_performers = set(await Employee.filter(id__in=list(performer_ids)).values_list('id', flat=True)) \
+        if performer_ids else set()
+    existing_parent_tasks = dict(await Task.filter(id__in=list(parent_task_ids)).values_list('id', 'path')) \
+        if parent_task_ids else {}
+    return existing_performers, existing_parent_tasks
+
+
+async def bulk_create_tasks(items: list[PydanticTaskCreate]) -> tuple[list[int], list[dict]]:
+    """
+    Массовое создание задач в одной транзакции.
+    Задачи со ссылками на несуществующих сотрудников или задачи не создаются и попадают в список ошибок
+
+    :param items: данные о задачах
+    :return: кортеж из идентификаторов созданных задач и списка ошибок
+    """
+
+    existing_performers, existing_parent_tasks = await get_existing_ids(
+        {item.performer for item in items if item.performer},
+        {item.parent_task for item in items if item.parent_task}
+    )
+
+    valid_items, errors = [], []
+    for index, item in enumerate(items):
+        if item.performer and item.performer not in existing_performers:
+            errors.append({'index': index, 'detail': f'Сотрудник {item.performer} не найден'})
+        elif item.parent_task and item.parent_task not in existing_parent_tasks:
+            errors.append({'index': index, 'detail': f'Задача {item.parent_task} не найдена'})
+        else:
+            valid_items.append(item)
+
+    if not valid_items:
+        return [], errors
+
+    async with in_transaction() as connection:
+        ids = await reserve_task_ids(len(valid_items), connection)
+        tasks = [Task(id=task_id,
+                      name=item.name,
+                      description=item.description,
+                      performer_id=item.performer or None,
+                      deadline=item.deadline,
+                      status=item.status,
+                      parent_task_id=item.parent_task or None,
+                      path=f'{existing_parent_tasks[item.parent_task]}{item.parent_task}/' if item.parent_task else '/')
+                 for task_id, item in zip(ids, valid_items)]
+        await Task.bulk_create(tasks, batch_size=BULK_BATCH_SIZE, using_db=connection)
+        await update_tasks_counters([(None, (task.performer_id, task.status)) for task in tasks], connection)
+
+    return ids, errors
+
+
+async def bulk_update_tasks(items: list[PydanticTaskPatch]) -> tuple[list[int], list[dict], dict[int, dict]]:
+    """
+    Массовое обновление задач в одной транзакции.
+    Задачи обновляются по своим переданным полям запросами UPDATE ... FROM (VALUES ...) по BULK_BATCH_SIZE задач
+    (update_task_rows), счётчики исполнителей изменяются по состоянию задач до изменения, полученному
+    в тех же запросах. Пути переносимых задач вычисляются по дереву после всех переносов запроса (plan_task_moves),
+    поддеревья переносятся за один проход в конце.
+    Задачи с ошибками не изменяются и попадают в список ошибок.
+    Если переносы задач внутри одного запроса образуют цикл, не применяется весь запрос
+
+    :param items: данные о задачах
+    :return: кортеж из идентификаторов обновлённых задач, списка ошибок и исполнителя и пути до изменения
+        по идентификаторам обновлённых и перенесённых вместе с ними задач
+    """
+
+    existing_performers, existing_parent_tasks = await get_existing_ids(
+        {item.performer for item in items if item.performer},
+        {item.parent_task for item in items if item.parent_task}
+    )
+
+    errors, values_by_id, indexes = [], {}, {}
+    for index, item in enumerate(items):
+        task_data = item.model_dump(exclude_unset=True, exclude={'id'})
+        if item.id in indexes:
+            errors.append({'index': index, 'detail': f'Задача {item.id} уже указана в запросе'})
+            continue
+        if task_data.get('performer') and item.performer not in existing_performers:
+            errors.append({'index': index, 'detail': f'Сотрудник {item.performer} не найден'})
+            continue
+        if task_data.get('parent_task') == item.id:
+            errors.append({'index': index, 'detail': 'Нельзя указывать в качестве родительской задачи саму себя'})
+            continue
+        if task_data.get('parent_task') and item.parent_task not in existing_parent_tasks:
+            errors.append({'index': index, 'detail': f'Задача {item.parent_task} не найдена'})
+            continue
+
+        values = {}
+        for key, value in task_data.items():
+            if key in ('performer', 'parent_task'):
+                key, value = f'{key}_id', value or None
+            values[key] = value
+        values_by_id[item.id], indexes[item.id] = values, index
+
+    previous = {}
+    async with in_transaction() as connection:
+        moves = {task_id: values['parent_task_id'] for task_id, values in values_by_id.items()
+                 if 'parent_task_id' in values}
+        paths = await lock_task_paths({*moves, *filter(None, moves.values())}, connection)
+        for task_id, parent_task_id in list(moves.items()):
+            # Ненайденная задача попадает в ошибки после обновления, родительская задача могла быть удалена
+            if task_id not in paths:
+                del moves[task_id]
+            elif parent_task_id is not None and parent_task_id not in paths:
+                errors.append({'index': indexes[task_id], 'detail': f'Задача {parent_task_id} не найдена'})
+                del moves[task_id], values_by_id[task_id]
+        planned, rejected = plan_task_moves(moves, paths)
+        for task_id in rejected:
+            errors.append({'index': indexes[task_id],
+                           'detail': 'Нельзя указывать в качестве родительской задачи подзадачу этой же задачи'})
+            del values_by_id[task_id]
+        for task_id, path in planned.items():
+            values_by_id[task_id]['path'] = path
+
+        states = await update_task_rows(values_by_id, connection)
+        for task_id, (after, before) in states.items():
+            previous[task_id] = {'performer_id': before['performer_id'], 'path': before['path']}
+        for task_id, state in (await move_subtrees({f"{before['path']}{task_id}/": f"{after['path']}{task_id}/"
+                                                    for task_id, (after, before) in states.items()},
+                                                   connection)).items():
+            previous.setdefault(task_id, state)
+        await touch_subtasks([task_id for task_id in states
+                              if not PARENT_TASK_COLUMNS.isdisjoint(values_by_id[task_id])], connection)
+        await update_tasks_counters([((before['performer_id'], before['status']),
+                                      (after['performer_id'], after['status'])) for after, before in states.values()],
+                                    connection)
+
+    errors.extend({'index': indexes[task_id], 'detail': f'Задача {task_id} не найдена'}
+                  for task_id in values_by_id if task_id not in states)
+    errors.sort(key=lambda error: error['index'])
+    return [task_id for task_id in values_by_id if task_id in states], errors, previous
+
+
+async def bulk_delete_tasks(ids: list[int]) -> tuple[list[dict], list[dict], dict[int, dict]]:
+    """
+    Массовое удаление задач в одной транзакции.
+    Счётчики исполнителей изменяются по строкам, удалённым запросом DELETE ... RETURNING
+
+    :param ids: идентификаторы задач
+    :return: кортеж из удалённых строк задач, списка ошибок и исполнителя и пути до переноса
+        по идентификаторам подзадач, ставших корневыми
+    """
 
-        if performer_task_count - min_task_count <= 2:
-            return EmployeeForTask.model_validate(performer)
+    async with in_transaction() as connection:
+        await detach_subtasks(list(set(ids)), connection)
+        tasks = await delete_task_rows(list(set(ids)), connection)
+        # Подзадачи удалённых задач становятся корневыми, у вложенных удалённых задач - от самой глубокой из них
+        moved = await move_subtrees({f"{task['path']}{task['id']}/": '/' for task in tasks}, connection)
+        if tasks:
+            await record_deletions('tasks', [task['id'] for task in tasks], connection)
+        await update_tasks_counters([((task['performer_id'], task['status']), None) for task in tasks], connection)
 
-    return None
\ No newline at end of file
+    deleted_ids = {task['id'] for task in tasks}
+    errors = [{'index': index, 'detail': f'Задача {task_id} не найдена'}
+              for index, task_id in enumerate(ids) if task_id not in deleted_ids]
+    return tasks, errors, moved
@@ -0,0 +1,118 @@
+import re
+from typing import Type
+
+from tortoise import Model, timezone
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+def sql_placeholder(connection: BaseDBAsyncClient, index: int) -> str:
+    """
+    Параметр запроса в синтаксисе СУБД
+
+    :param connection: соединение
+    :param index: номер параметра, начиная с 1
+    :return: обозначение параметра в тексте запроса
+    """
+
+    return f'${index}' if connection.capabilities.dialect == 'postgres' else '?'
+
+
+def db_value(model: Type[Model], name: str, value, connection: BaseDBAsyncClient):
+    """
+    Значение поля для параметра запроса: проверка валидаторами поля и преобразование так же,
+    как при сохранении модели
+
+    :param model: модель
+    :param name: название поля модели
+    :param value: значение
+    :param connection: соединение
+    :return: значение параметра
+    """
+
+    return None if value is None else connection.executor_class._field_to_db(model._meta.fields_map[name], value, model)
+
+
+def values_sql(model: Type[Model], names: list[str], rows: list[list], connection: BaseDBAsyncClient,
+               params: list) -> str:
+    """
+    Список строк VALUES для изменения нескольких объектов одним запросом.
+    В PostgreSQL параметры приводятся к типам столбцов (без размера, чтобы длинные строки не обрезались
+    молча, а отклонялись валидаторами), иначе тип параметров в VALUES не определяется
+
+    :param model: модель
+    :param names: названия полей модели в порядке значений строк
+    :param rows: значения полей в каждой строке
+    :param connection: соединение
+    :param params: уже добавленные в запрос параметры, к ним добавляются значения строк
+    :return: текст VALUES (...), (...)
+    """
+
+    casts = [''] * len(names)
+    if connection.capabilities.dialect == 'postgres':
+        casts = ['::' + re.sub(r'\(.*\)', '', model._meta.fields_map[name].get_for_dialect('postgres', 'SQL_TYPE'))
+                 for name in names]
+    rendered = []
+    for row in rows:
+        items = []
+        for name, cast, value in zip(names, casts, row):
+            params.append(db_value(model, name, value, connection))
+            items.append(f'{sql_placeholder(connection, len(params))}{cast}')
+        rendered.append(f'({", ".join(items)})')
+    return f'VALUES {", ".join(rendered)}'
+
+
+def prepare_update(model: Type[Model], values: dict, connection: BaseDBAsyncClient,
+                   params: list | None = None) -> tuple[list[str], list]:
+    """
+    Подготовка присваиваний для UPDATE только изменяемых столбцов.
+    Значения проверяются валидаторами полей и преобразуются так же, как при сохранении модели,
+    поля с auto_now получают текущее время
+
+    :param model: модель
+    :param values: новые значения по названиям полей модели (для связей - поля с суффиксом _id)
+    :param connection: соединение
+    :param params: уже добавленные в запрос параметры, к ним добавляются новые
+    :return: кортеж из присваиваний вида "столбец" = параметр и списка параметров запроса
+    """
+
+    values = dict(values)
+    for name, field in model._meta.fields_map.items():
+        if getattr(field, 'auto_now', False) and name not in values:
+            values[name] = timezone.now()
+
+    params = [] if params is None else params
+    assignments = []
+    for name, value in values.items():
+        params.append(db_value(model, name, value, connection))
+        assignments.append(f'"{model._meta.fields_db_projection[name]}" = {sql_placeholder(connection, len(params))}')
+    return assignments, params
+
+
+async def update_returning(model: Type[Model], object_id: int, values: dict,
+                           connection: BaseDBAsyncClient | None = None) -> Model | None:
+    """
+    Обновление переданных полей объекта одним запросом UPDATE ... RETURNING.
+    Объект не загружается перед обновлением, поэтому одновременные изменения разных полей не теряются.
+    В СУБД без RETURNING объект загружается отдельным запросом после обновления
+
+    :param model: модель
+    :param object_id: первичный ключ объекта
+    :param values: новые значения по названиям полей модели
+    :param connection: соединение (по умолчанию соединение модели)
+    :return: обновлённый объект или None, если объект не найден
+    """
+
+    connection = connection or model._meta.db
+    assignments, params = prepare_update(model, values, connection)
+    params.append(object_id)
+    query = (f'UPDATE "{model._meta.db_table}" SET {", ".join(assignments)} '
+             f'WHERE "{model._meta.db_pk_column}" = {sql_placeholder(connection, len(params))}')
+
+    if connection.capabilities.dialect == 'postgres':
+        rows = await connection.execute_query_dict(f'{query} RETURNING *', params)
+        return model._init_from_db(**rows[0]) if rows else None
+
+    updated, _ = await connection.execute_query(query, params)
+    if not updated:
+        return None
+    return await model.get_or_none(pk=object_id).using_db(connection)
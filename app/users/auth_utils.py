@@ -1,19 +1,44 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
-from typing import Optional
+from typing import Callable, Optional
 
 from fastapi import Depends, HTTPException, Security
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
+from tortoise import connections
 
+from app.cache import LRUCache
+from app.events import hub, publish
 from app.users.models import User
-from app.config import ALGORITHM, SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.users.schemas import PydenticUserPrincipal
+from app.config import ALGORITHM, SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES, USER_CACHE_SIZE, USER_CACHE_TTL, \
+    BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Хэши с другим количеством раундов считаются устаревшими и пересчитываются при входе пользователя
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=BCRYPT_ROUNDS,
+                           bcrypt__min_rounds=BCRYPT_ROUNDS,
+                           bcrypt__max_rounds=BCRYPT_ROUNDS)
+
+# Хэширование выполняется в отдельных потоках (bcrypt освобождает GIL), чтобы не блокировать event loop.
+# Количество потоков ограничивает число одновременных вычислений, остальные ждут в очереди
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+password_queue_depth = 0
+
+# Кэш данных текущего пользователя по email из токена.
+# Записи удаляются при изменении или удалении пользователя во всех процессах приложения
+# (служебным событием USER_INVALIDATED_EVENT), USER_CACHE_TTL ограничивает жизнь записи,
+# если событие не дошло (например, при обрыве соединения канала событий)
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+USER_INVALIDATED_EVENT = 'user.invalidated'
+hub.add_handler(USER_INVALIDATED_EVENT, lambda event: user_cache.invalidate(event['email']))
 
 
 class Login(BaseModel):
@@ -24,7 +49,8 @@ class Login(BaseModel):
 
 def create_access_token(data: dict) -> str:
     """
-    Генерация токена доступа
+    Генерация токена доступа.
+    Помимо email (sub) токен должен содержать версию токенов пользователя (ver)
 
     :param data: данные для создания токена
     :return: токен доступа
@@ -37,7 +63,24 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-def hash_password(password: str) -> str:
+async def run_password_task(func: Callable, *args):
+    """
+    Выполнение операции с паролем в пуле потоков хэширования
+
+    :param func: функция хэширования или проверки
+    :param args: аргументы функции
+    :return: результат функции
+    """
+
+    global password_queue_depth
+    password_queue_depth += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        password_queue_depth -= 1
+
+
+async def hash_password(password: str) -> str:
     """
     Хэширование пароля
 
@@ -45,19 +88,19 @@ def hash_password(password: str) -> str:
     :return: хэшированный пароль
     """
 
-    return pwd_context.hash(password)
+    return await run_password_task(pwd_context.hash, password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
     """
-    Проверка пароля
+    Проверка пароля и получение нового хэша, если параметры хэширования изменились
 
     :param plain_password: обычный пароль в виде строки
     :param hashed_password: хэшированный пароль для сравнения
-    :return: ответ о результате сравнения в формате bool
+    :return: кортеж из результата сравнения и нового хэша (None, если пересчёт не нужен)
     """
 
-    return pwd_context.verify(plain_password, hashed_password)
+    return await run_password_task(pwd_context.verify_and_update, plain_password, hashed_password)
 
 
 async def authenticate_user(email: str, password: str) -> Optional[User]:
@@ -72,33 +115,66 @@ async def authenticate_user(email: str, password: str) -> Optional[User]:
     user = await User.get_or_none(email=email)
     if user is None:
         return None
-    if not verify_password(password, user.password):
+    is_valid, new_hash = await verify_and_update_password(password, user.password)
+    if not is_valid:
         return None
+    if new_hash is not None:
+        user.password = new_hash
+        await user.save(update_fields=['password'])
     return user
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+async def invalidate_user_cache(email: str) -> None:
+    """
+    Удаление данных пользователя из кэша авторизации во всех процессах приложения.
+    Вызывается после фиксации изменения пользователя: в текущем процессе запись удаляется сразу,
+    в остальных - при получении события
+
+    :param email: email пользователя
+    """
+
+    user_cache.invalidate(email)
+    await publish([{'type': USER_INVALIDATED_EVENT, 'email': email}])
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> PydenticUserPrincipal:
     """
-    Получение текущего пользователя
+    Получение текущего пользователя.
+    Данные пользователя берутся из кэша, к базе данных запрос выполняется только при отсутствии записи
+    или несовпадении версии токенов пользователя с версией в токене
 
     :param token: токен
-    :return: объект пользователя или None
+    :return: данные текущего пользователя
     """
 
     try:
         token_info = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email: str = token_info.get("sub")
-        if user_email is None:
-            raise HTTPException(status_code=401, detail="Пользователь не авторизован")
-        user = await User.get(email=user_email)
-        if user is None:
-            raise HTTPException(status_code=404, detail="Пользователь не найден")
-        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Пользователь не авторизован")
 
+    user_email: str = token_info.get("sub")
+    if user_email is None:
+        raise HTTPException(status_code=401, detail="Пользователь не авторизован")
+    token_version = token_info.get("ver", 0)
+
+    principal = user_cache.get(user_email)
+    if principal is None or principal.token_version != token_version:
+        # Пользователь читается из основной базы: на реплике может не быть новой версии токенов
+        user = await User.get_or_none(email=user_email).using_db(connections.get('default'))
+        if user is None:
+            user_cache.invalidate(user_email)
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        principal = PydenticUserPrincipal.model_validate(user)
+        user_cache.set(user_email, principal)
+
+    if principal.token_version != token_version:
+        raise HTTPException(status_code=401, detail="Токен отозван")
+    return principal
+
 
-async def check_superuser_staff_or_owner(user_id: int, current_user: User = Security(get_current_user)) -> User:
+async def check_superuser_staff_or_owner(user_id: int,
+                                         current_user: PydenticUserPrincipal = Security(get_current_user)
+                                         ) -> PydenticUserPrincipal:
     """
     Проверка прав для текущего пользователя (администратор, сотрудник или владелец)
 
@@ -112,7 +188,8 @@ async def check_superuser_staff_or_owner(user_id: int, current_user: User = Secu
     raise HTTPException(status_code=403, detail="Текущее действие запрещено")
 
 
-async def check_superuser_or_staff(current_user: User = Security(get_current_user)) -> User:
+async def check_superuser_or_staff(current_user: PydenticUserPrincipal = Security(get_current_user)
+                                   ) -> PydenticUserPrincipal:
     """
     Проверка прав для текущего пользователя (администратор или сотрудник)
 
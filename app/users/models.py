@@ -22,6 +22,7 @@ class User(Model):
     is_active = fields.BooleanField(default=True)
     is_staff = fields.BooleanField(default=False)
     is_superuser = fields.BooleanField(default=False)
+    token_version = fields.IntField(default=0)
 
     class Meta:
         table = "users"
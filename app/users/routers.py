@@ -1,15 +1,19 @@
 from datetime import datetime
-from typing import List
+from typing import Literal
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from starlette import status
 from starlette.responses import JSONResponse
+from tortoise.transactions import in_transaction
 
+from app.config import PAGINATION_DEFAULT_LIMIT, PAGINATION_MAX_LIMIT
+from app.pagination import PydanticPage, paginate
 from app.users.auth_utils import create_access_token, authenticate_user, Login, check_superuser_staff_or_owner, \
-    check_superuser_or_staff, hash_password
+    check_superuser_or_staff, hash_password, invalidate_user_cache
 from app.users.models import User
-from app.users.schemas import PydenticUserOut, PydenticUserPut, PydenticUserRegister
+from app.users.schemas import PydenticUserOut, PydenticUserPut, PydenticUserRegister, PydenticUserPrincipal
 from app.users import services
+from app.updates import update_returning
 
 users_router = APIRouter()
 
@@ -30,7 +34,7 @@ async def login_for_access_token(credentials: Login) -> dict:
             detail="Неверный логин или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": user.email, "ver": user.token_version})
 
     user.last_login = datetime.utcnow()
     await user.save()
@@ -38,17 +42,23 @@ async def login_for_access_token(credentials: Login) -> dict:
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@users_router.get('/', response_model=List[PydenticUserOut])
-async def get_users(current_user: User = Depends(check_superuser_or_staff)) -> List[User]:  # noqa: F841
+@users_router.get('/', response_model=PydanticPage[PydenticUserOut])
+async def get_users(limit: int = Query(PAGINATION_DEFAULT_LIMIT, ge=1, le=PAGINATION_MAX_LIMIT),
+                    cursor: str | None = None,
+                    order_by: Literal['id', 'registration_date'] = 'id',
+                    current_user: PydenticUserPrincipal = Depends(check_superuser_or_staff)) -> dict:  # noqa: F841
     """
-    Получить список пользователей
+    Получить постраничный список пользователей
 
+    :param limit: количество пользователей на странице
+    :param cursor: курсор следующей страницы из предыдущего ответа
+    :param order_by: поле сортировки
     :param current_user: текущий пользователь
-    :return: список пользователей
+    :return: страница пользователей и курсор следующей страницы
     """
 
-    users = await User.all()
-    return users
+    users, next_cursor = await paginate(User.all(), limit, cursor, order_by)
+    return {'items': users, 'next_cursor': next_cursor}
 
 
 @users_router.post('/', response_model=PydenticUserOut)
@@ -60,7 +70,7 @@ async def create_user(user: PydenticUserRegister) -> User:
     :return: созданный пользователь
     """
 
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password(user.password)
     del user.password
     user_obj = await User.create(**user.model_dump(exclude_unset=True),
                                  password=hashed_password)
@@ -68,7 +78,7 @@ async def create_user(user: PydenticUserRegister) -> User:
 
 
 @users_router.get('/{user_id}/', response_model=PydenticUserOut)
-async def get_user(user_id: int, current_user: User = Depends(check_superuser_staff_or_owner)) -> User:  # noqa: F841
+async def get_user(user_id: int, current_user: PydenticUserPrincipal = Depends(check_superuser_staff_or_owner)) -> User:  # noqa: F841
     """
     Получить пользователя по идентификатору
 
@@ -83,7 +93,7 @@ async def get_user(user_id: int, current_user: User = Depends(check_superuser_st
 
 @users_router.put('/{user_id}/', response_model=PydenticUserOut)
 async def update_user(user_id: int, user: PydenticUserPut,
-                      current_user: User = Depends(check_superuser_staff_or_owner)) -> User:  # noqa: F841
+                      current_user: PydenticUserPrincipal = Depends(check_superuser_staff_or_owner)) -> User:  # noqa: F841
     """
     Обновление информации о пользователе
 
@@ -93,23 +103,37 @@ async def update_user(user_id: int, user: PydenticUserPut,
     :return: обновленный пользователь
     """
 
-    user_obj = await services.get_user_or_404(user_id)
-
     if not current_user.is_superuser:
         del user.is_staff
         del user.is_active
 
     user_update_data = user.model_dump(exclude_unset=True)
     if 'password' in user_update_data:
-        user_update_data['password'] = hash_password(user_update_data['password'])
-    for key, value in user_update_data.items():
-        setattr(user_obj, key, value)
-    await user_obj.save()
+        user_update_data['password'] = await hash_password(user_update_data['password'])
+
+    async with in_transaction() as connection:
+        # Строка блокируется до конца транзакции, чтобы одновременные изменения не потеряли увеличение версии токенов
+        previous = await User.get_or_none(id=user_id).select_for_update().using_db(connection)
+        if previous is None:
+            raise HTTPException(status_code=404, detail=f'Пользователь {user_id} не найден')
+        if not user_update_data:
+            return previous
+
+        # Смена учётных данных или прав отзывает ранее выданные токены.
+        # Записываются только переданные столбцы, объект возвращается тем же запросом
+        if any(key in user_update_data and user_update_data[key] != getattr(previous, key)
+               for key in ('email', 'password', 'is_active', 'is_staff')):
+            user_update_data['token_version'] = previous.token_version + 1
+        user_obj = await update_returning(User, user_id, user_update_data, connection)
+
+    await invalidate_user_cache(previous.email)
+    if user_obj.email != previous.email:
+        await invalidate_user_cache(user_obj.email)
     return user_obj
 
 
 @users_router.delete('/{user_id}/')
-async def delete_user(user_id: int, current_user: User = Depends(check_superuser_staff_or_owner)) -> JSONResponse:  # noqa: F841
+async def delete_user(user_id: int, current_user: PydenticUserPrincipal = Depends(check_superuser_staff_or_owner)) -> JSONResponse:  # noqa: F841
     """
     Удаление пользователя по идентификатору
 
@@ -119,6 +143,7 @@ async def delete_user(user_id: int, current_user: User = Depends(check_superuser
     """
     user_obj = await services.get_user_or_404(user_id)
     await user_obj.delete()
+    await invalidate_user_cache(user_obj.email)
     content = {'message': f'Пользователь {user_id} удалён'}
 
     return JSONResponse(content=content, status_code=200)
@@ -54,3 +54,17 @@ class PydenticUserOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class PydenticUserPrincipal(BaseModel):
+    """Модель текущего пользователя с данными, необходимыми для проверки прав"""
+
+    id: int
+    email: EmailStr
+    is_active: bool
+    is_staff: bool
+    is_superuser: bool
+    token_version: int
+
+    class Config:
+        from_attributes = True
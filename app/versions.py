@@ -0,0 +1,98 @@
+from typing import Callable
+
+from fastapi import HTTPException, Request, Response
+from tortoise import Model, fields
+from tortoise.expressions import F
+
+
+class DataVersion(Model):
+    """
+    Модель версии данных таблицы. Версия увеличивается при каждом изменении таблицы
+    и используется для формирования ETag ответов, построенных по этой таблице
+    """
+
+    name = fields.CharField(max_length=50, pk=True)
+    version = fields.BigIntField(default=0)
+
+    class Meta:
+        table = "data_versions"
+
+
+async def bump_versions(*names: str) -> None:
+    """
+    Увеличение версий данных таблиц.
+    Вызывается после фиксации транзакции с изменениями: если версию прочитают до увеличения,
+    клиент получит новые данные со старым ETag и просто запросит их ещё раз
+
+    :param names: названия таблиц
+    """
+
+    for name in names:
+        updated = await DataVersion.filter(name=name).update(version=F('version') + 1)
+        if not updated:
+            await DataVersion.get_or_create(name=name, defaults={'version': 1})
+
+
+async def get_etag(*names: str) -> str:
+    """
+    Формирование слабого ETag по версиям данных таблиц одним запросом
+
+    :param names: названия таблиц, по которым строится ответ
+    :return: ETag
+    """
+
+    versions = dict(await DataVersion.filter(name__in=names).values_list('name', 'version'))
+    return 'W/"' + '-'.join(f'{name}.{versions.get(name, 0)}' for name in names) + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Слабое сравнение ETag со значением заголовка If-None-Match
+
+    :param if_none_match: значение заголовка If-None-Match
+    :param etag: текущий ETag
+    :return: True, если у клиента актуальная версия ответа
+    """
+
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == opaque for tag in if_none_match.split(','))
+
+
+def conditional_get(*names: str, time_dependent: tuple[str, ...] = ()) -> Callable:
+    """
+    Зависимость для условных GET запросов.
+    Если ETag из If-None-Match совпадает с текущим, ответ 304 возвращается до выполнения запросов
+    к данным и сериализации. Иначе ETag добавляется к ответу.
+    Ответ с включённым параметром из time_dependent меняется со временем без изменения данных,
+    поэтому ETag для него не формируется
+
+    :param names: названия таблиц, по которым строится ответ
+    :param time_dependent: логические параметры запроса, при которых ответ зависит от текущего времени
+    :return: зависимость FastAPI
+    """
+
+    async def dependency(request: Request, response: Response) -> str | None:
+        if any(request.query_params.get(name, '').lower() in ('1', 'true', 'yes', 'on') for name in time_dependent):
+            return None
+        etag = await get_etag(*names)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            raise HTTPException(status_code=304, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return etag
+
+    return dependency
+
+
+def etag_headers(etag: str | None) -> dict | None:
+    """
+    Заголовки с ETag для ответов, которые формируются в обход response_model
+
+    :param etag: ETag или None, если ответ не кэшируется
+    :return: заголовки ответа
+    """
+
+    return {'ETag': etag} if etag else None
@@ -0,0 +1,132 @@
+"""
+Сравнение быстрого пути чтения (ответ из строк запроса) с чтением через модели и схемы Pydantic.
+Проверяет, что ответы совпадают побайтно, и выводит пропускную способность обоих путей.
+
+Запуск: python -m benchmarks.fast_read [--employees 200] [--tasks 2000] [--limit 100] [--requests 200] [--rounds 3]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from tortoise import timezone
+
+import app.employees.routers as employees_routers
+import app.tasks.routers as tasks_routers
+from app.employees.models import Employee
+from app.tasks.models import Task, TaskStatus
+from benchmarks.asgi import request, running_app
+
+# Целевое ускорение быстрого пути
+TARGET_SPEEDUP = 3
+
+
+def set_fast_read_path(enabled: bool) -> None:
+    """
+    Переключение пути чтения в обработчиках запросов
+
+    :param enabled: использовать быстрый путь
+    """
+
+    tasks_routers.FAST_READ_PATH = enabled
+    employees_routers.FAST_READ_PATH = enabled
+
+
+async def seed(employees: int, tasks: int) -> int:
+    """
+    Создание сотрудников и задач: половина задач - подзадачи первой половины
+
+    :param employees: количество сотрудников
+    :param tasks: количество задач
+    :return: идентификатор одной из подзадач
+    """
+
+    await Employee.bulk_create([Employee(first_name=f'Имя{i}', last_name='Фамилия', father_name='Отчество',
+                                         email=f'e{i}@example.com', phone='1234567', position='Инженер')
+                                for i in range(employees)])
+    employee_ids = await Employee.all().order_by('id').values_list('id', flat=True)
+    statuses = list(TaskStatus)
+    now = timezone.now()
+
+    def make_task(i: int, parent_id: int | None = None) -> Task:
+        # У каждой третьей задачи нет срока
+        deadline = now + timedelta(hours=i) if i % 3 else None
+        return Task(name=f'Задача {i}', description='Описание задачи', performer_id=employee_ids[i % len(employee_ids)],
+                    status=statuses[i % len(statuses)], deadline=deadline, parent_task_id=parent_id,
+                    path=f'/{parent_id}/' if parent_id else '/')
+
+    await Task.bulk_create([make_task(i) for i in range(tasks // 2)])
+    parent_ids = await Task.all().order_by('id').values_list('id', flat=True)
+    await Task.bulk_create([make_task(i, parent_ids[i % len(parent_ids)]) for i in range(tasks - tasks // 2)])
+    return await Task.filter(parent_task_id__isnull=False).order_by('id').first().values_list('id', flat=True)
+
+
+async def measure(path: str, query: str, token: str, count: int) -> tuple[float, bytes]:
+    """
+    Последовательное выполнение запросов после одного прогревочного запроса
+
+    :param path: путь
+    :param query: строка запроса
+    :param token: токен доступа
+    :param count: количество запросов
+    :return: кортеж из количества запросов в секунду и тела последнего ответа
+    """
+
+    await request('GET', path, token=token, query=query)
+    started = time.perf_counter()
+    for _ in range(count):
+        status, _, body = await request('GET', path, token=token, query=query)
+        assert status == 200, (status, body)
+    return count / (time.perf_counter() - started), body
+
+
+async def main(employees: int, tasks: int, limit: int, requests: int, rounds: int) -> None:
+    async with running_app():
+        credentials = {'email': 'bench@example.com', 'password': 'bench-password'}
+        await request('POST', '/users/', json_body={**credentials, 'password2': credentials['password']})
+        _, _, body = await request('POST', '/users/token/', json_body=credentials)
+        token = json.loads(body)['access_token']
+        subtask_id = await seed(employees, tasks)
+
+        endpoints = [
+            ('/tasks/', f'limit={limit}'),
+            ('/tasks/', f'limit={limit}&order_by=deadline'),
+            (f'/tasks/{subtask_id}/', ''),
+            ('/employees/', f'limit={limit}'),
+        ]
+        results = {}
+        for path, query in endpoints:
+            # Пути замеряются поочерёдно несколько раз, берётся лучший результат каждого,
+            # чтобы случайные задержки одного замера не влияли на сравнение
+            orm_rps = fast_rps = 0
+            for _ in range(rounds):
+                set_fast_read_path(False)
+                rps, orm_body = await measure(path, query, token, requests)
+                orm_rps = max(orm_rps, rps)
+                set_fast_read_path(True)
+                rps, fast_body = await measure(path, query, token, requests)
+                fast_rps = max(fast_rps, rps)
+            results[f'{path}?{query}'] = {
+                'orm_rps': round(orm_rps, 1),
+                'fast_rps': round(fast_rps, 1),
+                'speedup': round(fast_rps / orm_rps, 2),
+                'identical': orm_body == fast_body,
+            }
+
+        print(json.dumps(results, indent=2))
+        if not all(result['identical'] for result in results.values()):
+            raise SystemExit('Ответы быстрого пути отличаются от ответов через модели')
+        if any(result['speedup'] < TARGET_SPEEDUP for result in results.values()):
+            raise SystemExit(f'Ускорение меньше {TARGET_SPEEDUP}x хотя бы на одном запросе')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.employees, args.tasks, args.limit, args.requests, args.rounds))
@@ -0,0 +1,83 @@
+"""
+Замер задержки обычных GET-запросов во время массового входа пользователей.
+
+Запуск: python -m benchmarks.login_storm [--logins 200] [--concurrency 20] [--gets 300]
+"""
+import argparse
+import asyncio
+import json
+
+from app.employees.models import Employee
+from benchmarks.asgi import percentile, request, running_app, timed_request
+
+
+async def get_latencies(token: str, count: int) -> list[float]:
+    """
+    Последовательное выполнение GET-запросов к списку сотрудников
+
+    :param token: токен доступа
+    :param count: количество запросов
+    :return: время выполнения запросов
+    """
+
+    latencies = []
+    for _ in range(count):
+        elapsed, status = await timed_request('GET', '/employees/', token=token)
+        assert status == 200, status
+        latencies.append(elapsed)
+    return latencies
+
+
+async def login_storm(logins: int, concurrency: int, credentials: dict) -> None:
+    """
+    Массовый вход пользователя с заданной параллельностью
+
+    :param logins: общее количество входов
+    :param concurrency: количество одновременных входов
+    :param credentials: email и пароль
+    """
+
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            status, _, _ = await request('POST', '/users/token/', json_body=credentials)
+            assert status == 200, status
+
+    await asyncio.gather(*(worker(logins // concurrency) for _ in range(concurrency)))
+
+
+def summary(latencies: list[float]) -> dict:
+    """
+    Перцентили задержки в миллисекундах
+
+    :param latencies: время выполнения запросов
+    :return: словарь с перцентилями
+    """
+
+    return {f'p{p}_ms': round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)}
+
+
+async def main(logins: int, concurrency: int, gets: int) -> None:
+    async with running_app():
+        credentials = {'email': 'bench@example.com', 'password': 'bench-password'}
+        await request('POST', '/users/', json_body={**credentials, 'password2': credentials['password']})
+        _, _, body = await request('POST', '/users/token/', json_body=credentials)
+        token = json.loads(body)['access_token']
+        await Employee.bulk_create([Employee(first_name=f'Имя{i}', last_name='Фамилия', email=f'e{i}@example.com',
+                                             phone='1234567')
+                                    for i in range(50)])
+
+        idle = await get_latencies(token, gets)
+        storm = asyncio.create_task(login_storm(logins, concurrency, credentials))
+        busy = await get_latencies(token, gets)
+        await storm
+
+        print(json.dumps({'idle': summary(idle), 'during_login_storm': summary(busy)}, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--gets', type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.gets))
@@ -0,0 +1,141 @@
+"""
+Замер накладных расходов MetricsMiddleware: одни и те же запросы выполняются через стек middleware приложения
+с MetricsMiddleware и без него, разница времени одного запроса без обращений к базе сравнивается с целевым значением.
+Отдельно замеряется middleware вокруг пустого ASGI-приложения - это его собственная стоимость без шума обработчиков.
+
+Запуск: python -m benchmarks.metrics_overhead [--requests 500] [--rounds 20]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from starlette.types import ASGIApp
+
+from app.main import app
+from app.metrics import MetricsMiddleware
+from benchmarks.asgi import request, running_app
+from benchmarks.seed import BENCH_PASSWORD, seed_dataset
+
+# Целевые накладные расходы на один запрос, в микросекундах
+TARGET_OVERHEAD_US = 20
+
+
+def build_stacks() -> tuple[ASGIApp, ASGIApp]:
+    """
+    Сборка стека middleware приложения с MetricsMiddleware и без него
+
+    :return: кортеж из стека с MetricsMiddleware и стека без него
+    """
+
+    middleware = app.user_middleware
+    if not any(item.cls is MetricsMiddleware for item in middleware):
+        raise SystemExit('MetricsMiddleware не подключён: замер нужно запускать с METRICS_ENABLED=true')
+    with_metrics = app.build_middleware_stack()
+    app.user_middleware = [item for item in middleware if item.cls is not MetricsMiddleware]
+    try:
+        without_metrics = app.build_middleware_stack()
+    finally:
+        app.user_middleware = middleware
+    return with_metrics, without_metrics
+
+
+async def measure(path: str, query: str, expected_status: int, token: str, count: int) -> float:
+    """
+    Последовательное выполнение запросов после одного прогревочного запроса
+
+    :param path: путь
+    :param query: строка запроса
+    :param expected_status: ожидаемый код ответа
+    :param token: токен доступа
+    :param count: количество запросов
+    :return: среднее время одного запроса в микросекундах
+    """
+
+    await request('GET', path, token=token, query=query)
+    started = time.perf_counter()
+    for _ in range(count):
+        status, _, body = await request('GET', path, token=token, query=query)
+        assert status == expected_status, (status, body)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+async def measure_isolated(count: int) -> float:
+    """
+    Время одного вызова MetricsMiddleware вокруг пустого ASGI-приложения за вычетом времени самого приложения
+
+    :param count: количество вызовов
+    :return: накладные расходы одного вызова в микросекундах
+    """
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+
+    async def empty_app(scope, receive, send) -> None:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def receive() -> dict:
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message: dict) -> None:
+        pass
+
+    timings = []
+    for asgi_app in (empty_app, MetricsMiddleware(empty_app)):
+        started = time.perf_counter()
+        for _ in range(count):
+            await asgi_app(scope, receive, send)
+        timings.append((time.perf_counter() - started) / count * 1e6)
+    return timings[1] - timings[0]
+
+
+async def main(requests: int, rounds: int) -> None:
+    async with running_app():
+        ids = await seed_dataset(employees=50, roots=100, depth=2, children=2, users=1, spare=0)
+        _, _, body = await request('POST', '/users/token/', json_body={'email': 'user0@example.com',
+                                                                       'password': BENCH_PASSWORD})
+        token = json.loads(body)['access_token']
+        with_metrics, without_metrics = build_stacks()
+
+        # Путь без обработчика проходит весь стек middleware без запросов к базе, по нему проверяется цель.
+        # Разброс времени запросов к базе сопоставим с целевым значением, эти замеры выводятся для сравнения
+        endpoints = [
+            ('/benchmark-missing/', '', 404, True),
+            (f"/tasks/{ids['leaf_tasks'][0]}/", '', 200, False),
+            ('/employees/', 'limit=20', 200, False),
+        ]
+        results = {}
+        try:
+            for path, query, expected_status, checked in endpoints:
+                # Варианты замеряются поочерёдно короткими сериями, накладные расходы - медиана разниц соседних серий:
+                # так медленный дрейф времени запросов (сборка мусора, рост таблиц) не попадает в сравнение
+                timings = {'with': [], 'without': []}
+                for round_number in range(rounds):
+                    variants = [('without', without_metrics), ('with', with_metrics)]
+                    for name, stack in variants if round_number % 2 else reversed(variants):
+                        app.middleware_stack = stack
+                        timings[name].append(await measure(path, query, expected_status, token, requests))
+                results[f'{path}?{query}'] = {
+                    'without_metrics_us': round(statistics.median(timings['without']), 1),
+                    'with_metrics_us': round(statistics.median(timings['with']), 1),
+                    'overhead_us': round(statistics.median(
+                        with_us - without_us for with_us, without_us in zip(timings['with'], timings['without'])), 1),
+                    'checked': checked,
+                }
+        finally:
+            app.middleware_stack = with_metrics
+        isolated = min([await measure_isolated(requests * 10) for _ in range(rounds)])
+        results['isolated'] = {'overhead_us': round(isolated, 2), 'checked': True}
+
+        print(json.dumps(results, indent=2))
+        if any(result['checked'] and result['overhead_us'] > TARGET_OVERHEAD_US for result in results.values()):
+            raise SystemExit(f'Накладные расходы MetricsMiddleware больше {TARGET_OVERHEAD_US} мкс на запрос')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.rounds))
@@ -0,0 +1,149 @@
+"""
+Заполнение базы воспроизводимым набором данных для замеров: сотрудники, лес задач заданной глубины
+с заданным распределением статусов и пользователи.
+
+Запуск: python -m benchmarks.seed [--employees 200] [--roots 200] [--depth 3] [--children 3]
+    [--status-mix 0.5,0.3,0.2] [--unassigned 0.1] [--seed 1]
+Имеет смысл с базой из BENCH_DB_URL (PostgreSQL или файл SQLite), база в памяти удаляется после запуска.
+"""
+import argparse
+import asyncio
+import json
+import random
+from datetime import timedelta
+
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from app.employees.models import Employee
+from app.employees.services import recalculate_task_counters
+from app.tasks.models import Task, TaskStatus
+from app.tasks.services import BULK_BATCH_SIZE, reserve_task_ids
+from app.users.auth_utils import hash_password
+from app.users.models import User
+from benchmarks.asgi import running_app
+
+# Пароль пользователей, создаваемых для замеров
+BENCH_PASSWORD = 'bench-password'
+
+
+def parse_status_mix(value: str) -> tuple[float, ...]:
+    """
+    Разбор доли статусов задач из строки вида 0.5,0.3,0.2 (new, in_progress, completed)
+
+    :param value: доли статусов через запятую
+    :return: доли статусов в порядке TaskStatus
+    """
+
+    shares = tuple(float(share) for share in value.split(','))
+    if len(shares) != len(TaskStatus) or any(share < 0 for share in shares) or not sum(shares):
+        raise argparse.ArgumentTypeError(f'Нужно {len(TaskStatus)} неотрицательных доли через запятую')
+    return shares
+
+
+async def seed_dataset(employees: int = 200, roots: int = 200, depth: int = 3, children: int = 3,
+                       status_mix: tuple[float, ...] = (0.5, 0.3, 0.2), unassigned: float = 0.1,
+                       users: int = 20, spare: int = 200, seed: int = 1) -> dict:
+    """
+    Создание набора данных через модели приложения.
+    Задачи создаются по уровням деревьев: у каждой задачи выше нижнего уровня children подзадач.
+    Дополнительно создаются сотрудники, пользователи и листовые задачи, которые замеры могут удалять.
+    Счётчики задач сотрудников пересчитываются после заполнения
+
+    :param employees: количество сотрудников
+    :param roots: количество корневых задач
+    :param depth: глубина деревьев задач (1 - только корневые задачи)
+    :param children: количество подзадач у каждой задачи
+    :param status_mix: доли статусов new, in_progress и completed
+    :param unassigned: доля задач без исполнителя
+    :param users: количество пользователей
+    :param spare: количество сотрудников, пользователей и задач для удаления
+    :param seed: начальное значение генератора случайных чисел
+    :return: идентификаторы созданных объектов по видам
+    """
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    statuses = list(TaskStatus)
+
+    await Employee.bulk_create([Employee(first_name=f'Имя{i}', last_name=f'Фамилия{i % 50}',
+                                         father_name='Отчество' if i % 4 else None,
+                                         email=f'employee{i}@example.com', phone='1234567',
+                                         position=rng.choice(['Инженер', 'Аналитик', 'Тестировщик', None]))
+                                for i in range(employees + spare)], batch_size=BULK_BATCH_SIZE)
+    employee_ids = await Employee.all().order_by('id').values_list('id', flat=True)
+    performer_ids, spare_employee_ids = employee_ids[:employees], employee_ids[employees:]
+
+    def make_task(task_id: int, number: int, parent: Task | None) -> Task:
+        return Task(id=task_id,
+                    name=f'Задача {number}',
+                    description=f'Описание задачи {number}' if number % 3 else None,
+                    performer_id=None if rng.random() < unassigned else rng.choice(performer_ids),
+                    deadline=now + timedelta(hours=rng.randint(-24 * 30, 24 * 90)) if number % 5 else None,
+                    status=rng.choices(statuses, weights=status_mix)[0],
+                    parent_task_id=parent.id if parent else None,
+                    path=f'{parent.path}{parent.id}/' if parent else '/')
+
+    levels, parents, number = [], [None] * roots, 0
+    for level_index in range(depth):
+        per_parent = children if level_index else 1
+        async with in_transaction() as connection:
+            ids = iter(await reserve_task_ids(len(parents) * per_parent, connection))
+            level = []
+            for parent in parents:
+                for _ in range(per_parent):
+                    number += 1
+                    level.append(make_task(next(ids), number, parent))
+            await Task.bulk_create(level, batch_size=BULK_BATCH_SIZE, using_db=connection)
+        levels.append([task.id for task in level])
+        parents = level
+
+    async with in_transaction() as connection:
+        ids = await reserve_task_ids(spare, connection)
+        spare_tasks = [make_task(task_id, number + index + 1, None) for index, task_id in enumerate(ids)]
+        await Task.bulk_create(spare_tasks, batch_size=BULK_BATCH_SIZE, using_db=connection)
+    await recalculate_task_counters()
+
+    password = await hash_password(BENCH_PASSWORD)
+    await User.bulk_create([User(email=f'user{i}@example.com', password=password, first_name=f'Имя{i}')
+                            for i in range(users + spare)], batch_size=BULK_BATCH_SIZE)
+    user_ids = await User.filter(email__startswith='user').order_by('id').values_list('id', flat=True)
+
+    return {
+        'employees': performer_ids,
+        'spare_employees': spare_employee_ids,
+        'root_tasks': levels[0],
+        'leaf_tasks': levels[-1],
+        'spare_tasks': [task.id for task in spare_tasks],
+        'users': user_ids[:users],
+        'spare_users': user_ids[users:],
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with running_app():
+        ids = await seed_dataset(employees=args.employees, roots=args.roots, depth=args.depth, children=args.children,
+                                 status_mix=args.status_mix, unassigned=args.unassigned, seed=args.seed)
+        print(json.dumps({key: len(value) for key, value in ids.items()}, indent=2))
+
+
+def add_dataset_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Параметры набора данных в командной строке
+
+    :param parser: разбор аргументов командной строки
+    """
+
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--roots', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--children', type=int, default=3)
+    parser.add_argument('--status-mix', type=parse_status_mix, default=(0.5, 0.3, 0.2))
+    parser.add_argument('--unassigned', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_dataset_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,249 @@
+"""
+Замеры всех обработчиков приложения на воспроизводимом наборе данных.
+Для каждого запроса выводятся пропускная способность, перцентили задержки, количество запросов к базе
+и пиковый объём памяти. Результаты сохраняются в JSON, два файла результатов можно сравнить.
+Потоки событий (/tasks/stream/, /tasks/ws/) не замеряются: это долгие соединения, а не запросы.
+
+Запуск: python -m benchmarks.suite [--requests 100] [--concurrency 1] [--only tasks] [--output results.json]
+    [параметры набора данных, как у benchmarks.seed]
+Сравнение: python -m benchmarks.suite --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from tortoise import timezone
+
+from app.users.models import User
+from benchmarks.asgi import BENCH_DB_URL, percentile, request, running_app
+from benchmarks.seed import BENCH_PASSWORD, add_dataset_arguments, seed_dataset
+
+# Количество дополнительных запросов для замера памяти (выполняются отдельно от замера времени)
+MEMORY_SAMPLES = 5
+# Количество задач в одном массовом запросе
+BULK_SIZE = 10
+
+
+class QueryCounter(logging.Handler):
+    """
+    Подсчёт запросов к базе по журналу Tortoise (каждый запрос записывается в журнал на уровне DEBUG)
+    """
+
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def get_endpoints(ctx: dict) -> dict[str, Callable[[int], tuple]]:
+    """
+    Замеряемые запросы. Каждый запрос задаётся функцией, которая по номеру выполнения возвращает
+    метод, путь, строку запроса и тело. Удаляющие запросы используют объекты, созданные для удаления
+
+    :param ctx: идентификаторы объектов набора данных и номер запуска
+    :return: словарь функций по названиям запросов
+    """
+
+    employees, leaf_tasks, root_tasks, users = ctx['employees'], ctx['leaf_tasks'], ctx['root_tasks'], ctx['users']
+    run, iterations = ctx['run'], ctx['iterations']
+
+    def employee_body(i: int) -> dict:
+        return {'first_name': 'Имя', 'last_name': 'Фамилия', 'email': f'new{run}-{i}@example.com', 'phone': '1234567'}
+
+    return {
+        'POST /users/token/': lambda i: ('POST', '/users/token/', '',
+                                         {'email': f'user{i % len(users)}@example.com', 'password': BENCH_PASSWORD}),
+        'GET /users/': lambda i: ('GET', '/users/', 'limit=50', None),
+        'POST /users/': lambda i: ('POST', '/users/', '', {'email': f'new{run}-{i}@example.com',
+                                                           'password': BENCH_PASSWORD, 'password2': BENCH_PASSWORD}),
+        'GET /users/{id}/': lambda i: ('GET', f'/users/{users[i % len(users)]}/', '', None),
+        'PUT /users/{id}/': lambda i: ('PUT', f'/users/{users[i % len(users)]}/', '', {'first_name': f'Имя{i}'}),
+        'DELETE /users/{id}/': lambda i: ('DELETE', f"/users/{ctx['spare_users'][i]}/", '', None),
+
+        'GET /employees/sorted_by_tasks/': lambda i: ('GET', '/employees/sorted_by_tasks/', 'limit=50', None),
+        'GET /employees/': lambda i: ('GET', '/employees/', 'limit=50', None),
+        'GET /employees/search/': lambda i: ('GET', '/employees/search/', f'q=Фамилия{i % 50}', None),
+        'GET /employees/changes/': lambda i: ('GET', '/employees/changes/', 'limit=100', None),
+        'GET /employees/export/': lambda i: ('GET', '/employees/export/', '', None),
+        'GET /employees/{id}/': lambda i: ('GET', f'/employees/{employees[i % len(employees)]}/', '', None),
+        'POST /employees/': lambda i: ('POST', '/employees/', '', employee_body(i)),
+        'PUT /employees/{id}/': lambda i: ('PUT', f'/employees/{employees[i % len(employees)]}/', '',
+                                           {'position': f'Должность {i}'}),
+        'DELETE /employees/{id}/': lambda i: ('DELETE', f"/employees/{ctx['spare_employees'][i]}/", '', None),
+
+        'GET /tasks/important/': lambda i: ('GET', '/tasks/important/', '', None),
+        'POST /tasks/important/assign/': lambda i: ('POST', '/tasks/important/assign/', '', None),
+        'GET /tasks/': lambda i: ('GET', '/tasks/', 'limit=50', None),
+        'GET /tasks/ (filtered)': lambda i: ('GET', '/tasks/', 'limit=50&status=new&order_by=deadline', None),
+        'GET /tasks/ (sparse)': lambda i: ('GET', '/tasks/', 'limit=50&fields=id,name,status', None),
+        'GET /tasks/search/': lambda i: ('GET', '/tasks/search/', f'q=задача {i}', None),
+        'GET /tasks/changes/': lambda i: ('GET', '/tasks/changes/', 'limit=100', None),
+        'GET /tasks/export/': lambda i: ('GET', '/tasks/export/', '', None),
+        'POST /tasks/bulk/': lambda i: ('POST', '/tasks/bulk/', '', {'items': [
+            {'name': f'Новая задача {i}-{k}', 'performer': employees[(i + k) % len(employees)]}
+            for k in range(BULK_SIZE)]}),
+        'PATCH /tasks/bulk/': lambda i: ('PATCH', '/tasks/bulk/', '', {'items': [
+            {'id': leaf_tasks[(i * BULK_SIZE + k) % len(leaf_tasks)], 'name': f'Задача {i}-{k}'}
+            for k in range(BULK_SIZE)]}),
+        'DELETE /tasks/bulk/': lambda i: ('DELETE', '/tasks/bulk/', '', {
+            'ids': ctx['spare_tasks'][iterations + 2 * i:iterations + 2 * i + 2]}),
+        'GET /tasks/{id}/': lambda i: ('GET', f'/tasks/{leaf_tasks[i % len(leaf_tasks)]}/', '', None),
+        'GET /tasks/{id}/subtree/': lambda i: ('GET', f'/tasks/{root_tasks[i % len(root_tasks)]}/subtree/', '', None),
+        'GET /tasks/{id}/ancestors/': lambda i: ('GET', f'/tasks/{leaf_tasks[i % len(leaf_tasks)]}/ancestors/', '',
+                                                 None),
+        'POST /tasks/': lambda i: ('POST', '/tasks/', '', {'name': f'Новая задача {i}',
+                                                           'parent_task': root_tasks[i % len(root_tasks)]}),
+        'PUT /tasks/{id}/': lambda i: ('PUT', f'/tasks/{leaf_tasks[i % len(leaf_tasks)]}/', '',
+                                       {'status': 'in_progress', 'performer': employees[i % len(employees)]}),
+        'PATCH /tasks/{id}/': lambda i: ('PATCH', f'/tasks/{leaf_tasks[i % len(leaf_tasks)]}/', '',
+                                         {'name': f'Задача {i}'}),
+        'DELETE /tasks/{id}/': lambda i: ('DELETE', f"/tasks/{ctx['spare_tasks'][i]}/", '', None),
+    }
+
+
+async def measure_endpoint(make_request: Callable[[int], tuple], token: str, requests: int, concurrency: int,
+                           counter: QueryCounter) -> dict:
+    """
+    Замер одного запроса: прогревочное выполнение, замер времени и запросов к базе, затем замер памяти
+
+    :param make_request: функция, возвращающая метод, путь, строку запроса и тело по номеру выполнения
+    :param token: токен доступа
+    :param requests: количество замеряемых выполнений
+    :param concurrency: количество одновременных выполнений
+    :param counter: счётчик запросов к базе
+    :return: результаты замера
+    """
+
+    async def execute(index: int) -> int:
+        method, path, query, body = make_request(index)
+        status, _, _ = await request(method, path, token=token, json_body=body, query=query)
+        return status
+
+    await execute(0)
+
+    latencies, errors = [], 0
+
+    async def worker(indexes: range) -> None:
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            status = await execute(index)
+            latencies.append(time.perf_counter() - started)
+            errors += status >= 400
+
+    counter.count = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(range(1 + offset, 1 + requests, concurrency)) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    queries = counter.count
+
+    peak = 0
+    tracemalloc.start()
+    for index in range(1 + requests, 1 + requests + MEMORY_SAMPLES):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await execute(index)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1),
+        **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        'queries_per_request': round(queries / requests, 2),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def compare_results(old: dict, new: dict) -> None:
+    """
+    Вывод изменений между двумя файлами результатов
+
+    :param old: результаты предыдущего запуска
+    :param new: результаты нового запуска
+    """
+
+    metrics = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_memory_kib')
+    print(f"{'запрос':<36}" + ''.join(f'{metric:>22}' for metric in metrics))
+    for name, result in new['endpoints'].items():
+        previous = old['endpoints'].get(name)
+        if previous is None:
+            continue
+        cells = []
+        for metric in metrics:
+            before, after = previous[metric], result[metric]
+            change = f'{(after - before) / before * 100:+.0f}%' if before else ''
+            cells.append(f'{after:>14} {change:>7}')
+        print(f'{name:<36}' + ''.join(cells))
+
+
+async def main(args: argparse.Namespace) -> None:
+    iterations = args.requests + 1 + MEMORY_SAMPLES
+    dataset = {'employees': args.employees, 'roots': args.roots, 'depth': args.depth, 'children': args.children,
+               'status_mix': args.status_mix, 'unassigned': args.unassigned, 'seed': args.seed}
+
+    async with running_app():
+        ctx = await seed_dataset(**dataset, spare=3 * iterations)
+        ctx.update(run=int(time.time()), iterations=iterations)
+
+        # Пользователь для замеров с правами на все запросы
+        credentials = {'email': f'bench{ctx["run"]}@example.com', 'password': BENCH_PASSWORD}
+        await request('POST', '/users/', json_body={**credentials, 'password2': BENCH_PASSWORD})
+        await User.filter(email=credentials['email']).update(is_superuser=True, is_staff=True)
+        _, _, body = await request('POST', '/users/token/', json_body=credentials)
+        token = json.loads(body)['access_token']
+
+        counter = QueryCounter()
+        db_logger = logging.getLogger('tortoise.db_client')
+        db_logger.addHandler(counter)
+        db_logger.setLevel(logging.DEBUG)
+
+        results = {}
+        for name, make_request in get_endpoints(ctx).items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = await measure_endpoint(make_request, token, args.requests, args.concurrency, counter)
+            print(name, json.dumps(results[name], ensure_ascii=False), file=sys.stderr)
+
+        db_logger.removeHandler(counter)
+
+    output = {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'database': BENCH_DB_URL.split(':', 1)[0],
+            'python': platform.python_version(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'dataset': dataset,
+        },
+        'endpoints': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(output, file, ensure_ascii=False, indent=2)
+    print(f'Результаты сохранены в {args.output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--only', help='замерять только запросы, в названии которых есть эта строка')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='сравнить два файла результатов')
+    add_dataset_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as old, open(args.compare[1], encoding='utf-8') as new:
+            compare_results(json.load(old), json.load(new))
+    else:
+        asyncio.run(main(args))
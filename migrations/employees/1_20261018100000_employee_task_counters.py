@@ -0,0 +1,23 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "employees" ADD "active_task_count" INT NOT NULL  DEFAULT 0;
+ALTER TABLE "employees" ADD "total_task_count" INT NOT NULL  DEFAULT 0;
+CREATE INDEX "idx_employees_active_task_count" ON "employees" ("active_task_count");
+CREATE INDEX "idx_employees_total_task_count" ON "employees" ("total_task_count");
+UPDATE "employees" SET
+    "active_task_count" = (SELECT COUNT(*) FROM "tasks"
+                           WHERE "tasks"."performer_id" = "employees"."id"
+                           AND "tasks"."status" <> 'completed'),
+    "total_task_count" = (SELECT COUNT(*) FROM "tasks"
+                          WHERE "tasks"."performer_id" = "employees"."id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_employees_total_task_count";
+DROP INDEX IF EXISTS "idx_employees_active_task_count";
+ALTER TABLE "employees" DROP COLUMN "total_task_count";
+ALTER TABLE "employees" DROP COLUMN "active_task_count";"""
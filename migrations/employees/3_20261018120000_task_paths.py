@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "tasks" ADD "path" VARCHAR(2048) COLLATE "C" NOT NULL  DEFAULT '/';
+CREATE INDEX "idx_tasks_path" ON "tasks" ("path");
+WITH RECURSIVE "tree" ("id", "path") AS (
+    SELECT "id", '/'::VARCHAR FROM "tasks" WHERE "parent_task_id" IS NULL
+    UNION ALL
+    SELECT "tasks"."id", ("tree"."path" || "tree"."id" || '/')::VARCHAR
+    FROM "tasks" JOIN "tree" ON "tasks"."parent_task_id" = "tree"."id"
+)
+UPDATE "tasks" SET "path" = "tree"."path" FROM "tree" WHERE "tasks"."id" = "tree"."id";
+UPDATE "tasks" SET "parent_task_id" = NULL WHERE "path" = '/' AND "parent_task_id" IS NOT NULL;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_path";
+ALTER TABLE "tasks" DROP COLUMN "path";"""
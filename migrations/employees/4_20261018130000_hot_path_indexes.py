@@ -0,0 +1,32 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_tasks_performer_id" ON "tasks" ("performer_id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_parent_task_id" ON "tasks" ("parent_task_id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_created_at_id" ON "tasks" ("created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_deadline_id" ON "tasks" ("deadline", "id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_by_performer" ON "tasks" ("performer_id", "deadline", "id")
+    WHERE "status" IN ('new', 'in_progress');
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_unassigned_children" ON "tasks" ("parent_task_id")
+    WHERE "status" IN ('new', 'in_progress') AND "performer_id" IS NULL;
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_deadline" ON "tasks" ("deadline", "id")
+    WHERE "status" IN ('new', 'in_progress');
+DROP INDEX IF EXISTS "idx_employees_active_task_count";
+CREATE INDEX IF NOT EXISTS "idx_employees_active_task_count_id" ON "employees" ("active_task_count", "id");
+ANALYZE "tasks";
+ANALYZE "employees";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_employees_active_task_count_id";
+CREATE INDEX IF NOT EXISTS "idx_employees_active_task_count" ON "employees" ("active_task_count");
+DROP INDEX IF EXISTS "idx_tasks_active_deadline";
+DROP INDEX IF EXISTS "idx_tasks_active_unassigned_children";
+DROP INDEX IF EXISTS "idx_tasks_active_by_performer";
+DROP INDEX IF EXISTS "idx_tasks_deadline_id";
+DROP INDEX IF EXISTS "idx_tasks_created_at_id";
+DROP INDEX IF EXISTS "idx_tasks_parent_task_id";
+DROP INDEX IF EXISTS "idx_tasks_performer_id";"""
@@ -0,0 +1,41 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_active_deadline";
+DROP INDEX IF EXISTS "idx_tasks_active_unassigned_children";
+DROP INDEX IF EXISTS "idx_tasks_active_by_performer";
+ALTER TABLE "tasks" ALTER COLUMN "status" DROP DEFAULT;
+ALTER TABLE "tasks" ALTER COLUMN "status" TYPE SMALLINT USING (
+    CASE "status" WHEN 'new' THEN 1 WHEN 'in_progress' THEN 2 WHEN 'completed' THEN 3 END
+);
+ALTER TABLE "tasks" ALTER COLUMN "status" SET DEFAULT 1;
+COMMENT ON COLUMN "tasks"."status" IS 'NEW: 1\nIN_PROGRESS: 2\nCOMPLETED: 3';
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_by_performer" ON "tasks" ("performer_id", "deadline", "id")
+    WHERE "status" IN (1, 2);
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_unassigned_children" ON "tasks" ("parent_task_id")
+    WHERE "status" IN (1, 2) AND "performer_id" IS NULL;
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_deadline" ON "tasks" ("deadline", "id")
+    WHERE "status" IN (1, 2);
+ANALYZE "tasks";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_active_deadline";
+DROP INDEX IF EXISTS "idx_tasks_active_unassigned_children";
+DROP INDEX IF EXISTS "idx_tasks_active_by_performer";
+COMMENT ON COLUMN "tasks"."status" IS NULL;
+ALTER TABLE "tasks" ALTER COLUMN "status" DROP DEFAULT;
+ALTER TABLE "tasks" ALTER COLUMN "status" TYPE VARCHAR(50) USING (
+    CASE "status" WHEN 1 THEN 'new' WHEN 2 THEN 'in_progress' WHEN 3 THEN 'completed' END
+);
+ALTER TABLE "tasks" ALTER COLUMN "status" SET DEFAULT 'new';
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_by_performer" ON "tasks" ("performer_id", "deadline", "id")
+    WHERE "status" IN ('new', 'in_progress');
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_unassigned_children" ON "tasks" ("parent_task_id")
+    WHERE "status" IN ('new', 'in_progress') AND "performer_id" IS NULL;
+CREATE INDEX IF NOT EXISTS "idx_tasks_active_deadline" ON "tasks" ("deadline", "id")
+    WHERE "status" IN ('new', 'in_progress');
+ANALYZE "tasks";"""
@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_performer_id";
+DROP INDEX IF EXISTS "idx_tasks_parent_task_id";
+CREATE INDEX IF NOT EXISTS "idx_tasks_performer_id_id" ON "tasks" ("performer_id", "id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_parent_task_id_id" ON "tasks" ("parent_task_id", "id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_status_id" ON "tasks" ("status", "id");
+ANALYZE "tasks";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_status_id";
+DROP INDEX IF EXISTS "idx_tasks_parent_task_id_id";
+DROP INDEX IF EXISTS "idx_tasks_performer_id_id";
+CREATE INDEX IF NOT EXISTS "idx_tasks_parent_task_id" ON "tasks" ("parent_task_id");
+CREATE INDEX IF NOT EXISTS "idx_tasks_performer_id" ON "tasks" ("performer_id");"""
@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS "idx_tasks_search" ON "tasks" USING GIN (
+    (setweight(to_tsvector('russian', "name"), 'A') || setweight(to_tsvector('russian', coalesce("description", '')), 'B'))
+);
+CREATE INDEX IF NOT EXISTS "idx_employees_search" ON "employees" USING GIN (
+    ("first_name" || ' ' || "last_name" || ' ' || coalesce("father_name", '') || ' ' || "email" || ' ' || coalesce("position", ''))
+    gin_trgm_ops
+);
+ANALYZE "tasks";
+ANALYZE "employees";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_employees_search";
+DROP INDEX IF EXISTS "idx_tasks_search";"""
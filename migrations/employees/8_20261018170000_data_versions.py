@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "data_versions" (
+    "name" VARCHAR(50) NOT NULL  PRIMARY KEY,
+    "version" BIGINT NOT NULL  DEFAULT 0
+);
+COMMENT ON TABLE "data_versions" IS 'Модель версии данных таблицы. Версия увеличивается при каждом изменении таблицы';
+INSERT INTO "data_versions" ("name", "version") VALUES ('tasks', 1), ('employees', 1) ON CONFLICT DO NOTHING;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "data_versions";"""
@@ -0,0 +1,32 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "tasks" ADD "updated_at" TIMESTAMPTZ;
+UPDATE "tasks" SET "updated_at" = "created_at";
+ALTER TABLE "tasks" ALTER COLUMN "updated_at" SET NOT NULL;
+ALTER TABLE "tasks" ALTER COLUMN "updated_at" SET DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX IF NOT EXISTS "idx_tasks_updated_at_id" ON "tasks" ("updated_at", "id");
+ALTER TABLE "employees" ADD "updated_at" TIMESTAMPTZ;
+UPDATE "employees" SET "updated_at" = "created_at";
+ALTER TABLE "employees" ALTER COLUMN "updated_at" SET NOT NULL;
+ALTER TABLE "employees" ALTER COLUMN "updated_at" SET DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX IF NOT EXISTS "idx_employees_updated_at_id" ON "employees" ("updated_at", "id");
+CREATE TABLE IF NOT EXISTS "tombstones" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "table_name" VARCHAR(50) NOT NULL,
+    "object_id" INT NOT NULL,
+    "deleted_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS "idx_tombstones_table_name_deleted_at_id" ON "tombstones" ("table_name", "deleted_at", "id");
+COMMENT ON TABLE "tombstones" IS 'Модель записи об удалённом объекте для синхронизации изменений';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "tombstones";
+DROP INDEX IF EXISTS "idx_employees_updated_at_id";
+ALTER TABLE "employees" DROP COLUMN "updated_at";
+DROP INDEX IF EXISTS "idx_tasks_updated_at_id";
+ALTER TABLE "tasks" DROP COLUMN "updated_at";"""
@@ -0,0 +1,146 @@
+import json
+import os
+from contextlib import asynccontextmanager, nullcontext
+from typing import Callable
+
+import pytest
+
+# Настройки, без которых приложение не запускается, и быстрое хэширование паролей для тестов
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-test-secret-key-')
+os.environ.setdefault('ALGORITHM', 'HS256')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from tortoise import Tortoise, connections  # noqa: E402
+
+from app.queries import query_budget  # noqa: E402
+from app.users.auth_utils import get_current_user, user_cache  # noqa: E402
+from app.users.models import User  # noqa: E402
+from benchmarks.asgi import request, running_app  # noqa: E402
+from benchmarks.seed import BENCH_PASSWORD, seed_dataset  # noqa: E402
+
+# Размер набора данных для тестов обработчиков
+TEST_DATASET = {'employees': 20, 'roots': 10, 'depth': 3, 'children': 2, 'users': 3, 'spare': 10}
+
+
+@pytest.fixture(scope='session')
+def anyio_backend() -> str:
+    return 'asyncio'
+
+
+async def clear_database() -> None:
+    """
+    Удаление данных всех таблиц приложения (таблица миграций не очищается),
+    чтобы тесты на базе из BENCH_DB_URL не зависели от предыдущих запусков
+    """
+
+    connection = connections.get('default')
+    tables = [f'"{model._meta.db_table}"' for models in Tortoise.apps.values() for model in models.values()
+              if model._meta.db_table != 'aerich']
+    if connection.capabilities.dialect == 'postgres':
+        await connection.execute_script(f'TRUNCATE {", ".join(tables)} RESTART IDENTITY CASCADE')
+    else:
+        for table in tables:
+            await connection.execute_script(f'DELETE FROM {table}')
+
+
+@asynccontextmanager
+async def seeded_app(**sizes):
+    """
+    Приложение, запущенное на базе BENCH_DB_URL (по умолчанию SQLite в памяти) с набором данных seed_dataset,
+    и токен администратора
+
+    :param sizes: параметры seed_dataset
+    :return: идентификаторы объектов набора данных и токен
+    """
+
+    async with running_app():
+        await clear_database()
+        user_cache.clear()
+        ids = await seed_dataset(**sizes)
+        credentials = {'email': 'user0@example.com', 'password': BENCH_PASSWORD}
+        await User.filter(email=credentials['email']).update(is_superuser=True, is_staff=True)
+        _, _, body = await request('POST', '/users/token/', json_body=credentials)
+        token = json.loads(body)['access_token']
+        # Данные администратора сразу попадают в кэш авторизации, как у работающего приложения
+        await get_current_user(token)
+        yield {**ids, 'token': token}
+
+
+@pytest.fixture
+async def dataset() -> dict:
+    """
+    Новый набор данных для каждого теста, поэтому изменяющие тесты не влияют друг на друга
+    """
+
+    async with seeded_app(**TEST_DATASET) as ids:
+        yield ids
+
+
+class ApiClient:
+    """
+    Вызов обработчиков приложения через ASGI в цикле событий теста
+    """
+
+    def __init__(self, token: str) -> None:
+        self.token = token
+
+    async def request(self, method: str, path: str, json_body=None, query: str = '',
+                      headers: dict | None = None) -> tuple[int, dict, object]:
+        """
+        Выполнение запроса к приложению от имени администратора
+
+        :param method: HTTP-метод
+        :param path: путь
+        :param json_body: тело запроса
+        :param query: строка запроса
+        :param headers: дополнительные заголовки
+        :return: кортеж из статуса, заголовков и тела ответа (JSON ответ разбирается)
+        """
+
+        status, response_headers, body = await request(method, path, token=self.token, json_body=json_body,
+                                                       query=query, headers=headers)
+        if response_headers.get('content-type', '').startswith('application/json'):
+            return status, response_headers, json.loads(body)
+        return status, response_headers, body
+
+    async def call(self, method: str, path: str, budget: int | None = None, json_body=None, query: str = ''):
+        """
+        Выполнение запроса к приложению, которое должно завершиться успешно
+        и выполнить не больше budget запросов к базе
+
+        :param method: HTTP-метод
+        :param path: путь
+        :param budget: допустимое количество запросов к базе (None - без проверки)
+        :param json_body: тело запроса
+        :param query: строка запроса
+        :return: тело ответа
+        """
+
+        with query_budget(budget) if budget is not None else nullcontext():
+            status, _, body = await self.request(method, path, json_body=json_body, query=query)
+        assert status < 400, body
+        return body
+
+
+@pytest.fixture
+def api(dataset: dict) -> ApiClient:
+    return ApiClient(dataset['token'])
+
+
+def query_budget_test(endpoints: dict) -> Callable:
+    """
+    Тест количества запросов к базе для обработчиков роутера
+
+    :param endpoints: допустимое количество запросов и функция, которая по идентификаторам набора данных
+        возвращает метод, путь, строку запроса и тело, по названиям обработчиков
+    :return: тест, параметризованный названиями обработчиков
+    """
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize('name', endpoints)
+    async def test_query_budget(api: ApiClient, dataset: dict, name: str) -> None:
+        budget, make_request = endpoints[name]
+        method, path, query, body = make_request(dataset)
+        await api.call(method, path, budget, json_body=body, query=query)
+
+    return test_query_budget
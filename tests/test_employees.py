@@ -0,0 +1,41 @@
+import pytest
+
+from app.events import hub
+from app.tasks.models import Task
+from tests.conftest import ApiClient, query_budget_test
+
+# Допустимое количество запросов к базе и запрос (метод, путь, строка запроса, тело) по идентификаторам набора данных
+ENDPOINTS = {
+    'GET /employees/sorted_by_tasks/': (2, lambda ids: ('GET', '/employees/sorted_by_tasks/', 'limit=50', None)),
+    'GET /employees/': (2, lambda ids: ('GET', '/employees/', 'limit=50', None)),
+    'GET /employees/search/': (2, lambda ids: ('GET', '/employees/search/', 'q=Фамилия1', None)),
+    'GET /employees/changes/': (2, lambda ids: ('GET', '/employees/changes/', 'limit=100', None)),
+    'GET /employees/export/': (1, lambda ids: ('GET', '/employees/export/', '', None)),
+    'GET /employees/{id}/': (1, lambda ids: ('GET', f"/employees/{ids['employees'][0]}/", '', None)),
+    'POST /employees/': (4, lambda ids: ('POST', '/employees/', '', {'first_name': 'Имя', 'last_name': 'Фамилия',
+                                                                     'email': 'new@example.com', 'phone': '1234567'})),
+    'PUT /employees/{id}/': (9, lambda ids: ('PUT', f"/employees/{ids['employees'][0]}/", '',
+                                             {'position': 'Должность'})),
+    'DELETE /employees/{id}/': (11, lambda ids: ('DELETE', f"/employees/{ids['spare_employees'][0]}/", '', None)),
+}
+
+
+test_query_budget = query_budget_test(ENDPOINTS)
+
+
+@pytest.mark.anyio
+async def test_delete_employee_task_events(api: ApiClient, dataset: dict) -> None:
+    employee_id = dataset['employees'][0]
+    tasks = {task['id']: task['path'] for task in await Task.filter(performer_id=employee_id).values('id', 'path')}
+    assert tasks
+    subscription = hub.subscribe(performer=employee_id)
+
+    await api.call('DELETE', f'/employees/{employee_id}/')
+
+    hub.unsubscribe(subscription)
+    events = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+    assert events[0] == {'type': 'employee.deleted', 'id': employee_id}
+    # Задачи остались без исполнителя, подписчик на сотрудника узнаёт о них по прежнему исполнителю
+    assert {event['id']: event['previous_path'] for event in events[1:]} == tasks
+    assert all(event['type'] == 'task.updated' and event['performer_id'] is None
+               and event['previous_performer_id'] == employee_id for event in events[1:])
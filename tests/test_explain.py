@@ -0,0 +1,100 @@
+import json
+import logging
+
+import pytest
+from tortoise import connections
+
+from benchmarks.asgi import BENCH_DB_URL, request
+from tests.conftest import seeded_app
+
+pytestmark = pytest.mark.skipif(not BENCH_DB_URL.startswith(('postgres', 'asyncpg')),
+                                reason='Планы запросов проверяются на PostgreSQL с применёнными миграциями '
+                                       '(адрес базы в BENCH_DB_URL)')
+
+# Таблицы, размер которых растёт вместе с данными. Небольшие служебные таблицы читаются целиком законно
+LARGE_TABLES = frozenset(('tasks', 'employees'))
+
+# Самые частые запросы приложения: путь и строка запроса по идентификаторам набора данных
+HOT_REQUESTS = {
+    'important_tasks': lambda ids: ('/tasks/important/', ''),
+    'balanced_important_tasks': lambda ids: ('/tasks/important/', 'balanced=true'),
+    'employees_sorted_by_tasks': lambda ids: ('/employees/sorted_by_tasks/', 'limit=20'),
+    'employees_page': lambda ids: ('/employees/', 'limit=20'),
+    'tasks_page_by_id': lambda ids: ('/tasks/', 'limit=20'),
+    'tasks_page_by_deadline': lambda ids: ('/tasks/', 'limit=20&order_by=deadline'),
+    'tasks_page_by_performer': lambda ids: ('/tasks/', f"limit=20&performer={ids['employees'][0]}"),
+    'tasks_page_by_status': lambda ids: ('/tasks/', 'limit=20&status=completed'),
+    'overdue_tasks': lambda ids: ('/tasks/', 'limit=20&overdue=true&order_by=deadline'),
+    'task_subtree': lambda ids: (f"/tasks/{ids['root_tasks'][0]}/subtree/", ''),
+    'task_ancestors': lambda ids: (f"/tasks/{ids['leaf_tasks'][0]}/ancestors/", ''),
+}
+
+
+class QueryCollector(logging.Handler):
+    """
+    Сбор запросов к базе с параметрами по журналу Tortoise (клиент asyncpg записывает запрос и параметры
+    на уровне DEBUG)
+    """
+
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.queries: list[tuple[str, list | None]] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if isinstance(record.args, tuple) and len(record.args) == 2:
+            self.queries.append(record.args)
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    """
+    Рекурсивный поиск в плане PostgreSQL узлов последовательного чтения таблиц
+
+    :param plan: узел плана в формате JSON
+    :return: список таблиц, читаемых целиком
+    """
+
+    tables = [plan['Relation Name']] if plan.get('Node Type') == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        tables.extend(find_seq_scans(child))
+    return tables
+
+
+@pytest.fixture(scope='module')
+async def analyzed() -> dict:
+    # Набор данных размером как в замерах: на нескольких десятках строк планировщик законно читает таблицы целиком.
+    # Без свежей статистики планировщик оценивает таблицы по умолчанию и выбирает планы не по данным
+    async with seeded_app() as ids:
+        await connections.get('default').execute_script('ANALYZE')
+        yield ids
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('name', HOT_REQUESTS)
+async def test_hot_queries_use_indexes(analyzed: dict, name: str) -> None:
+    path, query = HOT_REQUESTS[name](analyzed)
+    collector = QueryCollector()
+    db_logger = logging.getLogger('tortoise.db_client')
+    level = db_logger.level
+    db_logger.addHandler(collector)
+    db_logger.setLevel(logging.DEBUG)
+    try:
+        status, _, body = await request('GET', path, token=analyzed['token'], query=query)
+    finally:
+        db_logger.removeHandler(collector)
+        db_logger.setLevel(level)
+    assert status == 200, body
+
+    # Запросы планируются с параметрами, с которыми их выполнил обработчик; последовательное чтение не запрещается
+    connection = connections.get('default')
+    failures = []
+    for sql, values in collector.queries:
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            continue
+        _, rows = await connection.execute_query(f'EXPLAIN (FORMAT JSON) {sql}', values or None)
+        plan = rows[0]['QUERY PLAN']
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans = [table for table in find_seq_scans(plan[0]['Plan']) if table in LARGE_TABLES]
+        if scans:
+            failures.append(f"полное чтение таблиц {', '.join(scans)}: {sql}")
+    assert not failures, '\n'.join(failures)
@@ -0,0 +1,99 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.employees.models import Employee
+from app.tasks.models import Task, TaskStatus
+from tests.conftest import ApiClient
+
+# Размер страницы меньше групп задач с одинаковым значением поля сортировки
+PAGE_SIZE = 7
+
+
+async def walk_pages(api: ApiClient, path: str, query: str) -> list[int]:
+    """
+    Обход всех страниц списка по курсору
+
+    :param api: клиент
+    :param path: путь списка
+    :param query: строка запроса без курсора
+    :return: идентификаторы объектов в порядке выдачи
+    """
+
+    ids, cursor = [], None
+    while True:
+        status, _, body = await api.request('GET', path, query=query + (f'&cursor={cursor}' if cursor else ''))
+        assert status == 200, body
+        assert len(body['items']) <= PAGE_SIZE
+        ids.extend(item['id'] for item in body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return ids
+
+
+def sorted_ids(rows: list[dict], order_by: str) -> list[int]:
+    """
+    Ожидаемый порядок выдачи: по полю сортировки, пустые значения в конце, при равных значениях по id
+    """
+
+    return [row['id'] for row in sorted(rows, key=lambda row: (row[order_by] is None, row[order_by] or 0, row['id']))]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('order_by', ['id', 'created_at', 'deadline'])
+@pytest.mark.parametrize('fields', ['', 'fields=id,deadline'])
+async def test_task_pages(api: ApiClient, dataset: dict, order_by: str, fields: str) -> None:
+    moment = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    await Task.filter(id__in=dataset['leaf_tasks'][:3 * PAGE_SIZE]).update(deadline=moment, created_at=moment)
+    await Task.filter(id__in=dataset['spare_tasks']).update(deadline=None)
+
+    ids = await walk_pages(api, '/tasks/', f'limit={PAGE_SIZE}&order_by={order_by}&{fields}')
+
+    assert ids == sorted_ids(await Task.all().values(*{'id', order_by}), order_by)
+
+
+@pytest.mark.anyio
+async def test_filtered_task_pages(api: ApiClient, dataset: dict) -> None:
+    ids = await walk_pages(api, '/tasks/', f'limit={PAGE_SIZE}&order_by=deadline&status=new&status=in_progress')
+
+    rows = await Task.filter(status__in=[TaskStatus.NEW, TaskStatus.IN_PROGRESS]).values('id', 'deadline')
+    assert ids == sorted_ids(rows, 'deadline')
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('order_by', ['id', 'created_at'])
+async def test_employee_pages(api: ApiClient, dataset: dict, order_by: str) -> None:
+    await Employee.filter(id__in=dataset['employees'][:3 * PAGE_SIZE]).update(
+        created_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    ids = await walk_pages(api, '/employees/', f'limit={PAGE_SIZE}&order_by={order_by}')
+
+    assert ids == sorted_ids(await Employee.all().values(*{'id', order_by}), order_by)
+
+
+@pytest.mark.anyio
+async def test_employees_sorted_by_tasks_pages(api: ApiClient, dataset: dict) -> None:
+    # Сотрудников с одинаковым количеством активных задач больше, чем помещается на странице
+    ids = await walk_pages(api, '/employees/sorted_by_tasks/', f'limit={PAGE_SIZE}&tasks_limit=0')
+
+    rows = await Employee.filter(active_task_count__gt=0).values('id', 'active_task_count')
+    assert ids == sorted_ids(rows, 'active_task_count')
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('cursor', ['not-a-cursor', 'e30', 'eyJvIjoiZGVhZGxpbmUiLCJ2IjoieCIsImlkIjoxfQ'])
+async def test_malformed_cursor(api: ApiClient, cursor: str) -> None:
+    status, _, body = await api.request('GET', '/tasks/', query=f'order_by=deadline&cursor={cursor}')
+
+    assert status == 400
+    assert body == {'detail': 'Некорректный курсор'}
+
+
+@pytest.mark.anyio
+async def test_cursor_for_other_order(api: ApiClient) -> None:
+    _, _, page = await api.request('GET', '/tasks/', query=f'limit={PAGE_SIZE}')
+
+    status, _, body = await api.request('GET', '/tasks/', query=f"order_by=deadline&cursor={page['next_cursor']}")
+
+    assert status == 400
+    assert body == {'detail': 'Курсор получен для другой сортировки'}
@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+from starlette.responses import PlainTextResponse
+from tortoise import connections
+
+from app import queries
+from app.queries import QueryBudgetExceeded, QueryStatsMiddleware, query_budget, track_queries
+
+
+async def call_asgi(app, path: str) -> dict:
+    """
+    Выполнение GET-запроса к ASGI-приложению
+
+    :param app: приложение
+    :param path: путь
+    :return: сообщение о начале ответа
+    """
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': [], 'query_string': b''}
+    messages = []
+
+    async def receive() -> dict:
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]
+
+
+def repeating_app(repeats: int):
+    """
+    Приложение, которое выполняет один и тот же по форме запрос repeats раз с разными значениями (N+1)
+
+    :param repeats: количество запросов
+    :return: ASGI-приложение
+    """
+
+    async def app(scope, receive, send) -> None:
+        for task_id in range(repeats):
+            await connections.get('default').execute_query(f'SELECT "name" FROM "tasks" WHERE "id" = {task_id}')
+        await PlainTextResponse('ok')(scope, receive, send)
+
+    return app
+
+
+@pytest.mark.anyio
+async def test_query_headers(api, dataset: dict) -> None:
+    with track_queries() as stats:
+        status, headers, _ = await api.request('GET', f"/tasks/{dataset['leaf_tasks'][0]}/")
+
+    assert status == 200
+    assert stats.count > 0
+    assert headers['x-query-count'] == str(stats.count)
+    assert headers['server-timing'].startswith('db;dur=')
+    assert headers['server-timing'].endswith(f'desc="{stats.count} queries"')
+
+
+@pytest.mark.anyio
+async def test_streaming_response_count_is_logged(api, caplog) -> None:
+    with caplog.at_level(logging.INFO, logger='app.queries'):
+        status, headers, _ = await api.request('GET', '/tasks/export/')
+
+    assert status == 200
+    assert 'x-query-count' not in headers
+    assert 'server-timing' not in headers
+    assert any('GET /tasks/export/: потоковый ответ, запросов к базе:' in record.getMessage()
+               for record in caplog.records)
+
+
+@pytest.mark.anyio
+async def test_repeated_queries_warning(dataset: dict, caplog) -> None:
+    with caplog.at_level(logging.WARNING, logger='app.queries'):
+        start = await call_asgi(QueryStatsMiddleware(repeating_app(queries.QUERY_REPEAT_WARNING)), '/allowed/')
+        assert not caplog.records
+        start = await call_asgi(QueryStatsMiddleware(repeating_app(queries.QUERY_REPEAT_WARNING + 1)), '/repeated/')
+
+    assert dict(start['headers'])[b'x-query-count'] == str(queries.QUERY_REPEAT_WARNING + 1).encode()
+    [record] = caplog.records
+    assert record.getMessage() == (f'GET /repeated/: запрос выполнен {queries.QUERY_REPEAT_WARNING + 1} раз: '
+                                   f'SELECT "name" FROM "tasks" WHERE "id" = ?')
+
+
+@pytest.mark.anyio
+async def test_query_budget_exceeded(dataset: dict) -> None:
+    connection = connections.get('default')
+    with query_budget(2):
+        await connection.execute_query('SELECT 1')
+        await connection.execute_query('SELECT 2')
+
+    with pytest.raises(QueryBudgetExceeded, match='Выполнено запросов: 3, допустимо: 2\n3 x SELECT ?'):
+        with query_budget(2):
+            for value in range(3):
+                await connection.execute_query(f'SELECT {value}')
@@ -0,0 +1,324 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.employees.models import Employee
+from app.tasks.models import Task, TaskStatus
+from app.tasks.schemas import PARENT_TASK_FIELDS
+from app.tasks.services import distribute_important_tasks
+from tests.conftest import ApiClient, query_budget_test
+
+# Допустимое количество запросов к базе и запрос (метод, путь, строка запроса, тело) по идентификаторам набора данных
+ENDPOINTS = {
+    'GET /tasks/important/': (3, lambda ids: ('GET', '/tasks/important/', '', None)),
+    'GET /tasks/important/ (balanced)': (3, lambda ids: ('GET', '/tasks/important/', 'balanced=true', None)),
+    'POST /tasks/important/assign/': (10, lambda ids: ('POST', '/tasks/important/assign/', '', None)),
+    'GET /tasks/': (3, lambda ids: ('GET', '/tasks/', 'limit=50', None)),
+    'GET /tasks/ (filtered)': (4, lambda ids: ('GET', '/tasks/', 'limit=50&status=new&order_by=deadline', None)),
+    'GET /tasks/ (sparse)': (3, lambda ids: ('GET', '/tasks/', 'limit=50&fields=id,name,status&expand=performer',
+                                             None)),
+    'GET /tasks/search/': (2, lambda ids: ('GET', '/tasks/search/', 'q=задача', None)),
+    'GET /tasks/changes/': (2, lambda ids: ('GET', '/tasks/changes/', 'limit=100', None)),
+    'GET /tasks/export/': (1, lambda ids: ('GET', '/tasks/export/', '', None)),
+    'POST /tasks/bulk/': (8, lambda ids: ('POST', '/tasks/bulk/', '', {'items': [
+        {'name': f'Новая задача {k}', 'performer': ids['employees'][k]} for k in range(10)]})),
+    'PATCH /tasks/bulk/': (7, lambda ids: ('PATCH', '/tasks/bulk/', '', {'items': [
+        {'id': task_id, 'name': 'Задача'} for task_id in ids['leaf_tasks'][:10]]})),
+    'DELETE /tasks/bulk/': (10, lambda ids: ('DELETE', '/tasks/bulk/', '', {'ids': ids['spare_tasks'][:5]})),
+    'GET /tasks/{id}/': (1, lambda ids: ('GET', f"/tasks/{ids['leaf_tasks'][0]}/", '', None)),
+    'GET /tasks/{id}/ (sparse)': (3, lambda ids: ('GET', f"/tasks/{ids['leaf_tasks'][0]}/",
+                                                  'fields=id,name&expand=parent_task.performer', None)),
+    'GET /tasks/{id}/subtree/': (2, lambda ids: ('GET', f"/tasks/{ids['root_tasks'][0]}/subtree/", '', None)),
+    'GET /tasks/{id}/ancestors/': (2, lambda ids: ('GET', f"/tasks/{ids['leaf_tasks'][0]}/ancestors/", '', None)),
+    'POST /tasks/': (6, lambda ids: ('POST', '/tasks/', '', {'name': 'Новая задача',
+                                                             'parent_task': ids['root_tasks'][0]})),
+    'PUT /tasks/{id}/': (11, lambda ids: ('PUT', f"/tasks/{ids['leaf_tasks'][0]}/", '',
+                                         {'status': 'in_progress', 'performer': ids['employees'][0]})),
+    'PATCH /tasks/{id}/': (11, lambda ids: ('PATCH', f"/tasks/{ids['root_tasks'][1]}/", '',
+                                           {'name': 'Задача', 'parent_task': ids['root_tasks'][2]})),
+    'DELETE /tasks/{id}/': (9, lambda ids: ('DELETE', f"/tasks/{ids['spare_tasks'][5]}/", '', None)),
+}
+
+
+test_query_budget = query_budget_test(ENDPOINTS)
+
+
+async def assert_task_counters() -> None:
+    """
+    Проверка счётчиков задач у всех сотрудников пересчётом по задачам
+    """
+
+    expected = {employee_id: [0, 0] for employee_id in await Employee.all().values_list('id', flat=True)}
+    for performer_id, status in await Task.filter(performer_id__isnull=False).values_list('performer_id', 'status'):
+        expected[performer_id][1] += 1
+        if status != TaskStatus.COMPLETED:
+            expected[performer_id][0] += 1
+    actual = {employee_id: [active, total] for employee_id, active, total in
+              await Employee.all().values_list('id', 'active_task_count', 'total_task_count')}
+    assert actual == expected
+
+
+async def assert_task_paths() -> None:
+    """
+    Проверка путей всех задач по ссылкам на родительские задачи
+    """
+
+    tasks = {task_id: (parent_task_id, path) for task_id, parent_task_id, path in
+             await Task.all().values_list('id', 'parent_task_id', 'path')}
+    for task_id, (parent_task_id, path) in tasks.items():
+        expected = '/' if parent_task_id is None else f'{tasks[parent_task_id][1]}{parent_task_id}/'
+        assert path == expected, task_id
+
+
+async def get_children(task_id: int) -> list[int]:
+    return await Task.filter(parent_task_id=task_id).order_by('id').values_list('id', flat=True)
+
+
+@pytest.mark.anyio
+async def test_bulk_update_item_errors(api: ApiClient, dataset: dict) -> None:
+    root, leaf = dataset['root_tasks'][0], dataset['leaf_tasks'][0]
+    status, _, body = await api.request('PATCH', '/tasks/bulk/', json_body={'items': [
+        {'id': leaf, 'name': 'Переименованная задача'},
+        {'id': dataset['leaf_tasks'][1], 'performer': 10 ** 6},
+        {'id': dataset['leaf_tasks'][2], 'parent_task': 10 ** 6},
+        {'id': leaf, 'status': 'completed'},
+        {'id': 10 ** 6, 'name': 'Задача'},
+        {'id': root, 'parent_task': root},
+        {'id': root, 'parent_task': leaf},
+        {'id': dataset['spare_tasks'][0], 'parent_task': root, 'performer': dataset['employees'][0]},
+    ]})
+
+    assert status == 200, body
+    assert body == {'ids': [leaf, dataset['spare_tasks'][0]], 'errors': [
+        {'index': 1, 'detail': 'Сотрудник 1000000 не найден'},
+        {'index': 2, 'detail': 'Задача 1000000 не найдена'},
+        {'index': 3, 'detail': f'Задача {leaf} уже указана в запросе'},
+        {'index': 4, 'detail': 'Задача 1000000 не найдена'},
+        {'index': 5, 'detail': 'Нельзя указывать в качестве родительской задачи саму себя'},
+        {'index': 6, 'detail': 'Нельзя указывать в качестве родительской задачи подзадачу этой же задачи'},
+    ]}
+    assert await Task.get(id=leaf).values_list('name', flat=True) == 'Переименованная задача'
+    assert await Task.get(id=dataset['spare_tasks'][0]).values_list('parent_task_id', 'path') == (root, f'/{root}/')
+    await assert_task_paths()
+    await assert_task_counters()
+
+
+@pytest.mark.anyio
+async def test_bulk_update_cycle_rolls_back(api: ApiClient, dataset: dict) -> None:
+    first, second = dataset['root_tasks'][:2]
+    before = await Task.all().order_by('id').values('id', 'name', 'parent_task_id', 'path', 'updated_at')
+
+    status, _, body = await api.request('PATCH', '/tasks/bulk/', json_body={'items': [
+        {'id': dataset['leaf_tasks'][0], 'name': 'Задача'},
+        {'id': first, 'parent_task': (await get_children(second))[0]},
+        {'id': second, 'parent_task': (await get_children(first))[0]},
+    ]})
+
+    assert status == 409, body
+    assert body == {'detail': f'Переносы задач {first}, {second} образуют цикл'}
+    assert await Task.all().order_by('id').values('id', 'name', 'parent_task_id', 'path', 'updated_at') == before
+
+
+@pytest.mark.anyio
+async def test_bulk_update_moves_and_counters(api: ApiClient, dataset: dict) -> None:
+    first, second = dataset['root_tasks'][:2]
+    child = (await get_children(first))[0]
+    employee = dataset['employees'][0]
+
+    # Задача переносится под собственную подзадачу, которая в том же запросе становится корневой,
+    # а родительская задача второй переносимой задачи сама переносится этим запросом
+    status, _, body = await api.request('PATCH', '/tasks/bulk/', json_body={'items': [
+        {'id': first, 'parent_task': child, 'performer': employee, 'status': 'completed'},
+        {'id': child, 'parent_task': None},
+        {'id': second, 'parent_task': first, 'performer': None},
+        {'id': dataset['leaf_tasks'][0], 'performer': employee, 'status': 'in_progress'},
+    ]})
+
+    assert status == 200, body
+    assert body == {'ids': [first, child, second, dataset['leaf_tasks'][0]], 'errors': []}
+    assert await Task.get(id=second).values_list('path', flat=True) == f'/{child}/{first}/'
+    await assert_task_paths()
+    await assert_task_counters()
+
+
+@pytest.mark.anyio
+async def test_bulk_delete_nested(api: ApiClient, dataset: dict) -> None:
+    root = dataset['root_tasks'][0]
+    child, other = await get_children(root)
+    child_leaves, other_leaves = await get_children(child), await get_children(other)
+
+    status, _, body = await api.request('DELETE', '/tasks/bulk/', json_body={'ids': [child, root, 10 ** 6]})
+
+    assert status == 200, body
+    assert sorted(body['ids']) == sorted([root, child])
+    assert body['errors'] == [{'index': 2, 'detail': 'Задача 1000000 не найдена'}]
+    assert await Task.filter(id__in=[root, child]).count() == 0
+    # Подзадачи удалённых задач становятся корневыми вместе со своими поддеревьями
+    assert set(await Task.filter(id__in=[other, *child_leaves]).values_list('path', flat=True)) == {'/'}
+    assert set(await Task.filter(id__in=other_leaves).values_list('path', flat=True)) == {f'/{other}/'}
+    await assert_task_paths()
+    await assert_task_counters()
+
+
+
+
+@pytest.mark.anyio
+async def test_patch_task_references(api: ApiClient, dataset: dict) -> None:
+    root, leaf = dataset['root_tasks'][0], dataset['leaf_tasks'][0]
+    before = await Task.all().order_by('id').values('id', 'name', 'parent_task_id', 'path', 'updated_at')
+
+    for body, expected in [
+        ({'name': 'Задача', 'parent_task': leaf}, (400, 'Нельзя указывать в качестве родительской задачи подзадачу '
+                                                        'этой же задачи')),
+        ({'name': 'Задача', 'parent_task': root}, (400, 'Нельзя указывать в качестве родительской задачи саму себя')),
+        ({'name': 'Задача', 'parent_task': 10 ** 6}, (404, 'Задача 1000000 не найдена')),
+        ({'name': 'Задача', 'performer': 10 ** 6}, (404, 'Сотрудник 1000000 не найден')),
+    ]:
+        status, _, response = await api.request('PATCH', f'/tasks/{root}/', json_body=body)
+        assert (status, response['detail']) == expected
+
+    assert await Task.all().order_by('id').values('id', 'name', 'parent_task_id', 'path', 'updated_at') == before
+
+async def get_counters(employee_id: int) -> tuple[int, int]:
+    return await Employee.get(id=employee_id).values_list('active_task_count', 'total_task_count')
+
+
+@pytest.mark.anyio
+async def test_task_counters(api: ApiClient, dataset: dict) -> None:
+    first, second = dataset['spare_employees'][:2]
+
+    task = await api.call('POST', '/tasks/', json_body={'name': 'Задача', 'performer': first})
+    assert await get_counters(first) == (1, 1)
+
+    await api.call('PUT', f"/tasks/{task['id']}/", json_body={'performer': second, 'status': 'in_progress'})
+    assert (await get_counters(first), await get_counters(second)) == ((0, 0), (1, 1))
+
+    await api.call('PATCH', f"/tasks/{task['id']}/", json_body={'status': 'completed'})
+    assert await get_counters(second) == (0, 1)
+
+    await api.call('DELETE', f"/tasks/{task['id']}/")
+    assert await get_counters(second) == (0, 0)
+
+    await api.call('POST', '/tasks/bulk/', json_body={'items': [
+        {'name': 'Задача', 'performer': first}, {'name': 'Задача', 'performer': first, 'status': 'completed'}]})
+    assert await get_counters(first) == (1, 2)
+
+    await api.call('DELETE', f'/employees/{first}/')
+    await assert_task_counters()
+
+
+@pytest.mark.anyio
+async def test_etag(api: ApiClient, dataset: dict) -> None:
+    status, headers, _ = await api.request('GET', '/tasks/', query='limit=5')
+    etag = headers['etag']
+    assert status == 200 and etag.startswith('W/')
+
+    status, headers, body = await api.request('GET', '/tasks/', query='limit=5', headers={'If-None-Match': etag})
+    assert (status, headers['etag'], body) == (304, etag, b'')
+
+    # Ответ зависит от исполнителей, поэтому изменение сотрудника меняет ETag списка задач
+    await api.call('PUT', f"/employees/{dataset['employees'][0]}/", json_body={'position': 'Руководитель'})
+    status, headers, _ = await api.request('GET', '/tasks/', query='limit=5', headers={'If-None-Match': etag})
+    assert status == 200 and headers['etag'] != etag
+
+
+@pytest.mark.anyio
+async def test_overdue_has_no_etag(api: ApiClient, dataset: dict) -> None:
+    _, headers, _ = await api.request('GET', '/tasks/', query='limit=5')
+
+    # Просроченность меняется со временем без изменения данных, поэтому ETag не выдаётся и не проверяется
+    status, overdue_headers, body = await api.request('GET', '/tasks/', query='limit=5&overdue=true',
+                                                      headers={'If-None-Match': headers['etag']})
+    assert status == 200 and body['items']
+    assert 'etag' not in overdue_headers
+
+
+@pytest.mark.anyio
+async def test_task_changes(api: ApiClient, dataset: dict, monkeypatch) -> None:
+    monkeypatch.setattr('app.sync.CHANGES_SYNC_LAG', 0)
+
+    # Первая синхронизация выдаёт все задачи частями, без удалений до её начала
+    seen, token, has_more = [], None, True
+    while has_more:
+        body = await api.call('GET', '/tasks/changes/', query='limit=7' + (f'&since={token}' if token else ''))
+        assert body['deleted'] == []
+        seen.extend(item['id'] for item in body['items'])
+        token, has_more = body['next_token'], body['has_more']
+    assert sorted(seen) == sorted(await Task.all().values_list('id', flat=True))
+
+    root, spare = dataset['root_tasks'][0], dataset['spare_tasks'][0]
+    await api.call('PATCH', f'/tasks/{root}/', json_body={'name': 'Переименованная задача'})
+    await api.call('DELETE', f'/tasks/{spare}/')
+
+    # Название задачи выводится в подзадачах, поэтому они тоже считаются изменёнными
+    body = await api.call('GET', '/tasks/changes/', query=f'since={token}')
+    assert sorted(item['id'] for item in body['items']) == sorted([root, *await get_children(root)])
+    assert body['deleted'] == [spare] and not body['has_more']
+
+    body = await api.call('GET', '/tasks/changes/', query=f"since={body['next_token']}")
+    assert (body['items'], body['deleted']) == ([], [])
+
+    status, _, body = await api.request('GET', '/tasks/changes/', query='since=not-a-token')
+    assert (status, body) == (400, {'detail': 'Некорректный токен синхронизации'})
+
+
+@pytest.mark.anyio
+async def test_sparse_task_fields(api: ApiClient, dataset: dict) -> None:
+    leaf = dataset['leaf_tasks'][0]
+    parent_id = await Task.get(id=leaf).values_list('parent_task_id', flat=True)
+    parent_performer_id = await Task.get(id=parent_id).values_list('performer_id', flat=True)
+
+    task = await api.call('GET', f'/tasks/{leaf}/', query='fields=name')
+    assert set(task) == {'id', 'name'}
+
+    task = await api.call('GET', f'/tasks/{leaf}/', query='fields=name&expand=parent_task.performer')
+    assert set(task) == {'id', 'name', 'parent_task'}
+    assert set(task['parent_task']) == set(PARENT_TASK_FIELDS) and task['parent_task']['id'] == parent_id
+    performer = task['parent_task']['performer']
+    assert (performer and performer['id']) == parent_performer_id
+    assert performer is None or set(performer) == {'id', 'full_name', 'position'}
+
+    page = await api.call('GET', '/tasks/', query='limit=5&fields=status,performer')
+    assert [set(item) for item in page['items']] == [{'id', 'status', 'performer'}] * 5
+    assert all(item['performer'] is None or isinstance(item['performer'], int) for item in page['items'])
+
+    status, _, body = await api.request('GET', '/tasks/', query='fields=name,owner&expand=author')
+    assert (status, body) == (400, {'detail': 'Неизвестные поля: author, owner'})
+
+def important_task(task_id: int, days: int | None = None, parent_performer_id: int | None = None) -> dict:
+    deadline = None if days is None else datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(days=days)
+    return {'id': task_id, 'deadline': deadline, 'parent_performer_id': parent_performer_id}
+
+
+def test_distribute_in_deadline_order() -> None:
+    tasks = [important_task(1), important_task(2, days=5), important_task(3, days=1), important_task(4, days=1)]
+
+    assignments = distribute_important_tasks(tasks, {10: 0, 20: 0})
+
+    # Каждой задаче предлагается один исполнитель, задачи без срока - последними, при равном сроке - по id
+    assert list(assignments) == [3, 4, 2, 1]
+    assert assignments == {3: 10, 4: 20, 2: 10, 1: 20}
+
+
+def test_distribute_updates_load_after_each_pick() -> None:
+    tasks = [important_task(task_id, days=task_id) for task_id in range(1, 6)]
+
+    assignments = distribute_important_tasks(tasks, {10: 1, 20: 1, 30: 3})
+
+    assert assignments == {1: 10, 2: 20, 3: 10, 4: 20, 5: 10}
+
+
+def test_distribute_prefers_free_employees() -> None:
+    tasks = [important_task(1, days=1, parent_performer_id=20), important_task(2, days=2, parent_performer_id=20)]
+
+    # Пока есть свободный сотрудник, задача достаётся ему, даже если исполнитель родительской задачи загружен мало
+    assert distribute_important_tasks(tasks, {10: 0, 20: 1}) == {1: 10, 2: 20}
+    assert distribute_important_tasks(tasks, {10: 0, 20: 5}) == {1: 10, 2: 10}
+
+
+def test_distribute_parent_performer_rule() -> None:
+    # Исполнитель родительской задачи получает задачу, если у него не более чем на две задачи больше минимума
+    assert distribute_important_tasks([important_task(1, parent_performer_id=20)], {10: 1, 20: 3}) == {1: 20}
+    assert distribute_important_tasks([important_task(1, parent_performer_id=20)], {10: 1, 20: 4}) == {1: 10}
+    assert distribute_important_tasks([important_task(1, parent_performer_id=30)], {10: 1, 20: 3}) == {1: 10}
+    assert distribute_important_tasks([important_task(1)], {}) == {}
@@ -0,0 +1,88 @@
+import pytest
+from tortoise.expressions import F
+
+from app.events import hub
+from app.users.auth_utils import USER_INVALIDATED_EVENT, user_cache
+from app.users.models import User
+from benchmarks.seed import BENCH_PASSWORD
+from tests.conftest import ApiClient, query_budget_test
+
+# Допустимое количество запросов к базе и запрос (метод, путь, строка запроса, тело) по идентификаторам набора данных
+ENDPOINTS = {
+    'POST /users/token/': (2, lambda ids: ('POST', '/users/token/', '',
+                                           {'email': 'user1@example.com', 'password': BENCH_PASSWORD})),
+    'GET /users/': (1, lambda ids: ('GET', '/users/', 'limit=50', None)),
+    'POST /users/': (1, lambda ids: ('POST', '/users/', '', {'email': 'new@example.com', 'password': BENCH_PASSWORD,
+                                                              'password2': BENCH_PASSWORD})),
+    'GET /users/{id}/': (1, lambda ids: ('GET', f"/users/{ids['users'][1]}/", '', None)),
+    'PUT /users/{id}/': (3, lambda ids: ('PUT', f"/users/{ids['users'][1]}/", '', {'first_name': 'Имя'})),
+    'DELETE /users/{id}/': (2, lambda ids: ('DELETE', f"/users/{ids['spare_users'][0]}/", '', None)),
+}
+
+
+test_query_budget = query_budget_test(ENDPOINTS)
+
+
+async def login(api: ApiClient, email: str) -> ApiClient:
+    """
+    Вход пользователя из набора данных
+
+    :param api: клиент администратора
+    :param email: email пользователя
+    :return: клиент пользователя
+    """
+
+    body = await api.call('POST', '/users/token/', json_body={'email': email, 'password': BENCH_PASSWORD})
+    return ApiClient(body['access_token'])
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('changes', [{'is_active': False}, {'password': 'new-password'}])
+async def test_token_revoked_after_update(api: ApiClient, dataset: dict, changes: dict) -> None:
+    user_id = dataset['users'][1]
+    user_api = await login(api, 'user1@example.com')
+    # Данные пользователя попадают в кэш авторизации
+    await user_api.call('GET', f'/users/{user_id}/')
+    assert user_cache.get('user1@example.com') is not None
+
+    await api.call('PUT', f'/users/{user_id}/', json_body=changes)
+
+    status, _, body = await user_api.request('GET', f'/users/{user_id}/')
+    assert (status, body) == (401, {'detail': 'Токен отозван'})
+
+
+@pytest.mark.anyio
+async def test_update_user_email(api: ApiClient, dataset: dict) -> None:
+    user_id = dataset['users'][1]
+    user_api = await login(api, 'user1@example.com')
+    await user_api.call('GET', f'/users/{user_id}/')
+
+    body = await api.call('PUT', f'/users/{user_id}/', json_body={'email': 'renamed@example.com'})
+
+    # Ответ содержит сохранённую строку, а запись кэша по прежнему email удалена
+    stored = await User.get(id=user_id)
+    assert body['email'] == stored.email == 'renamed@example.com'
+    assert body['registration_date'] == stored.registration_date.isoformat().replace('+00:00', 'Z')
+    assert user_cache.get('user1@example.com') is None
+    status, _, _ = await user_api.request('GET', f'/users/{user_id}/')
+    assert status == 404
+
+
+@pytest.mark.anyio
+async def test_user_invalidated_event_evicts_cache(api: ApiClient, dataset: dict) -> None:
+    user_id = dataset['users'][1]
+    user_api = await login(api, 'user1@example.com')
+    await user_api.call('GET', f'/users/{user_id}/')
+    subscription = hub.subscribe()
+
+    # Пользователя изменил другой процесс: запись этого процесса удаляется только по событию
+    await User.filter(id=user_id).update(is_active=False, token_version=F('token_version') + 1)
+    status, _, _ = await user_api.request('GET', f'/users/{user_id}/')
+    assert status == 200
+    hub.dispatch([{'type': USER_INVALIDATED_EVENT, 'email': 'user1@example.com'}])
+    hub.unsubscribe(subscription)
+
+    status, _, body = await user_api.request('GET', f'/users/{user_id}/')
+    assert (status, body) == (401, {'detail': 'Токен отозван'})
+    # Служебные события подписчикам не рассылаются
+    assert subscription.queue.empty()